@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+from lexical_index import identifier_tokens, tokenize
+from metrics import counter, gauge
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "24")) * 3600
+ANSWER_CACHE_MAX_PER_COLLECTION = int(os.getenv("ANSWER_CACHE_MAX_PER_COLLECTION", "256"))
+# Вопросы короче этого числа значимых термов берутся из кэша только при точном совпадении:
+# у «кто истец?» и «кто ответчик?» эмбеддинги почти одинаковы
+ANSWER_CACHE_MIN_SEMANTIC_TERMS = int(os.getenv("ANSWER_CACHE_MIN_SEMANTIC_TERMS", "4"))
+
+ANSWER_CACHE_REQUESTS = counter("answer_cache_requests_total", "Обращения к кэшу ответов по результату")
+ANSWER_CACHE_INVALIDATIONS = counter("answer_cache_invalidations_total", "Сбросы кэша ответов при загрузке документов")
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r'[\s?!.]+', ' ', question.lower()).strip()
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    embedding: List[float]
+    answer: str
+    created_at: float = field(default_factory=time.time)
+
+
+class SemanticAnswerCache:
+    """Кэш готовых ответов по коллекциям: вопрос считается повтором, если косинусная
+    близость его эмбеддинга к сохраненному не ниже порога.
+
+    Короткие вопросы совпадают только точно, а у близких по смыслу должны совпадать
+    идентификаторы (номера дел и договоров, ИНН, суммы, даты). Каждый сброс коллекции
+    увеличивает ее поколение: ответ, начатый до сброса, в кэш уже не попадет.
+    """
+
+    def __init__(self, embed: Optional[Callable[[str], List[float]]] = None,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, ttl_seconds: float = ANSWER_CACHE_TTL,
+                 max_per_collection: int = ANSWER_CACHE_MAX_PER_COLLECTION) -> None:
+        self._embed = embed
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_per_collection = max_per_collection
+        self._entries: Dict[str, "OrderedDict[str, CachedAnswer]"] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        gauge("answer_cache_entries", "Ответов в кэше").set_function(
+            lambda: sum(len(entries) for entries in self._entries.values())
+        )
+
+    def embed(self, question: str) -> List[float]:
+        if self._embed is None:
+            from chroma_registry import get_registry
+            self._embed = get_registry().embedder.embed_query
+        return _unit(self._embed(question))
+
+    def generation(self, collection_name: str) -> int:
+        """Текущее поколение коллекции; его передают в store, если ответ готовится долго."""
+        with self._lock:
+            return self._generations.get(collection_name, 0)
+
+    def lookup(self, collection_name: str, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entries = self._entries.get(collection_name)
+            if not entries:
+                ANSWER_CACHE_REQUESTS.inc(result="miss")
+                return None
+            for stale_key in [k for k, e in entries.items() if now - e.created_at > self.ttl_seconds]:
+                del entries[stale_key]
+
+            # Точное совпадение нормализованного текста не требует эмбеддинга
+            exact = entries.get(key)
+            if exact is not None:
+                entries.move_to_end(key)
+                ANSWER_CACHE_REQUESTS.inc(result="hit")
+                logging.info(f"Кэш ответов: точное попадание для '{question}' в {collection_name}")
+                return exact.answer
+            if len(tokenize(question)) < ANSWER_CACHE_MIN_SEMANTIC_TERMS:
+                ANSWER_CACHE_REQUESTS.inc(result="miss")
+                return None
+            identifiers = identifier_tokens(question)
+            candidates = [(k, e) for k, e in entries.items() if identifier_tokens(e.question) == identifiers]
+
+        if not candidates:
+            ANSWER_CACHE_REQUESTS.inc(result="miss")
+            return None
+
+        embedding = self.embed(question)
+        best_key, best_score = None, -1.0
+        for entry_key, entry in candidates:
+            score = sum(a * b for a, b in zip(embedding, entry.embedding))
+            if score > best_score:
+                best_key, best_score = entry_key, score
+
+        if best_score < self.threshold:
+            ANSWER_CACHE_REQUESTS.inc(result="miss")
+            return None
+
+        with self._lock:
+            entries = self._entries.get(collection_name)
+            entry = entries.get(best_key) if entries else None
+            if entry is None:
+                ANSWER_CACHE_REQUESTS.inc(result="miss")
+                return None
+            entries.move_to_end(best_key)
+
+        ANSWER_CACHE_REQUESTS.inc(result="hit")
+        logging.info(
+            f"Кэш ответов: попадание для '{question}' ~ '{entry.question}' "
+            f"(близость {best_score:.3f}) в {collection_name}"
+        )
+        return entry.answer
+
+    def store(self, collection_name: str, question: str, answer: str, generation: Optional[int] = None) -> None:
+        """Сохраняет ответ; с generation - только если коллекция не сбрасывалась с тех пор."""
+        entry = CachedAnswer(question=question, embedding=self.embed(question), answer=answer)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(collection_name, 0):
+                logging.info(f"Кэш ответов: ответ на '{question}' не сохранен, коллекция {collection_name} "
+                             f"обновилась, пока он готовился")
+                return
+            entries = self._entries.setdefault(collection_name, OrderedDict())
+            entries[normalize_question(question)] = entry
+            entries.move_to_end(normalize_question(question))
+            while len(entries) > self.max_per_collection:
+                entries.popitem(last=False)
+
+    def invalidate(self, collection_name: str) -> None:
+        """Сбрасывает ответы коллекции: после загрузки новых документов они могли устареть."""
+        with self._lock:
+            self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+            dropped = self._entries.pop(collection_name, None)
+        if dropped:
+            ANSWER_CACHE_INVALIDATIONS.inc()
+            logging.info(f"Кэш ответов: сброшено {len(dropped)} ответов коллекции {collection_name}")
+
+    def stats(self) -> Dict[str, float]:
+        hits = ANSWER_CACHE_REQUESTS.value(result="hit")
+        misses = ANSWER_CACHE_REQUESTS.value(result="miss")
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+
+
+_cache: Optional[SemanticAnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache()
+        return _cache
@@ -0,0 +1,102 @@
+"""Точность и задержка определения типа ввода: правила против LLM.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_case_classifier          # только правила
+    python -m benchmarks.bench_case_classifier --llm    # плюс прежний вызов GigaChat
+"""
+import argparse
+import json
+import statistics
+import time
+
+from case_classifier import CaseType, LLM_FALLBACK_CONFIDENCE, classify, parse_case_type
+
+# (ввод, ожидаемый тип, ожидаемый нормализованный запрос)
+LABELED_INPUTS = [
+    ("7707083893", CaseType.INN, "7707083893"),
+    ("7736050003", CaseType.INN, "7736050003"),
+    (" 7702070139 ", CaseType.INN, "7702070139"),
+    ("ИНН 7707083893", CaseType.INN, "7707083893"),
+    ("500100732259", CaseType.INN, "500100732259"),
+    ("1027700132195", CaseType.OGRN, "1027700132195"),
+    ("ОГРН: 1027700132195", CaseType.OGRN, "1027700132195"),
+    ("304500116000157", CaseType.OGRN, "304500116000157"),
+    ("А40-312285", CaseType.CASE_NUMBER, "А40-312285"),
+    ("A40-312285", CaseType.CASE_NUMBER, "А40-312285"),
+    ("а40-123456/2023", CaseType.CASE_NUMBER, "А40-123456/2023"),
+    ("А40-123456/23", CaseType.CASE_NUMBER, "А40-123456/23"),
+    ("А56 - 98765 / 2022", CaseType.CASE_NUMBER, "А56-98765/2022"),
+    ("А40/123456", CaseType.CASE_NUMBER, "А40-123456"),
+    ("А41-1234/2021-12", CaseType.CASE_NUMBER, "А41-1234/2021-12"),
+    ("ООО «Ромашка»", CaseType.ORGANIZATION, "ООО «Ромашка»"),
+    ("ПАО Сбербанк", CaseType.ORGANIZATION, "ПАО Сбербанк"),
+    ('АО "Почта России"', CaseType.ORGANIZATION, 'АО "Почта России"'),
+    ("ИП Иванов Иван Иванович", CaseType.ORGANIZATION, "ИП Иванов Иван Иванович"),
+    ("Газпром нефть", CaseType.ORGANIZATION, "Газпром нефть"),
+]
+
+
+def run_rules(repeat: int) -> dict:
+    correct = 0
+    normalized_ok = 0
+    low_confidence = 0
+    for text, expected_type, expected_normalized in LABELED_INPUTS:
+        result = classify(text)
+        correct += result.case_type == expected_type
+        normalized_ok += result.normalized == expected_normalized
+        low_confidence += result.confidence < LLM_FALLBACK_CONFIDENCE
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text, _, _ in LABELED_INPUTS:
+            classify(text)
+    per_call = (time.perf_counter() - started) / (repeat * len(LABELED_INPUTS))
+
+    return {
+        "accuracy": correct / len(LABELED_INPUTS),
+        "normalized_accuracy": normalized_ok / len(LABELED_INPUTS),
+        "llm_fallbacks": low_confidence,
+        "latency_ms": per_call * 1000,
+    }
+
+
+def run_llm() -> dict:
+    from langchain_core.prompts import ChatPromptTemplate
+    from model import SudebChatModel
+
+    model = SudebChatModel()
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", "Твоя задача - определять, что пришло: ИНН, Организация или Номер дела. "
+                       "Выбери одно из этих трех значений и пришли это значение."),
+            ("user", "{user_input}")
+        ]
+    )
+    correct = 0
+    latencies = []
+    for text, expected_type, _ in LABELED_INPUTS:
+        started = time.perf_counter()
+        response = (prompt | model).invoke({"user_input": text})
+        latencies.append(time.perf_counter() - started)
+        correct += parse_case_type(response.content) == expected_type
+
+    return {
+        "accuracy": correct / len(LABELED_INPUTS),
+        "latency_ms": statistics.median(latencies) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm", action="store_true", help="Сравнить с классификацией через GigaChat")
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    result = {"samples": len(LABELED_INPUTS), "rules": run_rules(args.repeat)}
+    if args.llm:
+        result["llm"] = run_llm()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Пропускная способность бота при одновременных вопросах из разных чатов.
+
+Сравнивает прежнюю схему (синхронный граф в пуле потоков по умолчанию через
+run_in_executor) с асинхронным Graph.ainvoke. Задержки GigaChat и поиска
+имитируются, сеть и учетные данные не нужны.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_concurrency --llm-latency 1.0 --rag-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import graph as graph_module
+from graph import Graph
+
+
+class SleepyChatModel(BaseChatModel):
+    """Модель, которая отвечает через фиксированную задержку."""
+
+    latency: float = 1.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "sleepy"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="Стороны: истец и ответчик."))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+
+class _NoAnswerCache:
+    def lookup(self, collection_name, question):
+        return None
+
+    def store(self, collection_name, question, answer):
+        pass
+
+
+def _install_fakes(rag_latency: float) -> None:
+    async def fake_arag(user_prompt, collection_name=None):
+        await asyncio.sleep(rag_latency)
+        return "Документ 1: истец ООО «Ромашка», ответчик АО «Лютик»."
+
+    graph_module.arag = fake_arag
+    graph_module.get_answer_cache = lambda: _NoAnswerCache()
+
+
+async def run_async(graph: Graph, chats: int) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        graph.ainvoke(f"Вопрос {i}", existing_collection="bench", reset_state=True, mode="question") for i in range(chats)
+    ])
+    return time.perf_counter() - started
+
+
+async def run_executor(chats: int, llm_latency: float, rag_latency: float) -> float:
+    """Прежняя схема: каждый вопрос блокирует поток пула по умолчанию на все время ответа."""
+    def blocking_pipeline():
+        time.sleep(rag_latency)
+        time.sleep(llm_latency)
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    await asyncio.gather(*[loop.run_in_executor(None, blocking_pipeline) for _ in range(chats)])
+    return time.perf_counter() - started
+
+
+async def main_async(args) -> None:
+    _install_fakes(args.rag_latency)
+    graph = Graph(model=SleepyChatModel(latency=args.llm_latency))
+
+    results = []
+    for chats in args.chats:
+        async_s = await run_async(graph, chats)
+        executor_s = await run_executor(chats, args.llm_latency, args.rag_latency)
+        results.append({
+            "chats": chats,
+            "executor_s": round(executor_s, 3),
+            "executor_answers_per_s": round(chats / executor_s, 2),
+            "async_s": round(async_s, 3),
+            "async_answers_per_s": round(chats / async_s, 2),
+        })
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--rag-latency", type=float, default=0.5)
+    parser.add_argument("--chats", type=int, nargs="+", default=[1, 4, 16, 64])
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
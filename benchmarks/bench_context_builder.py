@@ -0,0 +1,92 @@
+"""Размер контекста RAG в токенах: прежняя склейка чанков против build_context.
+
+Офлайн-режим режет PDF дела теми же функциями, что и индексация, и имитирует
+выдачу MultiQuery: несколько якорных чанков вместе с соседями (переформулировки
+вопроса часто находят соседние, перекрывающиеся чанки).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_context_builder --pdf-dir pdfs/<коллекция>
+    python -m benchmarks.bench_context_builder --collection <коллекция> --question "Кто истец?"
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import time
+from typing import List
+
+from langchain_core.documents import Document
+
+from context_builder import RAG_CONTEXT_TOKENS, build_context, count_tokens
+
+
+def legacy_context(rel_docs: List[Document]) -> str:
+    """Сборка контекста до build_context: все чанки подряд и схлопывание пробелов."""
+    context = ""
+    for i, doc in enumerate(rel_docs):
+        context += f"Документ {i+1}:\n{doc.page_content}\n\n"
+    return re.sub(r'\s+', ' ', context.rstrip()).strip()
+
+
+def simulated_results(chunks: List[Document], rng: random.Random, max_docs: int) -> List[Document]:
+    by_source = {}
+    for chunk in chunks:
+        by_source.setdefault(chunk.metadata["source"], []).append(chunk)
+    results = []
+    while len(results) < max_docs:
+        source_chunks = by_source[rng.choice(list(by_source))]
+        anchor = rng.randrange(len(source_chunks))
+        for neighbour in source_chunks[anchor:anchor + rng.randint(1, 3)]:
+            if neighbour not in results:
+                results.append(neighbour)
+    rng.shuffle(results)
+    return results[:max_docs]
+
+
+def compare(results: List[List[Document]], max_tokens: int) -> dict:
+    legacy_tokens, new_tokens, build_ms = [], [], []
+    for docs in results:
+        legacy_tokens.append(count_tokens(legacy_context(docs)))
+        started = time.perf_counter()
+        context = build_context(docs, max_tokens=max_tokens)
+        build_ms.append((time.perf_counter() - started) * 1000)
+        new_tokens.append(count_tokens(context))
+    return {
+        "queries": len(results),
+        "legacy_tokens_mean": statistics.mean(legacy_tokens),
+        "context_tokens_mean": statistics.mean(new_tokens),
+        "reduction": 1 - sum(new_tokens) / sum(legacy_tokens),
+        "build_ms_median": statistics.median(build_ms),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", help="Папка с PDF дела для офлайн-сравнения")
+    parser.add_argument("--collection", help="Коллекция Chroma для сравнения на реальной выдаче")
+    parser.add_argument("--question", action="append", default=[], help="Вопрос (можно несколько раз)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--max-docs", type=int, default=10)
+    parser.add_argument("--max-tokens", type=int, default=RAG_CONTEXT_TOKENS)
+    args = parser.parse_args()
+
+    if args.collection:
+        from retrieval import get_engine
+
+        questions = args.question or ["Кто истец и ответчик?", "Какое решение вынесла первая инстанция?"]
+        results = [get_engine().retrieve(args.collection, question) for question in questions]
+    elif args.pdf_dir:
+        from pdf_chunker import list_pdfs, iter_docs
+
+        chunks = list(iter_docs(list_pdfs(args.pdf_dir)))
+        rng = random.Random(0)
+        results = [simulated_results(chunks, rng, args.max_docs) for _ in range(args.queries)]
+    else:
+        parser.error("нужен --pdf-dir или --collection")
+
+    print(json.dumps(compare(results, args.max_tokens), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
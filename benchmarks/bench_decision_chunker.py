@@ -0,0 +1,122 @@
+"""Нарезка судебных актов: окнами по страницам (pages) против разделов (sections).
+
+Для каждого режима: число чанков на документ, средний размер чанка в токенах,
+сколько чанков покрывают резолютивную часть (их приходится доставать поиском,
+чтобы восстановить вердикт) и время нарезки в одном процессе. Отдельно -
+стоимость создания сплиттера через from_tiktoken_encoder против общего.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_decision_chunker --pdf-dir pdfs/<коллекция>
+    python -m benchmarks.bench_decision_chunker --synthetic small medium large
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.synthetic_pdfs import CORPUS_SIZES, generate_corpus
+from decision_splitter import RESOLUTION, find_sections
+from pdf_chunker import _plan_tasks, _split_page_range, get_splitter, list_pdfs
+from tokenizer import count_tokens
+
+
+def _page_texts(filepath: str) -> List[str]:
+    import fitz
+    from pdf_chunker import normalize_whitespace
+
+    with fitz.open(filepath) as pdf:
+        return [normalize_whitespace(page.get_text()) for page in pdf]
+
+
+def resolution_chunks(filepath: str, chunks, chunker: str) -> int:
+    """Сколько чанков пересекается с резолютивной частью документа."""
+    pages = _page_texts(filepath)
+    page_starts, offset = [], 0
+    for text in pages:
+        page_starts.append(offset)
+        offset += len(text) + 1
+    starts = dict(find_sections("\n".join(pages)))
+    if RESOLUTION not in starts:
+        return 0
+    resolution_start = starts[RESOLUTION]
+
+    count = 0
+    for chunk in chunks:
+        start = chunk.metadata["start_index"]
+        if chunker == "pages":
+            start += page_starts[chunk.metadata["page"]]
+        if start + len(chunk.page_content) > resolution_start:
+            count += 1
+    return count
+
+
+def measure(filepaths: List[str], chunker: str, repeat: int) -> Dict:
+    tasks = {task[0]: task for task in _plan_tasks(filepaths, 10 ** 6)}
+    timings, chunks_by_file = [], {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for filepath, task in tasks.items():
+            chunks_by_file[filepath] = _split_page_range(*task, chunker=chunker)
+        timings.append(time.perf_counter() - started)
+
+    chunks = [chunk for file_chunks in chunks_by_file.values() for chunk in file_chunks]
+    return {
+        "chunks": len(chunks),
+        "chunks_per_document": round(len(chunks) / len(filepaths), 2),
+        "tokens_mean": round(statistics.mean(count_tokens(chunk.page_content) for chunk in chunks), 1),
+        "resolution_chunks_per_document": round(statistics.mean(
+            resolution_chunks(filepath, file_chunks, chunker) for filepath, file_chunks in chunks_by_file.items()
+        ), 2),
+        "seconds": round(min(timings), 4),
+    }
+
+
+def splitter_cost(repeat: int) -> Dict:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    get_splitter()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        RecursiveCharacterTextSplitter.from_tiktoken_encoder(model_name="gpt-4", chunk_size=512, chunk_overlap=100)
+    uncached = (time.perf_counter() - started) / repeat
+    started = time.perf_counter()
+    for _ in range(repeat):
+        get_splitter()
+    cached = (time.perf_counter() - started) / repeat
+    return {"from_tiktoken_encoder_ms": round(uncached * 1000, 3), "cached_ms": round(cached * 1000, 5)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", help="Папка с PDF судебных актов")
+    parser.add_argument("--synthetic", nargs="+", choices=list(CORPUS_SIZES), help="Сгенерировать корпус")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.pdf_dir:
+        filepaths = list_pdfs(args.pdf_dir)
+    elif args.synthetic:
+        corpus = generate_corpus(tempfile.mkdtemp(prefix="sudeb_chunker_"), args.synthetic)
+        filepaths = [path for item in corpus.values() for path in item["files"]]
+    else:
+        parser.error("нужен --pdf-dir или --synthetic")
+
+    pages = measure(filepaths, "pages", args.repeat)
+    sections = measure(filepaths, "sections", args.repeat)
+    result = {
+        "documents": len(filepaths),
+        "pdf_mb": round(sum(os.path.getsize(path) for path in filepaths) / 2 ** 20, 2),
+        "pages": pages,
+        "sections": sections,
+        "chunk_reduction": round(1 - sections["chunks"] / pages["chunks"], 3) if pages["chunks"] else None,
+        "speedup": round(pages["seconds"] / sections["seconds"], 2) if sections["seconds"] else None,
+        "splitter": splitter_cost(args.repeat),
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Эмбеддинги при загрузке коллекции: последовательные батчи по 50 против EmbeddingPipeline.
+
+Прежняя схема - батч из 50 чанков за батчем с линейной паузой после ошибки;
+новая - батчи по токенам, несколько в полете с AIMD и отдельная запись в Chroma.
+API эмбеддингов имитирует FakeEmbeddings с задержкой и квотой одновременных
+запросов (сверх квоты - 429), коллекция - запись в память, чтобы замерять
+только эмбеддинги. Печатается число чанков в секунду и число ответов 429.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_embedding_pipeline
+    python -m benchmarks.bench_embedding_pipeline --chunks 2000 --quota 4 --max-in-flight 4 8 16
+"""
+import argparse
+import json
+import logging
+import time
+from typing import Dict, List
+
+from langchain_core.documents import Document
+
+from tests.fakes import FakeEmbeddings
+from benchmarks.synthetic_pdfs import decision_text
+from embedding_pipeline import AimdLimiter, EmbeddingPipeline, is_throttling
+from vec_database import generate_id
+
+CHUNK_CHARS = 1500
+
+
+class _MemoryCollection:
+    def __init__(self) -> None:
+        self.rows: Dict[str, List[float]] = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.rows.update(zip(ids, embeddings))
+
+
+class _MemoryStore:
+    def __init__(self) -> None:
+        self._collection = _MemoryCollection()
+
+
+def make_chunks(count: int) -> List[Document]:
+    docs: List[Document] = []
+    case = 0
+    while len(docs) < count:
+        text = decision_text(f"А40-{100000 + case}/2023", case % 3, pages=10, seed=case)
+        for start in range(0, len(text), CHUNK_CHARS):
+            docs.append(Document(page_content=text[start:start + CHUNK_CHARS],
+                                 metadata={"source": f"case_{case}.pdf", "start_index": start}))
+        case += 1
+    return docs[:count]
+
+
+def sequential(docs: List[Document], embeddings: FakeEmbeddings) -> Dict:
+    """Прежний цикл load_to_collection: батч 50, до трех попыток с паузой 1.5 * попытка."""
+    started = time.perf_counter()
+    throttled = 0
+    for i in range(0, len(docs), 50):
+        texts = [doc.page_content for doc in docs[i:i + 50]]
+        for attempt in range(1, 4):
+            try:
+                embeddings.embed_documents(texts)
+                break
+            except Exception as e:
+                throttled += int(is_throttling(e))
+                if attempt == 3:
+                    raise
+                time.sleep(1.5 * attempt)
+    seconds = time.perf_counter() - started
+    return {"seconds": round(seconds, 2), "chunks_per_second": round(len(docs) / seconds, 1), "throttled": throttled}
+
+
+def pipelined(docs: List[Document], embeddings: FakeEmbeddings, max_in_flight: int) -> Dict:
+    pipeline = EmbeddingPipeline(embeddings, limiter=AimdLimiter(start=2, maximum=max_in_flight))
+    report = pipeline.add(_MemoryStore(), [generate_id(doc.page_content) for doc in docs], docs)
+    return {
+        "seconds": round(report.seconds, 2),
+        "chunks_per_second": round(report.chunks_per_second, 1),
+        "batches": report.batches,
+        "throttled": report.throttled,
+        "final_in_flight": round(report.final_in_flight, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Задержка вызова API, секунды")
+    parser.add_argument("--per-text-latency", type=float, default=0.004, help="Добавка на каждый текст батча")
+    parser.add_argument("--quota", type=int, default=6, help="Одновременных запросов до ответа 429")
+    parser.add_argument("--max-in-flight", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    docs = make_chunks(args.chunks)
+
+    def api() -> FakeEmbeddings:
+        return FakeEmbeddings(latency=args.latency, per_text_latency=args.per_text_latency, max_concurrent=args.quota)
+
+    result = {"chunks": len(docs), "quota": args.quota, "sequential_50": sequential(docs, api())}
+    for max_in_flight in args.max_in_flight:
+        result[f"pipeline_max_{max_in_flight}"] = pipelined(docs, api(), max_in_flight)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Задержка лексического индекса на синтетической коллекции.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_lexical_index --chunks 20000
+"""
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+
+from lexical_index import LexicalIndex, is_identifier_query
+
+WORDS = (
+    "решение постановление определение суда истец ответчик взыскать задолженность неустойка договор "
+    "поставки апелляционный кассационный жалоба удовлетворить отказать сумма основного долга проценты"
+).split()
+
+IDENTIFIER_QUERIES = ["А40-{n}/2023", "ИНН {inn}", "A40-{n}/2023", "{inn}"]
+TEXT_QUERIES = ["Какая неустойка взыскана по договору поставки?", "Чем закончилась апелляционная жалоба?"]
+
+
+def make_chunk(n: int, rng: random.Random) -> str:
+    words = " ".join(rng.choices(WORDS, k=80))
+    return f"{words} по делу № А40-{n}/2023 ИНН {7700000000 + n} сумма {rng.randint(1, 10**7)},00 руб."
+
+
+def timed(index: LexicalIndex, queries, k: int) -> float:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, k)
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    ids = [str(n) for n in range(args.chunks)]
+    texts = [make_chunk(n, rng) for n in range(args.chunks)]
+
+    index = LexicalIndex("bench", tempfile.mkdtemp())
+    started = time.perf_counter()
+    index.add(ids, texts)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index.save()
+    save_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    LexicalIndex("bench", index.path.rsplit("/", 1)[0])
+    load_seconds = time.perf_counter() - started
+
+    numbers = [rng.randrange(args.chunks) for _ in range(args.queries)]
+    identifier_queries = [
+        rng.choice(IDENTIFIER_QUERIES).format(n=n, inn=7700000000 + n) for n in numbers
+    ]
+    assert all(is_identifier_query(query) for query in identifier_queries)
+    hits = sum(
+        index.search(query, 1)[0][0] == str(n) for query, n in zip(identifier_queries, numbers)
+    )
+
+    print(json.dumps({
+        "chunks": args.chunks,
+        "build_s": build_seconds,
+        "save_s": save_seconds,
+        "load_s": load_seconds,
+        "identifier_query_ms": timed(index, identifier_queries, args.k),
+        "identifier_top1_accuracy": hits / len(identifier_queries),
+        "text_query_ms": timed(index, TEXT_QUERIES * 10, args.k),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Сравнение последовательной и параллельной загрузки PDF.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_pdf_chunker pdfs/<коллекция>
+"""
+import argparse
+import json
+import time
+
+from pdf_chunker import iter_docs, list_pdfs, load_docs_serial
+
+
+def _signature(docs):
+    return sorted((d.metadata["source"], d.metadata["page"], d.page_content) for d in docs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_dir", help="Папка с PDF-файлами")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    filepaths = list_pdfs(args.pdf_dir)
+
+    # Прогрев: создание пула процессов и загрузка кодировки не должны попадать в замер
+    parallel_docs = list(iter_docs(filepaths))
+    serial_docs = load_docs_serial(args.pdf_dir)
+
+    serial_times, parallel_times = [], []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        serial_docs = load_docs_serial(args.pdf_dir)
+        serial_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        parallel_docs = list(iter_docs(filepaths))
+        parallel_times.append(time.perf_counter() - started)
+
+    result = {
+        "files": len(filepaths),
+        "chunks_serial": len(serial_docs),
+        "chunks_parallel": len(parallel_docs),
+        "same_output": _signature(serial_docs) == _signature(parallel_docs),
+        "serial_s": min(serial_times),
+        "parallel_s": min(parallel_times),
+        "speedup": min(serial_times) / min(parallel_times) if min(parallel_times) else None,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Полный конвейер загрузки дела и ответа на вопрос без GigaChat и ras.arbitr.ru.
+
+Поиск и PDF отдает локальная заглушка сайта (benchmarks.fake_arbitr), судебные
+акты генерируются (benchmarks.synthetic_pdfs), GigaChat и эмбеддинги заменены
+детерминированными моделями с задержкой (tests.fakes). Все состояние
+(Chroma, кэши, манифесты) живет во временной папке.
+
+Замеряются стадии download_by_query, load_docs, load_to_collection, rag и
+Graph._generate; каждый повтор загружает дело в новую коллекцию с холодными
+кэшами. Результат пишется в JSON с хешем коммита; --compare печатает отношение
+медиан к прошлому прогону.
+
+По умолчанию поиск идет без браузера (выдачу разбирает заглушка), с --browser -
+настоящим Chromium из пула по ARBITR_URL заглушки.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --sizes small large --repeats 5 --llm-latency 1.0
+    python -m benchmarks.bench_pipeline --compare benchmarks/results/pipeline_<коммит>.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List
+
+from benchmarks.synthetic_pdfs import CORPUS_SIZES, generate_corpus
+
+STAGES = ["download_by_query", "load_docs", "load_to_collection", "rag", "_generate"]
+QUESTIONS = [
+    "Кто истец и ответчик по делу?",
+    "Какую сумму требовал взыскать истец?",
+    "Какое решение вынесла апелляция?",
+    "Чем закончилось рассмотрение в кассации?",
+]
+RESULTS_DIR = os.path.join("benchmarks", "results")
+
+
+def configure_environment(workdir: str) -> None:
+    """Перенаправляет все персистентное состояние во workdir. Вызывается до импорта модулей бота."""
+    os.environ.update({
+        "CHROMA_PERSIST_DIR": os.path.join(workdir, "chroma_db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache", "embeddings.sqlite"),
+        "SEARCH_CACHE_PATH": os.path.join(workdir, "search_cache.sqlite"),
+        # Каждый повтор ищет заново, а не берет выдачу из кэша
+        "SEARCH_CACHE_TTL_HOURS": "0",
+        "INGEST_MANIFEST_DIR": os.path.join(workdir, "manifests"),
+        "LEXICAL_INDEX_DIR": os.path.join(workdir, "lexical"),
+        "NEAR_DUP_DB": os.path.join(workdir, "near_dup.sqlite"),
+        "CHUNK_STORE_DB": os.path.join(workdir, "chunk_store.sqlite"),
+        "INGEST_QUEUE_PATH": os.path.join(workdir, "ingest_queue.json"),
+        "CHECKPOINT_SQLITE_PATH": os.path.join(workdir, "checkpoints.sqlite"),
+    })
+
+
+def git_commit() -> Dict[str, object]:
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], capture_output=True, text=True).stdout.strip()
+
+    return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    return {
+        "runs": len(timings),
+        "median_s": round(statistics.median(timings), 4),
+        "mean_s": round(statistics.mean(timings), 4),
+        "min_s": round(min(timings), 4),
+        "max_s": round(max(timings), 4),
+    }
+
+
+@contextmanager
+def driverless_search(server) -> Iterator[None]:
+    """Поиск без Chromium: пул браузеров и _search подменяются разбором выдачи заглушки,
+    PDF скачиваются настоящим pdf_downloader.
+    """
+    import parser as parser_module
+    from pdf_downloader import build_session
+
+    class NoDriverPool:
+        @contextmanager
+        def driver(self, download_dir=None):
+            yield None
+
+    patched = {
+        "get_driver_pool": lambda: NoDriverPool(),
+        "_search": lambda driver, query, choose_case, date_from, date_to: server.search(query),
+        "session_from_driver": lambda driver: build_session(),
+    }
+    original = {name: getattr(parser_module, name) for name in patched}
+    for name, value in patched.items():
+        setattr(parser_module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in original.items():
+            setattr(parser_module, name, value)
+
+
+def reset_chunk_store() -> None:
+    """Повтор загружает те же PDF: без очистки общего хранилища чанки нашлись бы в нем и не эмбеддились."""
+    from chroma_registry import get_registry
+    from chunk_store import CHUNK_STORE_COLLECTION
+
+    registry = get_registry()
+    registry.forget(CHUNK_STORE_COLLECTION)
+    if CHUNK_STORE_COLLECTION in [getattr(c, "name", c) for c in registry.client.list_collections()]:
+        registry.client.delete_collection(CHUNK_STORE_COLLECTION)
+
+
+def run(args, workdir: str) -> Dict:
+    from langchain_core.messages import HumanMessage
+
+    import parser as parser_module
+    from benchmarks.fake_arbitr import FakeArbitrServer
+    from tests.fakes import FakeChatModel, FakeEmbeddings, install_fakes
+    from graph import Graph
+    from pdf_chunker import load_docs
+    from rag_module import rag
+    from vec_database import load_to_collection
+
+    corpus = generate_corpus(os.path.join(workdir, "corpus", f"seed{args.seed}"), args.sizes, seed=args.seed)
+    chat = FakeChatModel(latency=args.llm_latency)
+    graph = Graph(model=chat)
+    questions = args.question or QUESTIONS
+
+    server = FakeArbitrServer(
+        {item["case_number"]: item["files"] for item in corpus.values()},
+        search_latency=args.search_latency, pdf_latency=args.pdf_latency, bandwidth=args.bandwidth,
+    ).start()
+    parser_module.ARBITR_URL = server.url
+
+    results = {}
+    try:
+        for size, item in corpus.items():
+            timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+            chunks = 0
+            embeddings = FakeEmbeddings(latency=args.embed_latency, per_text_latency=args.embed_per_text)
+
+            def timed(stage: str, function: Callable, *function_args):
+                started = time.perf_counter()
+                value = function(*function_args)
+                timings[stage].append(time.perf_counter() - started)
+                return value
+
+            for repeat in range(args.repeats):
+                run_id = f"{size}_{repeat}"
+                install_fakes(chat, embeddings, model_id=f"fake:{embeddings.dimensions}:{run_id}")
+                reset_chunk_store()
+                collection_name = f"bench_{run_id}"
+                output_folder = os.path.join(workdir, "pdfs", run_id)
+
+                if args.browser:
+                    timed("download_by_query", parser_module.download_by_query, item["case_number"], output_folder)
+                else:
+                    with driverless_search(server):
+                        timed("download_by_query", parser_module.download_by_query, item["case_number"], output_folder)
+                docs = timed("load_docs", load_docs, output_folder)
+                chunks = len(docs)
+                timed("load_to_collection", load_to_collection, docs, collection_name)
+
+                for question in questions:
+                    context = timed("rag", rag, question, collection_name)
+                    state = {
+                        "messages": [HumanMessage(content=question)],
+                        "rag_answer": context,
+                        "collection_name": collection_name,
+                    }
+                    timed("_generate", lambda: asyncio.run(graph._generate(state)))
+
+            results[size] = {
+                "pages_per_document": item["pages"],
+                "documents": len(item["files"]),
+                "pdf_bytes": sum(os.path.getsize(path) for path in item["files"]),
+                "chunks": chunks,
+                "embedding_calls": embeddings.calls,
+                "embedded_texts": embeddings.texts,
+                "stages": {stage: summarize(values) for stage, values in timings.items() if values},
+            }
+    finally:
+        server.stop()
+    return results
+
+
+def compare(current: Dict, baseline: Dict) -> Dict:
+    """Отношение медиан текущего прогона к базовому по размерам и стадиям (меньше 1 - быстрее)."""
+    ratios = {}
+    for size, result in current["results"].items():
+        base = baseline["results"].get(size)
+        if not base:
+            continue
+        ratios[size] = {
+            stage: round(stats["median_s"] / base["stages"][stage]["median_s"], 3)
+            for stage, stats in result["stages"].items()
+            if stage in base["stages"] and base["stages"][stage]["median_s"] > 0
+        }
+    return {"baseline_commit": baseline.get("commit"), "median_ratio": ratios}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(CORPUS_SIZES), default=list(CORPUS_SIZES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--question", action="append", default=[], help="Вопрос (можно несколько раз)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Задержка одного вызова эмбеддингов")
+    parser.add_argument("--embed-per-text", type=float, default=0.001, help="Добавка задержки на текст батча")
+    parser.add_argument("--search-latency", type=float, default=0.5)
+    parser.add_argument("--pdf-latency", type=float, default=0.05)
+    parser.add_argument("--bandwidth", type=float, help="Скорость отдачи PDF, байт/с")
+    parser.add_argument("--browser", action="store_true", help="Искать настоящим Chromium из пула")
+    parser.add_argument("--workdir", help="Папка для состояния и корпуса (по умолчанию временная)")
+    parser.add_argument("--output", help="Куда записать JSON (по умолчанию benchmarks/results/pipeline_<коммит>.json)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sudeb_bench_")
+    configure_environment(workdir)
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    revision = git_commit()
+    report = {
+        **revision,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {name: value for name, value in vars(args).items()
+                   if name not in ("output", "compare", "verbose", "workdir")},
+        "results": run(args, workdir),
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline_{revision['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Результаты записаны в {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
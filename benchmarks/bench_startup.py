@@ -0,0 +1,87 @@
+"""Холодный старт бота и накладные расходы графа на запрос.
+
+Импорт bot.py замеряется в отдельном процессе через `python -X importtime`:
+общее время, самые дорогие модули и какие тяжелые зависимости загружаются сразу.
+Накладные расходы на запрос - подготовка запуска графа (компиляция только в первый раз).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --module graph --top 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Модули, которые не должны загружаться при старте бота
+HEAVY_MODULES = [
+    "selenium", "fitz", "tiktoken", "chromadb", "langchain_chroma", "langchain_community",
+    "langchain_text_splitters", "langchain_gigachat",
+]
+
+
+def importtime(module: str, top: int) -> dict:
+    code = (
+        f"import json, sys; import {module}; "
+        f"print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))"
+    )
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    modules = []
+    for line in completed.stderr.splitlines():
+        # import time:  self [us] | cumulative | imported package
+        fields = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        modules.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+
+    root = next((cumulative for name, _, cumulative in modules if name == module), None)
+    slowest = sorted(modules, key=lambda item: item[2], reverse=True)[:top]
+    return {
+        "module": module,
+        "process_wall_s": round(wall, 3),
+        "import_cumulative_s": round(root / 1e6, 3) if root is not None else None,
+        "heavy_loaded": json.loads(completed.stdout.strip().splitlines()[-1]),
+        "slowest": [{"module": name, "cumulative_ms": round(cumulative / 1000, 1)} for name, _, cumulative in slowest],
+    }
+
+
+async def request_overhead(requests: int) -> dict:
+    from graph import Graph
+
+    graph = Graph(model=object())
+    timings = []
+    for i in range(requests):
+        started = time.perf_counter()
+        _, _, config = await graph._prepare_run(f"Вопрос {i}", True, "bench", None, "question")
+        await graph._finish_run(config, True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "first_request_ms": round(timings[0], 2),
+        "next_requests_median_ms": round(statistics.median(timings[1:]), 3) if len(timings) > 1 else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="bot")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    result = {"import": importtime(args.module, args.top)}
+    result["graph_overhead"] = asyncio.run(request_overhead(args.requests))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
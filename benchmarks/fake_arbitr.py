@@ -0,0 +1,178 @@
+"""Локальная заглушка ras.arbitr.ru: форма поиска, выдача и отдача PDF.
+
+Разметка повторяет селекторы parser._search, поэтому с ARBITR_URL, указывающим
+на заглушку, по ней можно пройти настоящим браузером. Без браузера выдачу
+разбирает FakeArbitrServer.search - в том же формате, что и parser._search.
+"""
+import html
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlparse
+from urllib.request import urlopen
+
+SEARCH_FORM = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Картотека арбитражных дел</title></head><body>
+<form id="b-form-submit" action="/Ras/Search" method="get">
+  <input type="text" name="query" placeholder="например, А50-5568/08">
+  <textarea name="side" placeholder="название, ИНН или ОГРН"></textarea>
+  <div id="sug-dates">
+    <input type="text" name="from" placeholder="дд.мм.гггг">
+    <input type="text" name="to" placeholder="дд.мм.гггг">
+  </div>
+  <button type="submit">Найти</button>
+</form>
+{results}
+</body></html>"""
+
+RESULT_ITEM = """<li class="b-document-item">
+  <div class="case"><a class="b-a-blue" href="/Card/{case_quoted}">{case}</a></div>
+  <a class="b-a-blue js-popupDocumentShow" href="{href}">{title}</a>
+  <div class="summary">{summary}</div>
+</li>"""
+
+_ITEM_RE = re.compile(r'<li class="b-document-item">(.*?)</li>', re.DOTALL)
+_CASE_RE = re.compile(r'<div class="case"><a class="b-a-blue"[^>]*>(.*?)</a>')
+_PDF_RE = re.compile(r'<a class="b-a-blue js-popupDocumentShow" href="([^"]+)">(.*?)</a>')
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _normalize(query: str) -> str:
+    # Как search_cache.normalize_query: регистр, пробелы, латинская «A» в номере дела
+    normalized = re.sub(r'\s+', ' ', query.strip()).upper()
+    return re.sub(r'^A(?=\d)', 'А', normalized)
+
+
+class FakeArbitrServer:
+    """HTTP-сервер в фоновом потоке. cases - {номер дела: [пути к PDF]}.
+
+    search_latency - задержка выдачи поиска, pdf_latency - задержка до первого байта PDF,
+    bandwidth - скорость отдачи PDF в байтах в секунду (None - без ограничения).
+    """
+
+    def __init__(self, cases: Dict[str, List[str]], search_latency: float = 0.0,
+                 pdf_latency: float = 0.0, bandwidth: Optional[float] = None) -> None:
+        self.cases = {_normalize(case_number): (case_number, paths) for case_number, paths in cases.items()}
+        self.search_latency = search_latency
+        self.pdf_latency = pdf_latency
+        self.bandwidth = bandwidth
+        # Постоянные идентификаторы файлов для ссылок на PDF
+        self._keys = {path: str(key) for key, path in
+                      enumerate(path for _, paths in self.cases.values() for path in paths)}
+        self._files = {key: path for path, key in self._keys.items()}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeArbitrServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                server._handle(self)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-arbitr", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeArbitrServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _matches(self, query: str) -> List[str]:
+        query = _normalize(query)
+        if not query:
+            return []
+        matched = []
+        for normalized, (_, paths) in self.cases.items():
+            if normalized.startswith(query):
+                matched.extend(paths)
+        return matched
+
+    def _results_html(self, query: str) -> str:
+        paths = self._matches(query)
+        if not paths:
+            return '<ul class="b-document-list"></ul><div class="b-no-results">Ничего не найдено</div>'
+        items = []
+        for path in paths:
+            case_number = next(case for case, case_paths in self.cases.values() if path in case_paths)
+            name = os.path.basename(path)
+            items.append(RESULT_ITEM.format(
+                case_quoted=quote(case_number, safe=""),
+                case=html.escape(case_number),
+                href=f"/Document/Pdf/{self._keys[path]}/{quote(name)}",
+                title=html.escape(os.path.splitext(name)[0]),
+                summary=html.escape(f"Дело {case_number}, документ {name}"),
+            ))
+        return '<ul class="b-document-list">' + "\n".join(items) + "</ul>"
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> None:
+        parsed = urlparse(request.path)
+        if parsed.path == "/":
+            self._send(request, SEARCH_FORM.format(results="").encode("utf-8"), "text/html; charset=utf-8")
+        elif parsed.path == "/Ras/Search":
+            time.sleep(self.search_latency)
+            params = parse_qs(parsed.query)
+            query = (params.get("query") or params.get("side") or [""])[0]
+            page = SEARCH_FORM.format(results=self._results_html(query))
+            self._send(request, page.encode("utf-8"), "text/html; charset=utf-8")
+        elif parsed.path.startswith("/Document/Pdf/"):
+            path = self._files.get(parsed.path.split("/")[3])
+            if path is None:
+                request.send_error(404)
+                return
+            time.sleep(self.pdf_latency)
+            with open(path, "rb") as f:
+                self._send(request, f.read(), "application/pdf")
+        else:
+            request.send_error(404)
+
+    def _send(self, request: BaseHTTPRequestHandler, body: bytes, content_type: str) -> None:
+        request.send_response(200)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        block = 64 * 1024
+        for offset in range(0, len(body), block):
+            request.wfile.write(body[offset:offset + block])
+            if self.bandwidth:
+                time.sleep(min(block, len(body) - offset) / self.bandwidth)
+
+    def search(self, query: str) -> List[Dict]:
+        """Выдача поиска без браузера: те же поля документов, что возвращает parser._search."""
+        with urlopen(f"{self.url}Ras/Search?{urlencode({'query': query})}") as response:
+            page = response.read().decode("utf-8")
+
+        documents = []
+        for item in _ITEM_RE.findall(page):
+            href, title = _PDF_RE.search(item).groups()
+            case_match = _CASE_RE.search(item)
+            pdf_url = self.url.rstrip("/") + href
+            documents.append({
+                "download_url": pdf_url + "?download=true",
+                "file_name": unquote(os.path.basename(urlparse(pdf_url).path)),
+                "case_number": html.unescape(case_match.group(1)) if case_match else "",
+                "title": html.unescape(title),
+                "summary": html.unescape(_TAG_RE.sub(" ", item)).strip(),
+            })
+        return documents
@@ -0,0 +1,126 @@
+"""Синтетические судебные акты в PDF для офлайн-бенчмарков.
+
+Каждое дело - решение первой инстанции, постановления апелляции и кассации
+с реквизитами, которые разбирает decision_metadata. Размер корпуса задается
+числом страниц в документе; текст детерминирован при фиксированном seed.
+"""
+import os
+import random
+from typing import Dict, List
+
+# Имя размера: страниц в каждом судебном акте дела
+CORPUS_SIZES = {"small": 2, "medium": 10, "large": 40}
+# Символов текста на страницу: с запасом помещается в A4 шрифтом 10pt
+PAGE_CHARS = 2800
+
+_COURTS = [
+    ("Арбитражный суд города Москвы", "Р Е Ш Е Н И Е", "РЕШИЛ:"),
+    ("Девятый арбитражный апелляционный суд", "П О С Т А Н О В Л Е Н И Е", "ПОСТАНОВИЛ:"),
+    ("Арбитражный суд Московского округа", "П О С Т А Н О В Л Е Н И Е", "ПОСТАНОВИЛ:"),
+]
+_MONTHS = ["января", "февраля", "марта", "апреля", "мая", "июня",
+           "июля", "августа", "сентября", "октября", "ноября", "декабря"]
+_COMPANIES = ["ООО «Ромашка»", "АО «Лютик»", "ООО «СтройИнвест»", "ПАО «Северный порт»",
+              "ООО «ТехноСервис»", "АО «Транслогистик»", "ООО «Агроторг»", "ИП Петров П.П."]
+_SENTENCES = [
+    "Между истцом и ответчиком заключен договор поставки № {n} от {day} {month} {year} года.",
+    "Истец в полном объеме исполнил обязательства по договору, что подтверждается универсальными передаточными документами.",
+    "Ответчик оплату поставленного товара в установленный договором срок не произвел.",
+    "Претензия истца от {day} {month} {year} года оставлена ответчиком без ответа и удовлетворения.",
+    "Согласно статье 309 Гражданского кодекса Российской Федерации обязательства должны исполняться надлежащим образом.",
+    "В соответствии со статьей 330 ГК РФ истцом начислена неустойка в размере {amount} руб.",
+    "Ответчик заявил о применении статьи 333 ГК РФ и снижении неустойки ввиду ее несоразмерности.",
+    "Суд, исследовав представленные доказательства в порядке статьи 71 АПК РФ, пришел к следующим выводам.",
+    "Доводы ответчика о ненадлежащем качестве товара не подтверждены допустимыми доказательствами.",
+    "Расчет задолженности проверен судом и признан арифметически верным.",
+    "Расходы по уплате государственной пошлины в размере {amount} руб. относятся на ответчика.",
+    "Оснований для отмены или изменения обжалуемого судебного акта не имеется.",
+]
+
+
+def _date(rng: random.Random, year: int) -> str:
+    return f"{rng.randint(1, 28)} {rng.choice(_MONTHS)} {year}"
+
+
+def _amount(rng: random.Random) -> str:
+    return f"{rng.randint(10, 999)} {rng.randint(0, 999):03d} {rng.randint(0, 999):03d}"
+
+
+def decision_text(case_number: str, instance: int, pages: int, seed: int) -> str:
+    """Текст судебного акта: шапка, преамбула со сторонами и суммой, мотивировка, резолюция."""
+    rng = random.Random(f"{seed}:{case_number}:{instance}")
+    court, title, verdict = _COURTS[instance]
+    year = 2022 + instance
+    plaintiff, defendant = rng.sample(_COMPANIES, 2)
+    header = (
+        f"{court.upper()}\n{title}\n"
+        f"г. Москва\n{_date(rng, year)} года Дело № {case_number}\n"
+        f"Полный текст изготовлен {_date(rng, year)} года\n"
+        f"{court} в составе судьи Иванова И.И., рассмотрев в открытом судебном заседании дело "
+        f"по иску {plaintiff} (ИНН 77{rng.randint(10 ** 7, 10 ** 8 - 1)}) к {defendant} "
+        f"(ИНН 50{rng.randint(10 ** 7, 10 ** 8 - 1)}) о взыскании {_amount(rng)} руб. задолженности,\n"
+        f"УСТАНОВИЛ:\n"
+    )
+
+    paragraphs: List[str] = []
+    size = len(header)
+    while size < pages * PAGE_CHARS - 400:
+        paragraph = " ".join(
+            rng.choice(_SENTENCES).format(
+                n=rng.randint(1, 999), day=rng.randint(1, 28), month=rng.choice(_MONTHS),
+                year=year - 1, amount=_amount(rng)
+            )
+            for _ in range(rng.randint(3, 6))
+        )
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 1
+    resolution = f"{verdict}\nИск удовлетворить. Взыскать с {defendant} в пользу {plaintiff} {_amount(rng)} руб."
+    return header + "\n".join(paragraphs) + "\n" + resolution
+
+
+def _paginate(text: str) -> List[str]:
+    pages, current = [], ""
+    for line in text.split("\n"):
+        if current and len(current) + len(line) + 1 > PAGE_CHARS:
+            pages.append(current)
+            current = ""
+        current += line + "\n"
+    pages.append(current)
+    return pages
+
+
+def write_pdf(text: str, path: str) -> None:
+    import fitz
+
+    with fitz.open() as pdf:
+        for page_text in _paginate(text):
+            page = pdf.new_page(width=595, height=842)
+            # Base14-шрифт с кириллической кодировкой: отдельный файл шрифта не нужен
+            page.insert_textbox(fitz.Rect(50, 50, 545, 800), page_text, fontsize=10,
+                                fontname="helv", encoding=fitz.TEXT_ENCODING_CYRILLIC)
+        pdf.save(path)
+
+
+def case_file_name(case_number: str, instance: int) -> str:
+    return f"{case_number.replace('/', '_')}_{instance + 1}.pdf"
+
+
+def generate_corpus(root: str, sizes: List[str], seed: int = 0) -> Dict[str, Dict]:
+    """Генерирует по делу на каждый размер; уже созданные файлы переиспользуются.
+
+    Возвращает {размер: {"case_number", "pages", "files": [пути]}}.
+    """
+    corpus = {}
+    for number, size in enumerate(sizes, start=1):
+        pages = CORPUS_SIZES[size]
+        case_number = f"А40-{100000 + number}/2023"
+        case_dir = os.path.join(root, size)
+        os.makedirs(case_dir, exist_ok=True)
+        files = []
+        for instance in range(len(_COURTS)):
+            path = os.path.join(case_dir, case_file_name(case_number, instance))
+            if not os.path.exists(path):
+                write_pdf(decision_text(case_number, instance, pages, seed), path)
+            files.append(path)
+        corpus[size] = {"case_number": case_number, "pages": pages, "files": files}
+    return corpus
@@ -1,19 +1,31 @@
+import time
+
+# Отсчет холодного старта: до импорта тяжелых модулей
+PROCESS_STARTED = time.perf_counter()
+
 import asyncio
 import logging
 import os
+import threading
 from dataclasses import dataclass, field
 from typing import Optional, Dict
 
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.constants import ParseMode
 from telegram.ext import (
     Application, ApplicationBuilder, CommandHandler, ContextTypes,
-    CallbackQueryHandler, MessageHandler, filters
+    CallbackQueryHandler, MessageHandler, TypeHandler, filters
 )
 
 from graph import Graph
+from tg_stream import TelegramStatusMessage, TelegramStreamWriter
+from driver_pool import get_driver_pool
 from vec_database import get_collection_for_case
+from ingest_queue import IngestJob, get_ingest_scheduler
+from executors import run_blocking
+from metrics import METRICS_PORT, gauge, start_metrics_server
+from tracing import set_correlation_id
+from warmup import WARMUP, warm_up
 import html
 
 load_dotenv()
@@ -48,6 +60,17 @@ def format_html(text: str) -> str:
     safe = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", safe)
     return safe
 
+def describe_ingest_progress(job: IngestJob) -> Optional[str]:
+    if job.status == "queued" and job.position:
+        return f"Загрузка дела в очереди, перед вами заданий: {job.position}. Подождите…"
+    if job.stage == "search":
+        return "Ищу и скачиваю документы дела…"
+    if job.stage == "index" and job.total:
+        return f"Индексирую документы: {job.done} из {job.total}…"
+    if job.stage == "index":
+        return "Индексирую документы…"
+    return None
+
 def get_loaded_choice_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton(text="Да, уже загружены", callback_data="loaded_yes")],
@@ -113,10 +136,23 @@ async def on_loaded_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         state.awaiting_loaded_choice = False
         await query.edit_message_text(text="Загружаю материалы дела, подождите…")
 
-        loop = asyncio.get_running_loop()
+        # Прогресс приходит на каждый проиндексированный файл: правки сообщения прореживаются
+        status = TelegramStatusMessage(query.message)
+
+        async def report_progress(job: IngestJob) -> None:
+            text = describe_ingest_progress(job)
+            if text:
+                await status.update(text)
+
         try:
             logging.info(f"Бот: Запускаю загрузку материалов для дела '{state.case_number}'")
-            result = await loop.run_in_executor(None, lambda: service.graph.invoke(state.case_number))
+            # Только загрузка: граф в режиме ingest не выполняет RAG и генерацию.
+            # Одинаковые дела из разных чатов загружаются одним заданием очереди
+            try:
+                result = await service.graph.aingest(state.case_number, on_progress=report_progress)
+            finally:
+                await status.finish()
+            state.collection_name = result.get("collection_name") or state.collection_name
             state.ready = True
             logging.info(f"Бот: Материалы успешно загружены для чата {chat_id}")
             await query.message.reply_text("Материалы загружены. Теперь вы можете задавать вопросы по делу.")
@@ -174,23 +210,24 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     if state.ready:
         logging.info(f"Бот: Обрабатываю вопрос '{text}' для коллекции '{state.collection_name}' (чат {chat_id})")
+        started = time.perf_counter()
         search_message = await update.message.reply_text("Обрабатываю ваш запрос...")
         
         try:
-            # Для последующих запросов используем Graph с уже загруженной коллекцией
-            result = await asyncio.get_running_loop().run_in_executor(
-                None, 
-                lambda: service.graph.invoke(text, existing_collection=state.collection_name)
-            )
-            answer = result["messages"][-1].content
+            # Для последующих запросов используем Graph с уже загруженной коллекцией.
+            # Ответ показывается по мере генерации в сообщении «Обрабатываю ваш запрос...»
+            writer = TelegramStreamWriter(search_message, format_html, started_at=started)
+            answer = ""
+            async for kind, chunk in service.graph.astream_answer(
+                text, existing_collection=state.collection_name, chat_id=chat_id, mode="question"
+            ):
+                if kind == "token":
+                    await writer.push(chunk)
+                else:
+                    answer = chunk
             logging.info(f"Бот: Получен ответ длиной {len(answer)} символов для чата {chat_id}")
             
-            try:
-                await search_message.delete()
-            except Exception as delete_error:
-                logging.warning(f"Не удалось удалить сообщение о поиске: {delete_error}")
-            
-            await update.message.reply_text(format_html(answer)[:4000], parse_mode=ParseMode.HTML)
+            await writer.finish(answer)
         except Exception as e:
             logging.exception("Ошибка анализа дела")
             logging.error(f"Бот: Ошибка при обработке вопроса '{text}' для чата {chat_id}: {e}")
@@ -215,11 +252,41 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+FIRST_UPDATE_SECONDS = gauge("bot_first_update_seconds", "Время от старта процесса до первого обработанного апдейта")
+
+
+async def on_startup(app: Application) -> None:
+    # Загрузки, прерванные перезапуском, продолжаются в фоне
+    await get_ingest_scheduler().resume()
+    if WARMUP:
+        # Прогрев идет в фоне и не задерживает прием апдейтов
+        app.create_task(run_blocking("io", warm_up))
+    logging.info(f"Бот: готов к приему апдейтов через {time.perf_counter() - PROCESS_STARTED:.2f}s после старта")
+
+
+_first_update_seen = False
+
+
+async def bind_correlation_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Каждый апдейт обрабатывается в своей задаче: id виден во всех span этого апдейта,
+    # включая узлы графа, потоки run_blocking и задания очереди загрузки, созданные из него
+    set_correlation_id(f"u{update.update_id}")
+
+
+async def log_first_update(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    global _first_update_seen
+    if not _first_update_seen:
+        _first_update_seen = True
+        seconds = time.perf_counter() - PROCESS_STARTED
+        FIRST_UPDATE_SECONDS.set(seconds)
+        logging.info(f"Бот: первый апдейт получен через {seconds:.2f}s после старта")
+
 def build_app(token: str) -> Application:
     return (
         ApplicationBuilder()
         .token(token)
         .concurrent_updates(True)
+        .post_init(on_startup)
         .build()
     )
 
@@ -231,6 +298,15 @@ def run() -> None:
 
     app = build_app(token)
 
+    # Браузеры для парсинга стартуют в фоне, пока бот подключается к Telegram
+    if os.getenv("DRIVER_POOL_PRESTART", "1") == "1":
+        threading.Thread(target=get_driver_pool().prestart, daemon=True).start()
+
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
+    app.add_handler(TypeHandler(Update, bind_correlation_id), group=-2)
+    app.add_handler(TypeHandler(Update, log_first_update), group=-1)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("change", change))
     app.add_handler(CommandHandler("help", help_cmd))
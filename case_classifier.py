@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+import re
+
+# Ниже этой уверенности тип ввода уточняется у LLM
+LLM_FALLBACK_CONFIDENCE = 0.7
+
+
+class CaseType(str, Enum):
+    INN = "ИНН"
+    OGRN = "ОГРН"
+    ORGANIZATION = "Организация"
+    CASE_NUMBER = "Номер дела"
+
+
+@dataclass(frozen=True)
+class Classification:
+    case_type: CaseType
+    normalized: str
+    confidence: float
+
+
+_INN_10_WEIGHTS = (2, 4, 10, 3, 5, 9, 4, 6, 8)
+_INN_12_WEIGHTS_1 = (7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+_INN_12_WEIGHTS_2 = (3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+
+# А40-123456/2023, A40-123456/23, А40-123456/2023-12, А40/123456
+_CASE_NUMBER_RE = re.compile(
+    r'^[АA]\s*(\d{1,3})\s*[-–—/]\s*(\d{1,8})(?:\s*/\s*(\d{2}|\d{4}))?(?:\s*[-–—]\s*(\d{1,4}))?$'
+)
+_ORG_MARKERS_RE = re.compile(
+    r'\b(ООО|ОАО|ЗАО|ПАО|АО|НАО|ИП|ГУП|МУП|ФГУП|АНО|НКО|ТСЖ|СНТ|ОБЩЕСТВО|КОМПАНИЯ|ПРЕДПРИЯТИЕ|'
+    r'УЧРЕЖДЕНИЕ|КОРПОРАЦИЯ|ФОНД|БАНК|ГРУППА)\b'
+)
+
+
+def _checksum(digits: str, weights) -> int:
+    return sum(int(d) * w for d, w in zip(digits, weights)) % 11 % 10
+
+
+def is_valid_inn(value: str) -> bool:
+    if not value.isdigit():
+        return False
+    if len(value) == 10:
+        return _checksum(value, _INN_10_WEIGHTS) == int(value[9])
+    if len(value) == 12:
+        return (_checksum(value, _INN_12_WEIGHTS_1) == int(value[10])
+                and _checksum(value, _INN_12_WEIGHTS_2) == int(value[11]))
+    return False
+
+
+def is_valid_ogrn(value: str) -> bool:
+    """ОГРН (13 цифр) и ОГРНИП (15 цифр) с контрольным разрядом."""
+    if not value.isdigit():
+        return False
+    if len(value) == 13:
+        return int(value[:12]) % 11 % 10 == int(value[12])
+    if len(value) == 15:
+        return int(value[:14]) % 13 % 10 == int(value[14])
+    return False
+
+
+def normalize_case_number(value: str) -> Optional[str]:
+    """Приводит номер дела к виду «А40-123456/2023» (кириллическая «А»)."""
+    match = _CASE_NUMBER_RE.match(value.strip().upper())
+    if not match:
+        return None
+    court, number, year, suffix = match.groups()
+    normalized = f"А{court}-{number}"
+    if year:
+        normalized += f"/{year}"
+    if suffix:
+        normalized += f"-{suffix}"
+    return normalized
+
+
+def classify(text: str) -> Classification:
+    """Определяет тип ввода правилами, без обращения к LLM."""
+    original = re.sub(r'\s+', ' ', text.strip())
+    value = original.upper()
+    # Префиксы вида «ИНН 7707083893» / «ОГРН: ...» не влияют на тип
+    value = re.sub(r'^(ИНН|ОГРН|ОГРНИП)\s*:?\s*', '', value)
+
+    digits = re.sub(r'[\s-]', '', value)
+    if digits.isdigit():
+        if len(digits) in (10, 12) and is_valid_inn(digits):
+            return Classification(CaseType.INN, digits, 1.0)
+        if len(digits) in (13, 15) and is_valid_ogrn(digits):
+            return Classification(CaseType.OGRN, digits, 1.0)
+        # Цифры без верной контрольной суммы - опечатка или не ИНН/ОГРН: решает LLM
+        return Classification(CaseType.ORGANIZATION, digits, 0.3)
+
+    case_number = normalize_case_number(value)
+    if case_number:
+        return Classification(CaseType.CASE_NUMBER, case_number, 1.0)
+
+    if _ORG_MARKERS_RE.search(value.replace('«', ' ').replace('»', ' ').replace('"', ' ')):
+        return Classification(CaseType.ORGANIZATION, original, 0.9)
+
+    # Произвольный текст: скорее всего название без организационно-правовой формы
+    return Classification(CaseType.ORGANIZATION, original, 0.5)
+
+
+def parse_case_type(text: str) -> Optional[CaseType]:
+    """Строго сопоставляет ответ LLM одному из значений CaseType."""
+    answer = re.sub(r'[^\w\s]', ' ', text).strip().lower()
+    answer = re.sub(r'\s+', ' ', answer)
+    for case_type in CaseType:
+        if answer == case_type.value.lower():
+            return case_type
+    matched = [case_type for case_type in CaseType if case_type.value.lower() in answer]
+    if len(matched) == 1:
+        return matched[0]
+    return None
@@ -0,0 +1,225 @@
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import MemorySaver
+from collections import OrderedDict
+from typing import Optional
+import logging
+import os
+import threading
+import time
+
+from metrics import gauge
+
+CHECKPOINTER = os.getenv("CHECKPOINTER", "memory")
+CHECKPOINT_SQLITE_PATH = os.getenv("CHECKPOINT_SQLITE_PATH", "./chroma_db/checkpoints.sqlite")
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL_HOURS", "72")) * 3600
+CHECKPOINT_MAX_PER_THREAD = int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "10"))
+
+CHECKPOINT_THREADS = gauge("checkpoint_threads", "Потоки (чаты) в хранилище состояний графа")
+CHECKPOINT_ROWS = gauge("checkpoint_rows", "Чекпоинты в хранилище состояний графа")
+CHECKPOINT_BYTES = gauge("checkpoint_bytes", "Приблизительный объем сериализованных чекпоинтов")
+
+
+class BoundedMemorySaver(MemorySaver):
+    """MemorySaver с ограничениями: не больше max_threads потоков (LRU), потоки старше
+    ttl_seconds удаляются, в каждом потоке хранятся только последние чекпоинты.
+    """
+
+    def __init__(self, max_threads: int = CHECKPOINT_MAX_THREADS, ttl_seconds: float = CHECKPOINT_TTL,
+                 max_checkpoints_per_thread: int = CHECKPOINT_MAX_PER_THREAD) -> None:
+        super().__init__()
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.max_checkpoints_per_thread = max(2, max_checkpoints_per_thread)
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.RLock()
+
+        CHECKPOINT_THREADS.set_function(lambda: len(self.storage))
+        CHECKPOINT_ROWS.set_function(
+            lambda: sum(len(checkpoints) for namespaces in list(self.storage.values())
+                        for checkpoints in list(namespaces.values()))
+        )
+        CHECKPOINT_BYTES.set_function(self.approx_bytes)
+
+    def _touch(self, thread_id: str) -> None:
+        self._last_used[thread_id] = time.monotonic()
+        self._last_used.move_to_end(thread_id)
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"].get("thread_id")
+        if thread_id is not None:
+            with self._lock:
+                if thread_id in self._last_used:
+                    self._touch(thread_id)
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._touch(thread_id)
+            self._prune_checkpoints(thread_id)
+            self._evict_threads(keep=thread_id)
+        return result
+
+    def _prune_checkpoints(self, thread_id: str) -> None:
+        """Оставляет в потоке только последние чекпоинты (id чекпоинтов монотонны)."""
+        limit = self.max_checkpoints_per_thread
+        for checkpoint_ns, checkpoints in self.storage.get(thread_id, {}).items():
+            # Чистим пачкой, когда набралось вдвое больше лимита, чтобы не делать это на каждом шаге
+            if len(checkpoints) <= limit * 2:
+                continue
+            ordered = sorted(checkpoints)
+            for checkpoint_id in ordered[:-limit]:
+                del checkpoints[checkpoint_id]
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._prune_blobs(thread_id, checkpoint_ns, checkpoints)
+
+    def _prune_blobs(self, thread_id: str, checkpoint_ns: str, checkpoints) -> None:
+        # В новых версиях langgraph значения каналов хранятся отдельно от чекпоинтов
+        blobs = getattr(self, "blobs", None)
+        if not blobs:
+            return
+        referenced = set()
+        for saved in checkpoints.values():
+            checkpoint = self.serde.loads_typed(saved[0])
+            referenced.update(checkpoint.get("channel_versions", {}).items())
+        for key in [k for k in blobs if k[0] == thread_id and k[1] == checkpoint_ns]:
+            if (key[2], key[3]) not in referenced:
+                del blobs[key]
+
+    def _evict_threads(self, keep: Optional[str] = None) -> None:
+        now = time.monotonic()
+        expired = [t for t, used in self._last_used.items() if now - used > self.ttl_seconds and t != keep]
+        for thread_id in expired:
+            self.drop_thread(thread_id)
+        while len(self._last_used) > self.max_threads:
+            thread_id = next(iter(self._last_used))
+            if thread_id == keep:
+                break
+            self.drop_thread(thread_id)
+
+    def drop_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._last_used.pop(thread_id, None)
+            self.storage.pop(thread_id, None)
+            for key in [k for k in self.writes if k[0] == thread_id]:
+                del self.writes[key]
+            blobs = getattr(self, "blobs", None)
+            if blobs:
+                for key in [k for k in blobs if k[0] == thread_id]:
+                    del blobs[key]
+
+    def approx_bytes(self) -> int:
+        total = 0
+        for namespaces in list(self.storage.values()):
+            for checkpoints in list(namespaces.values()):
+                for saved in list(checkpoints.values()):
+                    total += len(saved[0][1]) + len(saved[1][1])
+        for saved in list(getattr(self, "blobs", {}).values()):
+            total += len(saved[1])
+        return total
+
+
+class MemoryCheckpointBackend:
+    """Чекпоинты в памяти процесса с LRU/TTL-вытеснением."""
+
+    def __init__(self) -> None:
+        self._saver = BoundedMemorySaver()
+
+    async def saver(self) -> BaseCheckpointSaver:
+        return self._saver
+
+    async def delete_thread(self, thread_id: str) -> None:
+        self._saver.drop_thread(thread_id)
+
+    async def after_run(self, thread_id: str) -> None:
+        pass
+
+
+class SqliteCheckpointBackend:
+    """Чекпоинты в SQLite (нужен пакет langgraph-checkpoint-sqlite).
+
+    После каждого запуска в потоке остаются только последние чекпоинты,
+    потоки без активности дольше TTL удаляются.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_SQLITE_PATH, ttl_seconds: float = CHECKPOINT_TTL,
+                 max_checkpoints_per_thread: int = CHECKPOINT_MAX_PER_THREAD) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_checkpoints_per_thread = max(2, max_checkpoints_per_thread)
+        self._saver = None
+        self._last_sweep = 0.0
+        self._rows = 0
+        self._threads = 0
+        CHECKPOINT_ROWS.set_function(lambda: self._rows)
+        CHECKPOINT_THREADS.set_function(lambda: self._threads)
+        CHECKPOINT_BYTES.set_function(lambda: os.path.getsize(self.path) if os.path.exists(self.path) else 0)
+
+    async def saver(self) -> BaseCheckpointSaver:
+        if self._saver is None:
+            import aiosqlite
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = await aiosqlite.connect(self.path)
+            saver = AsyncSqliteSaver(conn)
+            await saver.setup()
+            await conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, last_used REAL NOT NULL)"
+            )
+            await conn.commit()
+            self._saver = saver
+        return self._saver
+
+    async def delete_thread(self, thread_id: str) -> None:
+        conn = (await self.saver()).conn
+        await conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        await conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        await conn.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+        await conn.commit()
+
+    async def after_run(self, thread_id: str) -> None:
+        conn = (await self.saver()).conn
+        limit = self.max_checkpoints_per_thread
+        keep = (
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? "
+            "ORDER BY checkpoint_id DESC LIMIT ?"
+        )
+        await conn.execute(
+            f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id NOT IN ({keep})",
+            (thread_id, thread_id, limit)
+        )
+        await conn.execute(
+            f"DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN ({keep})",
+            (thread_id, thread_id, limit)
+        )
+        await conn.execute(
+            "INSERT OR REPLACE INTO thread_activity (thread_id, last_used) VALUES (?, ?)",
+            (thread_id, time.time())
+        )
+
+        now = time.time()
+        if now - self._last_sweep > 600:
+            self._last_sweep = now
+            cursor = await conn.execute(
+                "SELECT thread_id FROM thread_activity WHERE last_used < ?", (now - self.ttl_seconds,)
+            )
+            expired = [row[0] for row in await cursor.fetchall()]
+            for expired_thread in expired:
+                await conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (expired_thread,))
+                await conn.execute("DELETE FROM writes WHERE thread_id = ?", (expired_thread,))
+                await conn.execute("DELETE FROM thread_activity WHERE thread_id = ?", (expired_thread,))
+            if expired:
+                logging.info(f"Чекпоинты: удалено {len(expired)} неактивных потоков")
+
+        await conn.commit()
+        cursor = await conn.execute("SELECT COUNT(*), COUNT(DISTINCT thread_id) FROM checkpoints")
+        self._rows, self._threads = await cursor.fetchone()
+
+
+def create_checkpoint_backend():
+    if CHECKPOINTER == "sqlite":
+        return SqliteCheckpointBackend()
+    return MemoryCheckpointBackend()
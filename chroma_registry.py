@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
+import logging
+import os
+import threading
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+    from embedding_cache import CachedEmbeddings
+
+CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
+CHROMA_MAX_OPEN_COLLECTIONS = int(os.getenv("CHROMA_MAX_OPEN_COLLECTIONS", "32"))
+
+
+class ChromaRegistry:
+    """Один персистентный клиент Chroma и один эмбеддер на процесс.
+
+    Обертки коллекций кэшируются; давно не использованные вытесняются (LRU).
+    Реестр общий для загрузки документов и для ответов на вопросы.
+    """
+
+    def __init__(self, persist_directory: str = CHROMA_PERSIST_DIR,
+                 max_open_collections: int = CHROMA_MAX_OPEN_COLLECTIONS) -> None:
+        self.persist_directory = persist_directory
+        self.max_open_collections = max_open_collections
+        self._lock = threading.RLock()
+        self._client = None
+        self._embedder: Optional["CachedEmbeddings"] = None
+        self._handles: "OrderedDict[str, Chroma]" = OrderedDict()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import chromadb
+                os.makedirs(self.persist_directory, exist_ok=True)
+                self._client = chromadb.PersistentClient(path=self.persist_directory)
+            return self._client
+
+    @property
+    def embedder(self) -> "CachedEmbeddings":
+        with self._lock:
+            if self._embedder is None:
+                # Клиент GigaChat импортируется при первом эмбеддинге, а не при старте бота
+                from embedder import embedder
+                self._embedder = embedder()
+            return self._embedder
+
+    def get(self, collection_name: str) -> "Chroma":
+        """Возвращает обертку коллекции, создавая ее при первом обращении."""
+        from langchain_chroma import Chroma
+
+        with self._lock:
+            handle = self._handles.get(collection_name)
+            if handle is not None:
+                self._handles.move_to_end(collection_name)
+                return handle
+
+            handle = Chroma(
+                client=self.client,
+                collection_name=collection_name,
+                embedding_function=self.embedder
+            )
+            self._handles[collection_name] = handle
+            while len(self._handles) > self.max_open_collections:
+                evicted, _ = self._handles.popitem(last=False)
+                logging.info(f'Реестр Chroma: коллекция {evicted} вытеснена из кэша')
+            return handle
+
+    def count(self, collection_name: str) -> int:
+        """Число чанков в коллекции без выгрузки самих документов."""
+        return self.get(collection_name)._collection.count()
+
+    def forget(self, collection_name: str) -> None:
+        with self._lock:
+            self._handles.pop(collection_name, None)
+
+    def open_collections(self) -> int:
+        with self._lock:
+            return len(self._handles)
+
+
+_registry: Optional[ChromaRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ChromaRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ChromaRegistry()
+        return _registry
@@ -0,0 +1,169 @@
+from typing import Dict, Iterable, List, Optional, Set
+import logging
+import os
+import sqlite3
+import threading
+
+# Общая коллекция Chroma: каждый чанк хранится и эмбеддится один раз, сколько бы дел на него ни ссылалось
+CHUNK_STORE_COLLECTION = os.getenv("CHUNK_STORE_COLLECTION", "chunks")
+# Таблица принадлежности чанков представлениям (делу, ИНН, организации) и чанков разобранных PDF
+CHUNK_STORE_DB = os.getenv("CHUNK_STORE_DB", "./chroma_db/chunk_store.sqlite")
+
+
+def view_key(view: str) -> str:
+    """Ключ метаданных чанка, отмечающий его принадлежность представлению.
+
+    Имена представлений - это нормализованные имена прежних коллекций
+    (normalize_collection_name), поэтому годятся как ключ без экранирования.
+    """
+    return f"view_{view}"
+
+
+def view_filter(view: str, where: Optional[Dict] = None) -> Dict:
+    """Фильтр Chroma: чанки представления, при необходимости с дополнительным условием."""
+    membership = {view_key(view): True}
+    if not where:
+        return membership
+    return {"$and": [membership, where]}
+
+
+class ChunkStore:
+    """Представления поверх общей коллекции чанков.
+
+    В SQLite хранится источник истины о принадлежности (view, chunk_id) - по нему
+    считаются размеры представлений и находятся чанки, на которые не ссылается
+    никто; в метаданных Chroma та же принадлежность продублирована флагом
+    view_key, чтобы поиск ограничивался представлением фильтром where.
+
+    Здесь же запоминаются чанки уже разобранных PDF (по sha256 файла и режиму
+    нарезки), чтобы акт, скачанный для другого дела, не разбирался повторно.
+    """
+
+    def __init__(self, path: str = CHUNK_STORE_DB) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Изменения принадлежности и удаление осиротевших чанков из Chroma идут под этим замком,
+        # чтобы параллельная загрузка другого дела не сослалась на удаляемый чанк
+        self.lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS members (
+                view TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (view, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_members_chunk ON members(chunk_id);
+            CREATE TABLE IF NOT EXISTS file_chunks (
+                file_key TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (file_key, position)
+            );
+            CREATE INDEX IF NOT EXISTS idx_file_chunks_chunk ON file_chunks(chunk_id);
+            """
+        )
+        self._conn.commit()
+
+    def add_members(self, view: str, chunk_ids: Iterable[str]) -> List[str]:
+        """Добавляет чанки в представление; возвращает те, которых в нем еще не было."""
+        ids = list(dict.fromkeys(chunk_ids))
+        if not ids:
+            return []
+        with self.lock:
+            present = self._present(view, ids)
+            added = [chunk_id for chunk_id in ids if chunk_id not in present]
+            self._conn.executemany("INSERT OR IGNORE INTO members (view, chunk_id) VALUES (?, ?)",
+                                   [(view, chunk_id) for chunk_id in added])
+            self._conn.commit()
+        return added
+
+    def remove_members(self, view: str, chunk_ids: Iterable[str]) -> List[str]:
+        """Убирает чанки из представления; возвращает те, на которые больше не ссылается ни одно."""
+        ids = list(dict.fromkeys(chunk_ids))
+        if not ids:
+            return []
+        with self.lock:
+            self._conn.executemany("DELETE FROM members WHERE view = ? AND chunk_id = ?",
+                                   [(view, chunk_id) for chunk_id in ids])
+            self._conn.commit()
+            referenced = self._referenced(ids)
+        return [chunk_id for chunk_id in ids if chunk_id not in referenced]
+
+    def _present(self, view: str, ids: List[str]) -> Set[str]:
+        found: Set[str] = set()
+        # SQLite ограничивает число параметров в запросе, поэтому идем пачками
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT chunk_id FROM members WHERE view = ? AND chunk_id IN ({placeholders})", [view] + part
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    def _referenced(self, ids: List[str]) -> Set[str]:
+        found: Set[str] = set()
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT DISTINCT chunk_id FROM members WHERE chunk_id IN ({placeholders})", part
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    def count(self, view: str) -> int:
+        with self.lock:
+            return self._conn.execute("SELECT COUNT(*) FROM members WHERE view = ?", (view,)).fetchone()[0]
+
+    def views(self) -> Dict[str, int]:
+        """Все представления с числом чанков в каждом."""
+        with self.lock:
+            rows = self._conn.execute("SELECT view, COUNT(*) FROM members GROUP BY view").fetchall()
+        return dict(rows)
+
+    def file_chunks(self, file_key: str) -> Optional[List[str]]:
+        """Чанки ранее разобранного файла в исходном порядке или None, если файл не встречался."""
+        with self.lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM file_chunks WHERE file_key = ? ORDER BY position", (file_key,)
+            ).fetchall()
+        return [row[0] for row in rows] or None
+
+    def record_file(self, file_key: str, chunk_ids: List[str]) -> None:
+        with self.lock:
+            self._conn.execute("DELETE FROM file_chunks WHERE file_key = ?", (file_key,))
+            self._conn.executemany(
+                "INSERT INTO file_chunks (file_key, position, chunk_id) VALUES (?, ?, ?)",
+                [(file_key, position, chunk_id) for position, chunk_id in enumerate(chunk_ids)]
+            )
+            self._conn.commit()
+
+    def forget_chunks(self, chunk_ids: Iterable[str]) -> None:
+        """Забывает разобранные файлы, часть чанков которых удалена из коллекции: их придется разобрать заново."""
+        ids = list(chunk_ids)
+        with self.lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                self._conn.execute(
+                    f"DELETE FROM file_chunks WHERE file_key IN "
+                    f"(SELECT file_key FROM file_chunks WHERE chunk_id IN ({placeholders}))", part
+                )
+            self._conn.commit()
+        if ids:
+            logging.info(f'Хранилище чанков: забыты разобранные файлы с {len(ids)} удаленными чанками')
+
+
+_store: Optional[ChunkStore] = None
+_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChunkStore()
+        return _store
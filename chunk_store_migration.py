@@ -0,0 +1,130 @@
+"""Перенос коллекций Chroma «по делу» в общее хранилище чанков.
+
+Каждая прежняя коллекция (дело, ИНН, ОГРН, организация) становится
+представлением с тем же именем: чанки копируются в общую коллекцию вместе с
+готовыми эмбеддингами (GigaChat не вызывается), повторяющиеся между
+коллекциями чанки хранятся один раз. Манифесты и лексические индексы
+прежних коллекций остаются в силе: id чанков не меняются.
+
+Запуск из корня репозитория:
+    python -m chunk_store_migration              # перенести, старые коллекции оставить
+    python -m chunk_store_migration --drop       # перенести и удалить старые коллекции
+"""
+from typing import Dict, List, Optional, Set
+import argparse
+import json
+import logging
+import os
+
+from chroma_registry import get_registry
+from chunk_store import CHUNK_STORE_COLLECTION, get_chunk_store, view_key
+from near_duplicates import get_near_duplicate_index
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def legacy_collections(client) -> List[str]:
+    """Имена коллекций Chroma, кроме общей: до chromadb 0.6 list_collections возвращает объекты."""
+    names = [getattr(collection, "name", collection) for collection in client.list_collections()]
+    return sorted(name for name in names if name != CHUNK_STORE_COLLECTION)
+
+
+def migrate_collection(name: str, page_size: int = 500, seen: Optional[Set[str]] = None) -> Dict[str, int]:
+    """Копирует чанки коллекции name в общее хранилище и делает ее представлением.
+
+    Чанки, уже перенесенные из другой коллекции, только получают флаг представления.
+    В seen, если передано, добавляются id всех чанков коллекции.
+    """
+    registry = get_registry()
+    store = get_chunk_store()
+    source = registry.client.get_collection(name)
+    target = registry.get(CHUNK_STORE_COLLECTION)._collection
+    near_duplicates = get_near_duplicate_index(name)
+    flag = view_key(name)
+
+    copied, shared, offset = 0, 0, 0
+    while True:
+        page = source.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+        ids = page["ids"]
+        if not ids:
+            break
+        offset += len(ids)
+        if seen is not None:
+            seen.update(ids)
+        with store.lock:
+            existing = set(target.get(ids=ids, include=[])["ids"])
+            fresh = [i for i, id_ in enumerate(ids) if id_ not in existing]
+            if fresh:
+                target.upsert(
+                    ids=[ids[i] for i in fresh],
+                    embeddings=[page["embeddings"][i] for i in fresh],
+                    documents=[page["documents"][i] for i in fresh],
+                    metadatas=[dict(page["metadatas"][i] or {}, **{flag: True}) for i in fresh],
+                )
+            reused = [id_ for id_ in ids if id_ in existing]
+            if reused:
+                target.update(ids=reused, metadatas=[{flag: True}] * len(reused))
+            store.add_members(name, ids)
+            near_duplicates.add(ids, page["documents"])
+        copied += len(fresh)
+        shared += len(reused)
+    logging.info(f'Перенос {name}: скопировано {copied} чанков, {shared} уже были в хранилище')
+    return {"chunks": copied + shared, "copied": copied, "shared": shared}
+
+
+def migrate(drop: bool = False, page_size: int = 500) -> Dict:
+    """Переносит все коллекции; с drop удаляет те, что перенесены полностью. Возвращает отчет с размерами на диске."""
+    registry = get_registry()
+    store = get_chunk_store()
+    disk_before = dir_size(registry.persist_directory)
+
+    collections: Dict[str, Dict[str, int]] = {}
+    dropped = []
+    seen: Set[str] = set()
+    for name in legacy_collections(registry.client):
+        stats = migrate_collection(name, page_size, seen)
+        collections[name] = stats
+        if drop:
+            if store.count(name) < stats["chunks"]:
+                logging.warning(f'Перенос {name}: в представлении меньше чанков, чем в коллекции, коллекция оставлена')
+                continue
+            registry.forget(name)
+            registry.client.delete_collection(name)
+            dropped.append(name)
+
+    stored = registry.get(CHUNK_STORE_COLLECTION)._collection
+    unique_chunks = len(seen)
+    total_chunks = sum(stats["chunks"] for stats in collections.values())
+    sample = stored.get(limit=1, include=["embeddings"])["embeddings"]
+    dimensions = len(sample[0]) if sample is not None and len(sample) else 0
+    return {
+        "collections": collections,
+        "dropped": dropped,
+        "chunks_in_collections": total_chunks,
+        "unique_chunks": unique_chunks,
+        "chunks_in_store": stored.count(),
+        "duplication_ratio": round(total_chunks / unique_chunks, 2) if unique_chunks else None,
+        # Векторы float32 повторяющихся чанков, которые больше не хранятся по нескольку раз. SQLite Chroma
+        # не возвращает место удаленных коллекций без VACUUM, поэтому disk_bytes_after может его не отражать
+        "vector_bytes_saved": (total_chunks - unique_chunks) * dimensions * 4,
+        "disk_bytes_before": disk_before,
+        "disk_bytes_after": dir_size(registry.persist_directory),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    cli = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cli.add_argument("--drop", action="store_true", help="Удалить перенесенные коллекции")
+    cli.add_argument("--page-size", type=int, default=500, help="Чанков за один запрос к Chroma")
+    args = cli.parse_args()
+    print(json.dumps(migrate(drop=args.drop, page_size=args.page_size), ensure_ascii=False, indent=2))
@@ -0,0 +1,111 @@
+from langchain_core.documents import Document
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import os
+
+from decision_metadata import describe
+from pdf_chunker import normalize_whitespace
+from tokenizer import count_tokens
+
+# Сколько токенов контекста RAG передается в _generate
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "3000"))
+# Перекрытие соседних чанков не длиннее chunk_overlap сплиттера (в токенах), с запасом в символах
+MAX_OVERLAP_CHARS = 1000
+
+
+@lru_cache(maxsize=4096)
+def _chunk_tokens(text: str) -> int:
+    # Одни и те же чанки попадают в контекст многих вопросов по делу
+    return count_tokens(text)
+
+
+def _text(doc: Document) -> str:
+    # Чанки, загруженные до нормализации при индексации, приводим к тому же виду здесь
+    if doc.metadata.get("ws_normalized"):
+        return doc.page_content
+    return normalize_whitespace(doc.page_content)
+
+
+def _position(doc: Document) -> Tuple[int, int]:
+    return int(doc.metadata.get("page", 0) or 0), int(doc.metadata.get("start_index", -1))
+
+
+def _overlap(previous: Document, previous_text: str, current: Document, current_text: str) -> Optional[int]:
+    """Сколько символов в начале current повторяют конец previous; None - чанки не соседние."""
+    previous_page, previous_start = _position(previous)
+    current_page, current_start = _position(current)
+    # Чанки разбивки по разделам считают start_index от начала документа, постраничные - от начала страницы
+    same_offsets = previous_page == current_page or ("section" in previous.metadata and "section" in current.metadata)
+    if same_offsets and previous_start >= 0 and current_start >= 0:
+        previous_end = previous_start + len(previous.page_content)
+        # Между соседними чанками может остаться один пробельный символ, срезанный при нарезке
+        if current_start > previous_end + 1:
+            return None
+        if previous.metadata.get("ws_normalized") and current.metadata.get("ws_normalized"):
+            return max(0, min(previous_end - current_start, len(current_text)))
+
+    # Без start_index (или с разными страницами) ищем общий суффикс/префикс
+    longest = min(len(previous_text), len(current_text), MAX_OVERLAP_CHARS)
+    for size in range(longest, 20, -1):
+        if previous_text.endswith(current_text[:size]):
+            return size
+    if current_page == previous_page and current_start >= 0:
+        return 0
+    if current_page == previous_page + 1 and current_start == 0:
+        return 0
+    return None
+
+
+def build_context(docs: List[Document], max_tokens: int = RAG_CONTEXT_TOKENS) -> str:
+    """Собирает контекст для LLM из найденных чанков.
+
+    Чанки отбираются по релевантности (порядок docs), пока помещаются в max_tokens.
+    Затем они группируются по документам, документы упорядочиваются по дате акта,
+    соседние чанки одного документа склеиваются с удалением перекрытия.
+    """
+    selected: List[Tuple[int, Document, str]] = []
+    used = 0
+    seen = set()
+    for rank, doc in enumerate(docs):
+        text = _text(doc)
+        if not text or text in seen:
+            continue
+        tokens = _chunk_tokens(text)
+        if used + tokens > max_tokens:
+            continue
+        seen.add(text)
+        selected.append((rank, doc, text))
+        used += tokens
+
+    by_source: Dict[str, List[Tuple[int, Document, str]]] = {}
+    for item in selected:
+        by_source.setdefault(item[1].metadata.get("source", ""), []).append(item)
+
+    def document_order(items: List[Tuple[int, Document, str]]) -> Tuple[str, int]:
+        # Хронология по дате акта; документы без даты в конце, внутри - по релевантности
+        dates = [item[1].metadata.get("decision_date") for item in items if item[1].metadata.get("decision_date")]
+        return (min(dates) if dates else "9999", min(item[0] for item in items))
+
+    sections = []
+    ordered = sorted(by_source.values(), key=document_order)
+    for number, items in enumerate(ordered, start=1):
+        items = sorted(items, key=lambda item: _position(item[1]))
+        text = items[0][2]
+        for (_, previous, previous_text), (_, doc, current_text) in zip(items, items[1:]):
+            overlap = _overlap(previous, previous_text, doc, current_text)
+            if overlap is None:
+                # Между фрагментами пропущен текст документа
+                text += "\n…\n" + current_text
+            elif current_text[overlap:].strip():
+                text = _join(text, current_text[overlap:])
+
+        label = describe(items[0][1].metadata)
+        header = f"Документ {number} ({label}):" if label else f"Документ {number}:"
+        sections.append(header + "\n" + text)
+    return "\n\n".join(sections)
+
+
+def _join(text: str, continuation: str) -> str:
+    if text[-1:].isspace() or continuation[:1].isspace():
+        return text + continuation
+    return text + " " + continuation
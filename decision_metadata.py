@@ -0,0 +1,166 @@
+from typing import Dict, List, Optional, Union
+import re
+
+# Значения instance_level в метаданных чанков
+FIRST_INSTANCE = 1
+APPEAL = 2
+CASSATION = 3
+SUPREME_COURT = 4
+
+INSTANCE_NAMES = {
+    FIRST_INSTANCE: "первая инстанция",
+    APPEAL: "апелляция",
+    CASSATION: "кассация",
+    SUPREME_COURT: "Верховный Суд РФ",
+}
+
+# Сколько символов начала документа просматривать: шапка, преамбула и суть иска
+HEADER_CHARS = 4000
+
+_MONTHS = {
+    "января": 1, "февраля": 2, "марта": 3, "апреля": 4, "мая": 5, "июня": 6,
+    "июля": 7, "августа": 8, "сентября": 9, "октября": 10, "ноября": 11, "декабря": 12,
+}
+
+_DOC_TYPE_RE = re.compile(r'(?m)^\s*(Р\s*Е\s*Ш\s*Е\s*Н\s*И\s*Е|П\s*О\s*С\s*Т\s*А\s*Н\s*О\s*В\s*Л\s*Е\s*Н\s*И\s*Е|'
+                          r'О\s*П\s*Р\s*Е\s*Д\s*Е\s*Л\s*Е\s*Н\s*И\s*Е)\b', re.IGNORECASE)
+_COURT_RE = re.compile(
+    r'(Верховный\s+Суд\s+Российской\s+Федерации|Суд\s+по\s+интеллектуальным\s+правам|'
+    r'[А-ЯЁа-яё]+\s+арбитражный\s+апелляционный\s+суд|'
+    r'Арбитражный\s+суд\s+[А-ЯЁа-яё\-]+(?:\s+[А-ЯЁа-яё\-]+){0,4}?(?=\s*(?:\n|в\s+составе|$|\d|,|\()))',
+    re.IGNORECASE
+)
+_TEXT_DATE_RE = re.compile(r'\b(\d{1,2})\s+(' + '|'.join(_MONTHS) + r')\s+(\d{4})', re.IGNORECASE)
+_NUMERIC_DATE_RE = re.compile(r'\b(\d{1,2})\.(\d{1,2})\.(\d{4})\b')
+_FULL_TEXT_DATE_RE = re.compile(r'(?:в\s+полном\s+объеме|полный\s+текст)[^.\n]{0,40}?изготовлен[аоы]?\s*'
+                                r'(\d{1,2}\s+[а-яё]+\s+\d{4}|\d{1,2}\.\d{1,2}\.\d{4})', re.IGNORECASE)
+_PARTIES_RE = re.compile(
+    r'по\s+(?:исковому\s+заявлению|иску|заявлению)\s+(.{3,300}?)\s+к\s+(.{3,300}?)\s+'
+    r'(?:о\s+|об\s+|третьи?\s+лиц|при\s+участии)',
+    re.IGNORECASE | re.DOTALL
+)
+_AMOUNT_RE = re.compile(r'(\d{1,3}(?:[  ]\d{3})+|\d+)(?:[.,](\d{1,2}))?\s*(?:руб|₽)', re.IGNORECASE)
+_IDENTIFIERS_RE = re.compile(r'\s*\((?:[^()]*(?:ИНН|ОГРН|адрес)[^()]*)\)', re.IGNORECASE)
+
+
+def _collapse(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _parse_date(text: str) -> Optional[str]:
+    match = _TEXT_DATE_RE.search(text)
+    if match:
+        day, month, year = int(match.group(1)), _MONTHS[match.group(2).lower()], int(match.group(3))
+    else:
+        match = _NUMERIC_DATE_RE.search(text)
+        if not match:
+            return None
+        day, month, year = (int(part) for part in match.groups())
+    if not (1 <= day <= 31 and 1 <= month <= 12 and 1990 <= year <= 2100):
+        return None
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+def _instance_level(court: str, doc_type: Optional[str]) -> Optional[int]:
+    court = court.lower()
+    if "верховный" in court:
+        return SUPREME_COURT
+    if "апелляционный" in court:
+        return APPEAL
+    if "округа" in court:
+        return CASSATION
+    if "интеллектуальным" in court:
+        # СИП рассматривает дела и по первой инстанции, и в кассации (президиум)
+        return CASSATION if doc_type == "постановление" else FIRST_INSTANCE
+    if "арбитражный суд" in court:
+        return FIRST_INSTANCE
+    return None
+
+
+def _parse_amount(text: str) -> Optional[float]:
+    match = _AMOUNT_RE.search(text)
+    if not match:
+        return None
+    whole = re.sub(r'[  ]', '', match.group(1))
+    return float(f"{whole}.{match.group(2) or '0'}")
+
+
+def _party(text: str) -> str:
+    return _collapse(_IDENTIFIERS_RE.sub('', text))[:200]
+
+
+def extract_decision_metadata(text: str) -> Dict[str, Union[str, int, float]]:
+    """Правилами извлекает из начала судебного акта тип документа, суд, инстанцию,
+    дату, стороны и сумму требований.
+
+    Возвращает только найденные поля; значения пригодны для метаданных Chroma.
+    """
+    header = text[:HEADER_CHARS]
+    metadata: Dict[str, Union[str, int, float]] = {}
+
+    doc_type_match = _DOC_TYPE_RE.search(header)
+    doc_type = re.sub(r'\s+', '', doc_type_match.group(1)).lower() if doc_type_match else None
+    if doc_type:
+        metadata["doc_type"] = doc_type
+
+    court_match = _COURT_RE.search(header)
+    if court_match:
+        court = _collapse(court_match.group(1))
+        metadata["court"] = court
+        level = _instance_level(court, doc_type)
+        if level:
+            metadata["instance_level"] = level
+            metadata["instance"] = INSTANCE_NAMES[level]
+
+    full_text_date = _FULL_TEXT_DATE_RE.search(header)
+    decision_date = _parse_date(full_text_date.group(1)) if full_text_date else _parse_date(header)
+    if decision_date:
+        metadata["decision_date"] = decision_date
+        # Число вида 20230517: Chroma сравнивает ($gte/$lte) только числа
+        metadata["decision_ts"] = int(decision_date.replace("-", ""))
+
+    parties_match = _PARTIES_RE.search(header)
+    if parties_match:
+        metadata["plaintiff"] = _party(parties_match.group(1))
+        metadata["defendant"] = _party(parties_match.group(2))
+        amount = _parse_amount(header[parties_match.end():parties_match.end() + 600])
+        if amount is not None:
+            metadata["claim_amount"] = amount
+
+    return metadata
+
+
+_INSTANCE_HINTS = [
+    (re.compile(r'апелляц', re.IGNORECASE), APPEAL),
+    (re.compile(r'кассац|суд\w*\s+округа', re.IGNORECASE), CASSATION),
+    (re.compile(r'верховн\w*\s+суд|\bвс\s+рф\b', re.IGNORECASE), SUPREME_COURT),
+    (re.compile(r'перв\w+\s+инстанц', re.IGNORECASE), FIRST_INSTANCE),
+]
+_YEAR_HINT_RE = re.compile(r'\b(?:в|за)\s+(\d{4})\s*(?:г\b|год)', re.IGNORECASE)
+
+
+def infer_filters(question: str) -> Optional[Dict]:
+    """Фильтр Chroma по инстанции и году, если вопрос явно на них указывает.
+
+    Несколько инстанций или их отсутствие в вопросе - без фильтра по инстанции.
+    """
+    conditions: List[Dict] = []
+    levels = {level for pattern, level in _INSTANCE_HINTS if pattern.search(question)}
+    if len(levels) == 1:
+        conditions.append({"instance_level": levels.pop()})
+
+    year_match = _YEAR_HINT_RE.search(question)
+    if year_match:
+        year = int(year_match.group(1))
+        conditions.append({"decision_ts": {"$gte": year * 10000 + 101}})
+        conditions.append({"decision_ts": {"$lte": year * 10000 + 1231}})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def describe(metadata: Dict) -> str:
+    """Короткая подпись фрагмента для контекста LLM: тип, суд, инстанция, дата."""
+    parts = [metadata.get("doc_type"), metadata.get("court"), metadata.get("instance"), metadata.get("decision_date")]
+    return ", ".join(str(part) for part in parts if part)
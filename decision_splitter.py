@@ -0,0 +1,87 @@
+from langchain_core.documents import Document
+from bisect import bisect_right
+from typing import List, Tuple
+import re
+
+from tokenizer import count_tokens
+
+# Разделы судебного акта в метаданных чанков
+PREAMBLE = "preamble"  # шапка, состав суда, стороны, суть требований
+ESTABLISHED = "established"  # «УСТАНОВИЛ»: обстоятельства дела и мотивировка
+RESOLUTION = "resolution"  # «РЕШИЛ» / «ПОСТАНОВИЛ» / «ОПРЕДЕЛИЛ»: резолютивная часть
+
+# Предел чанка в токенах: столько же, сколько у оконного сплиттера (и у модели эмбеддингов GigaChat)
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 100
+
+
+def _marker(*words: str) -> "re.Pattern":
+    # Маркер раздела - отдельная строка, часто вразрядку («У С Т А Н О В И Л :»)
+    spaced = "|".join(r"[ \t]*".join(word) for word in words)
+    return re.compile(r"(?im)^[ \t]*(?:" + spaced + r")[ \t]*:")
+
+
+_ESTABLISHED_RE = _marker("УСТАНОВИЛ")
+_RESOLUTION_RE = _marker("РЕШИЛ", "ПОСТАНОВИЛ", "ОПРЕДЕЛИЛ")
+
+
+def find_sections(text: str) -> List[Tuple[str, int]]:
+    """Начала разделов акта: [(раздел, смещение)], первый всегда с нуля.
+
+    Без маркеров весь текст считается преамбулой: для отдельных определений
+    и писем это точнее, чем мотивировка.
+    """
+    sections = [(PREAMBLE, 0)]
+    established = _ESTABLISHED_RE.search(text)
+    resolution = _RESOLUTION_RE.search(text, established.end() if established else 0)
+    if established and established.start() > 0:
+        sections.append((ESTABLISHED, established.start()))
+    elif established:
+        sections[0] = (ESTABLISHED, 0)
+    if resolution:
+        sections.append((RESOLUTION, resolution.start()))
+    return sections
+
+
+def split_decision(pages: List[Document], splitter=None) -> List[Document]:
+    """Режет судебный акт по разделам, а не по страницам.
+
+    Страницы склеиваются в один текст; раздел, который помещается в CHUNK_TOKENS,
+    становится одним чанком, длинный режется оконным сплиттером внутри раздела.
+    start_index считается от начала документа, page - страница начала чанка.
+    """
+    if not pages:
+        return []
+    if splitter is None:
+        from pdf_chunker import get_splitter
+        splitter = get_splitter()
+
+    page_starts, parts, offset = [], [], 0
+    for page in pages:
+        page_starts.append(offset)
+        parts.append(page.page_content)
+        offset += len(page.page_content) + 1
+    text = "\n".join(parts)
+    base_metadata = dict(pages[0].metadata)
+
+    sections = find_sections(text)
+    chunks: List[Document] = []
+    for index, (section, start) in enumerate(sections):
+        end = sections[index + 1][1] if index + 1 < len(sections) else len(text)
+        section_text = text[start:end]
+        if not section_text.strip():
+            continue
+        if count_tokens(section_text) <= CHUNK_TOKENS:
+            pieces: List[Tuple[str, int]] = [(section_text.rstrip(), start)]
+        else:
+            pieces = [
+                (piece.page_content, start + piece.metadata["start_index"])
+                for piece in splitter.create_documents([section_text])
+            ]
+        for content, chunk_start in pieces:
+            page = pages[bisect_right(page_starts, chunk_start) - 1]
+            chunks.append(Document(
+                page_content=content,
+                metadata=dict(base_metadata, page=page.metadata["page"], start_index=chunk_start, section=section)
+            ))
+    return chunks
@@ -0,0 +1,205 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Optional
+import logging
+import os
+import threading
+import time
+
+from metrics import counter, gauge, histogram
+
+DRIVER_POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "2"))
+DRIVER_MAX_USES = int(os.getenv("DRIVER_MAX_USES", "20"))
+DRIVER_ACQUIRE_TIMEOUT = float(os.getenv("DRIVER_ACQUIRE_TIMEOUT", "300"))
+
+POOL_WAIT = histogram("driver_pool_wait_seconds", "Время ожидания свободного браузера")
+DRIVER_LIFETIME = histogram(
+    "driver_lifetime_seconds", "Время жизни браузера от запуска до утилизации",
+    buckets=(60.0, 300.0, 900.0, 1800.0, 3600.0, 7200.0, 21600.0, 86400.0)
+)
+DRIVER_STARTS = counter("driver_starts_total", "Запуски Chromium")
+DRIVER_DISCARDS = counter("driver_discards_total", "Утилизированные браузеры по причине")
+
+
+class DriverPoolTimeout(Exception):
+    """Свободный браузер не появился за отведенное время."""
+
+
+@dataclass
+class PooledDriver:
+    driver: object
+    created_at: float = field(default_factory=time.monotonic)
+    uses: int = 0
+
+
+class WebDriverPool:
+    """Ограниченный пул заранее запущенных браузеров Chromium.
+
+    Задача берет браузер через `with pool.driver(download_dir) as driver:` и возвращает
+    его очищенным. Браузер пересоздается после max_uses задач или если перестал отвечать.
+    """
+
+    def __init__(self, factory: Callable[[], object], max_size: int = DRIVER_POOL_SIZE,
+                 max_uses: int = DRIVER_MAX_USES, acquire_timeout: float = DRIVER_ACQUIRE_TIMEOUT) -> None:
+        self.factory = factory
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self._idle: List[PooledDriver] = []
+        self._total = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        gauge("driver_pool_idle", "Свободные браузеры в пуле").set_function(lambda: len(self._idle))
+        gauge("driver_pool_busy", "Занятые браузеры").set_function(lambda: self._total - len(self._idle))
+
+    def _start(self) -> PooledDriver:
+        started = time.perf_counter()
+        pooled = PooledDriver(driver=self.factory())
+        DRIVER_STARTS.inc()
+        logging.info(f"Пул браузеров: запущен Chromium за {time.perf_counter() - started:.1f}s")
+        return pooled
+
+    def prestart(self, count: Optional[int] = None) -> None:
+        """Запускает браузеры заранее, чтобы первая задача не ждала старта Chromium."""
+        count = self.max_size if count is None else min(count, self.max_size)
+        while True:
+            with self._cond:
+                if self._closed or self._total >= count:
+                    return
+                self._total += 1
+            try:
+                pooled = self._start()
+            except Exception as e:
+                with self._cond:
+                    self._total -= 1
+                logging.error(f"Пул браузеров: не удалось запустить Chromium: {e}")
+                return
+            with self._cond:
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    @staticmethod
+    def _is_healthy(pooled: PooledDriver) -> bool:
+        try:
+            pooled.driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, pooled: PooledDriver, reason: str) -> None:
+        DRIVER_LIFETIME.observe(time.monotonic() - pooled.created_at)
+        DRIVER_DISCARDS.inc(reason=reason)
+        logging.info(f"Пул браузеров: утилизирую браузер ({reason}, задач: {pooled.uses})")
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def acquire(self) -> PooledDriver:
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        while True:
+            create = False
+            with self._cond:
+                while not self._idle and self._total >= self.max_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DriverPoolTimeout(f"нет свободного браузера за {self.acquire_timeout:.0f}s")
+                    self._cond.wait(remaining)
+                if self._closed:
+                    raise RuntimeError("Пул браузеров закрыт")
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    self._total += 1
+                    create = True
+
+            if create:
+                try:
+                    pooled = self._start()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(pooled):
+                self._discard(pooled, "crashed")
+                continue
+
+            POOL_WAIT.observe(time.monotonic() - started)
+            return pooled
+
+    def release(self, pooled: PooledDriver) -> None:
+        pooled.uses += 1
+        if self._closed:
+            self._discard(pooled, "closed")
+            return
+        if pooled.uses >= self.max_uses:
+            self._discard(pooled, "max_uses")
+            return
+        try:
+            self._reset(pooled.driver)
+        except Exception as e:
+            logging.warning(f"Пул браузеров: не удалось очистить браузер: {e}")
+            self._discard(pooled, "crashed")
+            return
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @staticmethod
+    def _reset(driver) -> None:
+        """Закрывает лишние вкладки и очищает cookies, чтобы задачи не видели чужую сессию."""
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.delete_all_cookies()
+        driver.get("about:blank")
+
+    @staticmethod
+    def _set_download_dir(driver, download_dir: str) -> None:
+        driver.execute_cdp_cmd(
+            "Page.setDownloadBehavior",
+            {"behavior": "allow", "downloadPath": download_dir}
+        )
+
+    @contextmanager
+    def driver(self, download_dir: Optional[str] = None) -> Iterator[object]:
+        pooled = self.acquire()
+        try:
+            if download_dir:
+                self._set_download_dir(pooled.driver, download_dir)
+            yield pooled.driver
+        finally:
+            if self._is_healthy(pooled):
+                self.release(pooled)
+            else:
+                self._discard(pooled, "crashed")
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled, "closed")
+
+
+_pool: Optional[WebDriverPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool() -> WebDriverPool:
+    """Общий для процесса пул браузеров с настройками из parser.build_chrome_options."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from parser import create_driver
+            _pool = WebDriverPool(factory=create_driver)
+        return _pool
@@ -1,12 +1,19 @@
 from langchain_gigachat.embeddings import GigaChatEmbeddings
+from embedding_cache import CachedEmbeddings, get_embedding_cache
 import os 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def embedder() -> GigaChatEmbeddings:
+def gigachat_embedder() -> GigaChatEmbeddings:
     return GigaChatEmbeddings(
         credentials=os.getenv("GIGACHAT_API_KEY"),
         scope="GIGACHAT_API_CORP",
         verify_ssl_certs=False
     )
+
+def embedder() -> CachedEmbeddings:
+    """Эмбеддер GigaChat за персистентным кэшем: повторные чанки не уходят в API."""
+    underlying = gigachat_embedder()
+    model_id = f"gigachat:{getattr(underlying, 'model', None) or 'Embeddings'}"
+    return CachedEmbeddings(underlying=underlying, model_id=model_id, cache=get_embedding_cache())
@@ -0,0 +1,208 @@
+from langchain_core.embeddings import Embeddings
+from array import array
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from executors import run_blocking
+from tracing import span
+
+
+def content_key(text: str, model_id: str) -> str:
+    """Ключ кэша: хеш содержимого чанка вместе с идентификатором модели эмбеддингов."""
+    return hashlib.sha256(f"{model_id}\x00{text}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Персистентное хранилище эмбеддингов в SQLite с вытеснением по размеру (LRU)."""
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model_id TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Возвращает найденные эмбеддинги и обновляет время последнего обращения."""
+        found: Dict[str, List[float]] = {}
+        if not keys:
+            return found
+
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite ограничивает число параметров в запросе, поэтому идем пачками
+            for i in range(0, len(unique_keys), 500):
+                part = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: List[Tuple[str, List[float]]], model_id: str) -> None:
+        """Сохраняет эмбеддинги и при превышении лимита вытесняет самые старые записи."""
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            blob = array('f', vector).tobytes()
+            rows.append((key, model_id, blob, len(blob), now))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model_id, vector, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Освобождаем место с запасом, чтобы не вытеснять на каждой вставке
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        cursor = self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used ASC")
+        to_delete = []
+        for key, size in cursor:
+            if total <= target:
+                break
+            to_delete.append((key,))
+            total -= size
+            evicted += 1
+
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", to_delete)
+        self._conn.commit()
+        logging.info(f'Кэш эмбеддингов: вытеснено {evicted} записей, размер {total} байт')
+
+    def record(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> Dict[str, float]:
+        """Счетчики попаданий и промахов кэша."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Обертка над моделью эмбеддингов: удаленно считаются только тексты, которых нет в кэше."""
+
+    def __init__(self, underlying: Embeddings, model_id: str, cache: EmbeddingCache) -> None:
+        self.underlying = underlying
+        self.model_id = model_id
+        self.cache = cache
+
+    def _lookup(self, texts: List[str]) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+        keys = [content_key(text, self.model_id) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Одинаковые тексты внутри одного батча отправляем в модель один раз
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        hits = sum(1 for key in keys if key in cached)
+        self.cache.record(hits=hits, misses=len(texts) - hits)
+        if missing:
+            logging.info(f'Кэш эмбеддингов: {hits} из {len(texts)} найдено, запрашиваю {len(missing)} у модели')
+        return keys, cached, missing
+
+    def _store(self, cached: Dict[str, List[float]], missing: Dict[str, str], vectors: List[List[float]]) -> None:
+        fresh = list(zip(missing.keys(), vectors))
+        self.cache.put_many(fresh, self.model_id)
+        cached.update({key: list(vector) for key, vector in fresh})
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+            with span("embeddings.embed", texts=len(missing)):
+                vectors = self.underlying.embed_documents(list(missing.values()))
+            self._store(cached, missing, vectors)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = await run_blocking("io", self._lookup, texts)
+        if missing:
+            with span("embeddings.embed", texts=len(missing)):
+                vectors = await self.underlying.aembed_documents(list(missing.values()))
+            await run_blocking("io", self._store, cached, missing, vectors)
+        return [cached[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> Dict[str, float]:
+        return self.cache.stats()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Возвращает общий для процесса кэш эмбеддингов."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            path = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache/embeddings.sqlite")
+            max_mb = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+            _cache = EmbeddingCache(path=path, max_bytes=int(max_mb * 1024 * 1024))
+        return _cache
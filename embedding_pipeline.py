@@ -0,0 +1,248 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Set
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from langchain_core.documents import Document
+
+from metrics import counter, gauge
+from tokenizer import count_tokens
+from tracing import span
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+    from langchain_core.embeddings import Embeddings
+
+# Размер батча эмбеддингов в токенах и в текстах (ограничения API эмбеддингов GigaChat)
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "8000"))
+EMBED_BATCH_MAX_TEXTS = int(os.getenv("EMBED_BATCH_MAX_TEXTS", "64"))
+# Сколько батчей одновременно в полете: верхняя граница и стартовое значение AIMD
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "8"))
+EMBED_START_IN_FLIGHT = int(os.getenv("EMBED_START_IN_FLIGHT", "2"))
+# Попыток на один батч; повторяется только упавший батч, остальные идут дальше
+EMBED_RETRIES = int(os.getenv("EMBED_RETRIES", "5"))
+# Сколько готовых чанков писать в Chroma одним вызовом
+CHROMA_WRITE_BATCH = int(os.getenv("CHROMA_WRITE_BATCH", "256"))
+
+EMBEDDED_CHUNKS = counter("embedded_chunks_total", "Чанки, для которых посчитаны эмбеддинги при загрузке")
+EMBED_THROTTLED = counter("embed_throttled_total", "Ответы 429/5xx API эмбеддингов, после которых снижался параллелизм")
+EMBED_IN_FLIGHT_LIMIT = gauge("embed_in_flight_limit", "Текущий предел одновременных батчей эмбеддингов (AIMD)")
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """HTTP-статус из исключения клиента GigaChat, httpx или requests, если он есть."""
+    for candidate in (error, getattr(error, "response", None)):
+        code = getattr(candidate, "status_code", None)
+        if isinstance(code, int):
+            return code
+    # gigachat.exceptions.ResponseError хранит статус в args: (url, status_code, content, headers)
+    for arg in getattr(error, "args", ()):
+        if isinstance(arg, int) and 400 <= arg < 600:
+            return arg
+    return None
+
+
+def is_throttling(error: BaseException) -> bool:
+    """Перегрузка API: 429, 5xx или таймаут - сигнал уменьшить число батчей в полете."""
+    code = status_code(error)
+    if code is not None:
+        return code == 429 or code >= 500
+    return isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
+
+
+class AimdLimiter:
+    """Предел одновременных запросов с аддитивным ростом и мультипликативным снижением.
+
+    Каждый успешный ответ добавляет 1/limit (то есть +1 за «окно» из limit ответов),
+    перегрузка делит предел пополам, но не ниже одного запроса.
+    """
+
+    def __init__(self, start: int = EMBED_START_IN_FLIGHT, maximum: int = EMBED_MAX_IN_FLIGHT) -> None:
+        self.maximum = max(1, maximum)
+        self.limit = float(min(max(1, start), self.maximum))
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        EMBED_IN_FLIGHT_LIMIT.set(self.limit)
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self, throttled: bool = False) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            EMBED_IN_FLIGHT_LIMIT.set(self.limit)
+            self._condition.notify_all()
+
+
+def token_batches(docs: List[Document], max_tokens: int = EMBED_BATCH_TOKENS,
+                  max_texts: int = EMBED_BATCH_MAX_TEXTS) -> Iterator[List[int]]:
+    """Индексы документов, сгруппированные в батчи не больше max_tokens и max_texts.
+
+    Чанк длиннее max_tokens уходит отдельным батчем: обрезать его здесь нельзя.
+    """
+    batch: List[int] = []
+    batch_tokens = 0
+    for index, doc in enumerate(docs):
+        tokens = count_tokens(doc.page_content)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_texts):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(index)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+@dataclass
+class EmbeddingReport:
+    chunks: int
+    batches: int
+    retries: int
+    throttled: int
+    seconds: float
+    final_in_flight: float
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+
+class EmbeddingPipeline:
+    """Эмбеддинги для загрузки коллекции: несколько батчей в полете, запись в Chroma отдельными порциями.
+
+    Батчи режутся по токенам, параллелизм подстраивается под ответы API (AIMD),
+    упавший батч повторяется сам по себе с паузой, не задерживая остальные.
+    Готовые векторы пишутся в коллекцию по CHROMA_WRITE_BATCH без повторного расчета.
+    """
+
+    def __init__(self, embedder: "Embeddings", limiter: Optional[AimdLimiter] = None,
+                 retries: int = EMBED_RETRIES, write_batch: int = CHROMA_WRITE_BATCH) -> None:
+        self.embedder = embedder
+        self.limiter = limiter or AimdLimiter()
+        self.retries = retries
+        self.write_batch = write_batch
+        self._counts_lock = threading.Lock()
+        self._retries = 0
+        self._throttled = 0
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(1, self.retries + 1):
+            self.limiter.acquire()
+            try:
+                with span("embeddings.batch", texts=len(texts), attempt=attempt):
+                    vectors = self.embedder.embed_documents(texts)
+            except Exception as e:
+                throttled = is_throttling(e)
+                self.limiter.release(throttled=throttled)
+                with self._counts_lock:
+                    self._retries += 1
+                    self._throttled += int(throttled)
+                if throttled:
+                    EMBED_THROTTLED.inc()
+                if attempt == self.retries:
+                    raise
+                sleep_s = min(30.0, 0.5 * 2 ** (attempt - 1))
+                logging.warning(f'Ошибка эмбеддинга батча из {len(texts)} чанков (попытка {attempt}/{self.retries}, '
+                                f'статус {status_code(e) or "-"}): {e}. Повтор через {sleep_s:.1f}s, '
+                                f'в полете не больше {int(self.limiter.limit)} батчей')
+                time.sleep(sleep_s)
+            else:
+                self.limiter.release()
+                return vectors
+        raise RuntimeError("EMBED_RETRIES должно быть не меньше 1")
+
+    def _write(self, vec_db: "Chroma", ids: List[str], docs: List[Document], vectors: List[List[float]]) -> None:
+        retries = 3
+        for attempt in range(1, retries + 1):
+            try:
+                with span("chroma.add", docs=len(docs), attempt=attempt):
+                    # Векторы уже посчитаны: пишем в коллекцию напрямую, минуя повторный эмбеддинг в add_documents
+                    vec_db._collection.upsert(
+                        ids=ids,
+                        embeddings=vectors,
+                        documents=[doc.page_content for doc in docs],
+                        metadatas=[doc.metadata for doc in docs],
+                    )
+                return
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                sleep_s = 1.5 * attempt
+                logging.warning(f'Ошибка записи {len(docs)} чанков в Chroma (попытка {attempt}/{retries}): {e}. '
+                                f'Повтор через {sleep_s:.1f}s')
+                time.sleep(sleep_s)
+
+    def add(self, vec_db: "Chroma", ids: List[str], docs: List[Document]) -> EmbeddingReport:
+        """Считает эмбеддинги docs и пишет их в коллекцию; при ошибке батча после всех попыток - исключение."""
+        started = time.perf_counter()
+        batches = list(token_batches(docs))
+        ready: Dict[int, List[float]] = {}
+        written = 0
+
+        def flush(force: bool) -> None:
+            nonlocal written
+            # Пишем по порядку: Chroma получает непрерывные порции, независимо от того, какой батч вернулся первым
+            while written < len(docs) and (force or len(ready) >= self.write_batch):
+                end = written
+                while end < len(docs) and end in ready and end - written < self.write_batch:
+                    end += 1
+                if end == written or (not force and end - written < self.write_batch):
+                    return
+                self._write(vec_db, ids[written:end], docs[written:end], [ready.pop(i) for i in range(written, end)])
+                written = end
+
+        with ThreadPoolExecutor(max_workers=self.limiter.maximum, thread_name_prefix="embed-worker") as executor:
+            pending: Dict[Future, List[int]] = {}
+            for batch in batches:
+                # Каждый батч со своей копией контекста: span эмбеддинга остается в трассе загрузки
+                context = contextvars.copy_context()
+                texts = [docs[i].page_content for i in batch]
+                pending[executor.submit(context.run, self._embed_batch, texts)] = batch
+            not_done: Set[Future] = set(pending)
+            try:
+                while not_done:
+                    done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        vectors = future.result()
+                        ready.update(zip(pending[future], vectors))
+                        EMBEDDED_CHUNKS.inc(len(vectors))
+                    flush(force=False)
+            except BaseException:
+                for future in not_done:
+                    future.cancel()
+                raise
+        flush(force=True)
+
+        seconds = time.perf_counter() - started
+        return EmbeddingReport(
+            chunks=len(docs),
+            batches=len(batches),
+            retries=self._retries,
+            throttled=self._throttled,
+            seconds=seconds,
+            final_in_flight=self.limiter.limit,
+        )
+
+
+_limiter: Optional[AimdLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> AimdLimiter:
+    """Общий для процесса предел AIMD: параллельные загрузки делят одну квоту API."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AimdLimiter()
+        return _limiter
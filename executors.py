@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+
+T = TypeVar("T")
+
+# Отдельные ограниченные пулы для блокирующих частей пайплайна, чтобы долгий
+# Selenium или индексация не занимали потоки, нужные для запросов к Chroma
+EXECUTOR_SIZES = {
+    "selenium": int(os.getenv("DRIVER_POOL_SIZE", "2")),
+    "ingest": int(os.getenv("INGEST_WORKERS", "2")),
+    "io": int(os.getenv("IO_WORKERS", "8")),
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind: str) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(kind)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=EXECUTOR_SIZES[kind], thread_name_prefix=f"{kind}-worker")
+            _executors[kind] = executor
+        return executor
+
+
+async def run_blocking(kind: str, function: Callable[..., T], *args, **kwargs) -> T:
+    """Выполняет блокирующую функцию в пуле нужного вида, сохраняя contextvars вызывающего."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, function, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(kind), call)
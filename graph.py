@@ -1,20 +1,27 @@
 from langgraph.graph import StateGraph, START, END, add_messages
 from langgraph.graph.message import AnyMessage
-from langchain_core.messages import HumanMessage, SystemMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langgraph.types import Command
+from langchain_core.runnables import RunnableConfig
 from langchain_core.prompts import ChatPromptTemplate
 
 from typing import List, Annotated, Optional, Literal, TypedDict
+import argparse
+import asyncio
 import os
 import uuid
 import re
 import logging
+import time
 
-from model import SudebChatModel
-from parser import download_by_query
-from rag_module import rag
-from vec_database import get_collection_for_case, chroma_database
+from rag_module import arag
+from vec_database import get_collection_for_case
+from ingest_queue import get_ingest_scheduler
+from answer_cache import get_answer_cache
+from executors import run_blocking
+from checkpointer import create_checkpoint_backend
+from case_classifier import CaseType, LLM_FALLBACK_CONFIDENCE, classify, parse_case_type
+from tracing import record_llm_usage, record_span, span, traced
 
 def save_graph_png(graph, filename='langgraph_workflow.png'):
     try:
@@ -28,70 +35,102 @@ def save_graph_png(graph, filename='langgraph_workflow.png'):
     except Exception as e:
         logging.error(f"Ошибка сохранения графа: {e}")
 
+# Режимы запуска графа: полный конвейер, только загрузка дела, только вопрос по загруженному делу
+GRAPH_MODES = ("full", "ingest", "question")
+
+# Сколько последних сообщений хранить в состоянии одного чата
+GRAPH_MAX_MESSAGES = int(os.getenv("GRAPH_MAX_MESSAGES", "20"))
+
+def add_messages_bounded(left, right):
+    """add_messages, но в состоянии потока хранятся только последние GRAPH_MAX_MESSAGES сообщений."""
+    merged = add_messages(left, right)
+    return merged[-GRAPH_MAX_MESSAGES:]
+
 class State(TypedDict):
-    messages: Annotated[List[AnyMessage], add_messages]
+    messages: Annotated[List[AnyMessage], add_messages_bounded]
     rag_answer: Optional[str]
-    case_type: Optional[str]  # "ИНН", "Номер дела", "Организация"
+    case_type: Optional[str]  # Значение CaseType: "ИНН", "ОГРН", "Номер дела", "Организация"
+    case_query: Optional[str]  # Нормализованный запрос для поиска на ras.arbitr.ru
     collection_name: Optional[str]  # Имя коллекции для текущего дела
     flag: bool  # True если документы уже загружены
+    cache_generation: Optional[int]  # Поколение кэша ответов коллекции на момент поиска
 
 class Graph:
-    def __init__(self) -> None:
-        self.model = SudebChatModel()
-        self.memory = MemorySaver()
-        self.config = {"configurable": {"thread_id": "1"}}
-        self.graph = self._build_graph(State)
-
-    def _check_case(self, state: State):
-        """Автоматически определяет тип ввода: ИНН, номер дела или организация."""
+    def __init__(self, model=None) -> None:
+        self._model = model
+        self.checkpoints = create_checkpoint_backend()
+        self.graphs = {}
+        self._graph_lock = asyncio.Lock()
+        self._pending_resets = set()
+
+    @property
+    def model(self):
+        """GigaChat создается при первом обращении к LLM, а не при старте бота."""
+        if self._model is None:
+            from model import SudebChatModel
+            self._model = SudebChatModel()
+        return self._model
+
+    @traced("graph.check_case")
+    async def _check_case(self, state: State):
+        """Определяет тип ввода: ИНН, ОГРН, номер дела или организация.
+
+        Правила покрывают ИНН/ОГРН с контрольной суммой и номера дел; LLM
+        вызывается только для неуверенных случаев.
+        """
         message_for_check = state["messages"][-1].content
-        
-        # Используем LLM для определения типа ввода
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", "Твоя задача - определять, что пришло: ИНН, Организация или Номер дела. Выбери одно из этих трех значений и пришли это значение."),
-                ("user", message_for_check)
-            ]
-        )
-        choose_case_chain = prompt | self.model
-        response = choose_case_chain.invoke({"user_input": message_for_check}, profanity_check=False)
-        case_type = response.content.strip()
-        
+        classification = classify(message_for_check)
+        case_type = classification.case_type
+
+        if classification.confidence < LLM_FALLBACK_CONFIDENCE:
+            prompt = ChatPromptTemplate.from_messages(
+                [
+                    ("system", "Твоя задача - определять, что пришло: ИНН, ОГРН, Организация или Номер дела. "
+                               "Выбери одно из этих значений и пришли только это значение."),
+                    ("user", "{user_input}")
+                ]
+            )
+            choose_case_chain = prompt | self.model
+            with span("llm.check_case") as llm_span:
+                response = await choose_case_chain.ainvoke({"user_input": message_for_check}, profanity_check=False)
+                record_llm_usage("check_case", response, llm_span)
+            llm_case_type = parse_case_type(response.content)
+            logging.info(f"LLM определил тип: {response.content.strip()!r} -> {llm_case_type}")
+            if llm_case_type is not None:
+                case_type = llm_case_type
+
         # Определяем имя коллекции на основе ввода и определенного типа
         case_input = message_for_check.strip().upper()
         collection_name = get_collection_for_case(case_input)
         
-        logging.info(f"LLM определил тип: {case_type}, коллекция: {collection_name}")
+        logging.info(f"Тип ввода: {case_type.value} (уверенность правил {classification.confidence}), "
+                     f"запрос: {classification.normalized}, коллекция: {collection_name}")
         
         return {
-            "case_type": case_type,
+            "case_type": case_type.value,
+            "case_query": classification.normalized,
             "collection_name": collection_name
         }
 
-    def _search(self, state: State):
+    @traced("graph.search")
+    async def _search(self, state: State, config: RunnableConfig):
         """Загружает документы в соответствующую коллекцию."""
-        query = state["messages"][-1].content
+        query = state.get("case_query") or state["messages"][-1].content
         case_type = state.get("case_type", "Номер дела")
         collection_name = state.get("collection_name")
         
         if not collection_name:
             raise ValueError("Не удалось определить имя коллекции")
         
-        # Создаем папку для PDF под это дело
-        pdf_dir = os.path.join(os.path.abspath("pdfs"), collection_name)
-        os.makedirs(pdf_dir, exist_ok=True)
-        
-        logging.info(f"Загружаю документы для {case_type}: {query} в коллекцию {collection_name}")
-        
-        # Загружаем документы
-        download_by_query(query=query, output_folder=pdf_dir, choose_case=case_type)
-        
-        # Индексируем документы в коллекцию
-        chroma_database(pdf_directory=pdf_dir, collection_name=collection_name)
+        # Загрузка идет через общую очередь: параллельные запросы на то же дело
+        # объединяются в одно задание, число одновременных загрузок ограничено
+        on_progress = config.get("configurable", {}).get("on_progress")
+        await get_ingest_scheduler().run(collection_name, query, case_type, on_progress=on_progress)
         
         return {"flag": True}
 
-    def _rag(self, state: State):
+    @traced("graph.rag")
+    async def _rag(self, state: State):
         """Выполняет RAG-поиск в коллекции дела."""
         last_message = state["messages"][-1].content
         collection_name = state.get("collection_name")
@@ -102,15 +141,18 @@ class Graph:
             logging.warning("Graph _rag: Не удалось определить коллекцию для поиска")
             return {"rag_answer": "Не удалось определить коллекцию для поиска."}
         
+        # Если коллекцию обновят, пока идут поиск и генерация, ответ не сохранится в кэш
+        cache_generation = get_answer_cache().generation(collection_name)
         try:
-            rag_answer = rag(user_prompt=last_message, collection_name=collection_name)
+            rag_answer = await arag(user_prompt=last_message, collection_name=collection_name)
             logging.info(f"Graph _rag: Получен ответ длиной {len(rag_answer)} символов")
-            return {"rag_answer": rag_answer}
+            return {"rag_answer": rag_answer, "cache_generation": cache_generation}
         except Exception as e:
             logging.error(f"Graph _rag: Ошибка RAG-поиска: {e}")
             return {"rag_answer": f"Ошибка поиска в базе данных: {str(e)}"}
 
-    def _generate(self, state: State):
+    @traced("graph.generate")
+    async def _generate(self, state: State):
         """Генерирует ответ на основе RAG-результатов."""
         messages = state["messages"]
         rag_answer = state["rag_answer"]
@@ -144,6 +186,7 @@ class Graph:
                 - Если решений нет в инстанции - укажи "не вынесены на текущую дату"
                 - При множественных решениях - каждое отдельно в хронологии
                 - Учитывай возможность отмены/возврата дела на новое рассмотрение
+                - Тип документа, суд, инстанция и дата указаны в скобках после номера документа в контексте
                 - Используй ТОЛЬКО информацию из RAG-контекста
                 - Пиши простым языком без сложных конструкций
                 - Не используй markdown, только обычный текст с абзацами
@@ -157,11 +200,41 @@ class Graph:
         )
 
         analyze_case_chain = prompt | self.model.with_config({"temperature": 0.0})
-        response = analyze_case_chain.invoke({"messages": messages}, profanity_check=False)
+        with span("llm.generate") as llm_span:
+            response = await analyze_case_chain.ainvoke({"messages": messages}, profanity_check=False)
+            record_llm_usage("generate", response, llm_span)
+        answer = response.content.strip()
+
+        collection_name = state.get("collection_name")
+        if collection_name and answer:
+            try:
+                await run_blocking("io", get_answer_cache().store, collection_name, str(messages[-1].content), answer,
+                                   state.get("cache_generation"))
+            except Exception as e:
+                logging.warning(f"Graph _generate: Не удалось сохранить ответ в кэш: {e}")
 
-        return {"messages": response.content.strip()}
+        return {"messages": answer}
 
-    def _route_by_flag(self, state: State) -> Command[Literal["check_case", "rag"]]:
+    async def _cached_answer(self, state: State) -> Optional[str]:
+        collection_name = state.get("collection_name")
+        question = state["messages"][-1].content.strip()
+        cached_answer = await run_blocking("io", get_answer_cache().lookup, collection_name, question)
+        if cached_answer is not None:
+            logging.info("Ответ найден в кэше ответов")
+        return cached_answer
+
+    @traced("graph.route_by_cache")
+    async def _route_by_cache(self, state: State) -> Command[Literal["rag", "__end__"]]:
+        """Вход режима question: ответ из кэша или поиск по уже загруженной коллекции."""
+        if not state.get("collection_name"):
+            raise ValueError("Для режима question нужна загруженная коллекция")
+        cached_answer = await self._cached_answer(state)
+        if cached_answer is not None:
+            return Command(update={"messages": AIMessage(content=cached_answer)}, goto=END)
+        return Command(update={}, goto="rag")
+
+    @traced("graph.route_by_flag")
+    async def _route_by_flag(self, state: State) -> Command[Literal["check_case", "rag", "__end__"]]:
         """Маршрутизация: определяет, нужно ли загружать новое дело или использовать существующее."""
         flag = state.get("flag", False)
         current_collection = state.get("collection_name", "")
@@ -175,24 +248,14 @@ class Graph:
 
         # Если флаг установлен и есть коллекция - используем существующую
         if flag and current_collection:
+            cached_answer = await self._cached_answer(state)
+            if cached_answer is not None:
+                return Command(update={"messages": AIMessage(content=cached_answer)}, goto=END)
             logging.info("Используем существующую коллекцию")
             return Command(update={}, goto="rag")
         
-        # Проверяем, является ли ввод похожим на номер дела, ИНН или организацию
-        is_likely_new_case = False
-        
-        # Паттерны для определения нового дела
-        case_patterns = [
-            r'^\d{10}$',  # ИНН 10 цифр
-            r'^\d{12}$',  # ИНН 12 цифр
-            r'^[АA]\d+-\d+',  # Номер дела А40-123456
-            r'^[АA]\d+/\d+',  # Номер дела А40/123456
-        ]
-        
-        for pattern in case_patterns:
-            if re.match(pattern, last_message.upper()):
-                is_likely_new_case = True
-                break
+        # Проверяем, является ли ввод похожим на номер дела, ИНН или ОГРН
+        is_likely_new_case = classify(last_message).case_type != CaseType.ORGANIZATION
         
         # Если ввод похож на новое дело, загружаем
         if is_likely_new_case:
@@ -203,9 +266,27 @@ class Graph:
         logging.info("Загружаем новое дело")
         return Command(update={"flag": False, "collection_name": None}, goto="check_case")
 
-    def _build_graph(self, state: State):
+    def _build_graph(self, state: State, checkpointer, mode: str = "full"):
+        """Собирает граф режима mode; в режимах ingest и question только нужные им узлы."""
         workflow = StateGraph(state)
 
+        if mode == "ingest":
+            workflow.add_node("check_case", self._check_case)
+            workflow.add_node("search", self._search)
+            workflow.add_edge(START, "check_case")
+            workflow.add_edge("check_case", "search")
+            workflow.add_edge("search", END)
+            return workflow.compile(checkpointer=checkpointer)
+
+        if mode == "question":
+            workflow.add_node("route_by_cache", self._route_by_cache)
+            workflow.add_node("rag", self._rag)
+            workflow.add_node("generate", self._generate)
+            workflow.add_edge(START, "route_by_cache")
+            workflow.add_edge("rag", "generate")
+            workflow.add_edge("generate", END)
+            return workflow.compile(checkpointer=checkpointer)
+
         workflow.add_node("route_by_flag", self._route_by_flag)
         workflow.add_node("check_case", self._check_case)
         workflow.add_node("search", self._search)
@@ -220,18 +301,39 @@ class Graph:
 
         workflow.add_edge("generate", END)
 
-        return workflow.compile(checkpointer=self.memory)
+        return workflow.compile(checkpointer=checkpointer)
+
+    async def _get_graph(self, mode: str = "full"):
+        """Граф каждого режима компилируется один раз, когда хранилище чекпоинтов готово."""
+        if mode not in GRAPH_MODES:
+            raise ValueError(f"Неизвестный режим графа: {mode}")
+        async with self._graph_lock:
+            if mode not in self.graphs:
+                self.graphs[mode] = self._build_graph(State, await self.checkpoints.saver(), mode)
+        return self.graphs[mode]
+
+    @staticmethod
+    def _thread_id(chat_id, mode: str = "full") -> str:
+        # У каждого режима свой поток: графы разных режимов не делят чекпоинты
+        thread_id = f"chat-{chat_id}" if chat_id is not None else "default"
+        return thread_id if mode == "full" else f"{mode}-{thread_id}"
 
     def reset_state_for_chat(self, chat_id):
-        """Сбрасывает состояние графа для конкретного чата."""
-        import uuid
-        # Создаем новый thread_id для сброса состояния
-        new_thread_id = str(uuid.uuid4())
-        self.config = {"configurable": {"thread_id": new_thread_id}}
-        logging.info(f"Graph: Состояние сброшено для чата {chat_id}, новый thread_id: {new_thread_id}")
+        """Сбрасывает состояние графа для конкретного чата.
+
+        Поток чата удаляется из хранилища перед следующим запуском графа в этом чате.
+        """
+        thread_id = self._thread_id(chat_id)
+        self._pending_resets.update(self._thread_id(chat_id, mode) for mode in GRAPH_MODES)
+        logging.info(f"Graph: Состояние сброшено для чата {chat_id}, thread_id: {thread_id}")
+
+    def invoke(self, user_prompt, reset_state=False, existing_collection=None, chat_id=None, mode="full"):
+        """Синхронная обертка для консольного запуска; бот вызывает ainvoke напрямую."""
+        return asyncio.run(self.ainvoke(user_prompt, reset_state=reset_state,
+                                        existing_collection=existing_collection, chat_id=chat_id, mode=mode))
 
-    def invoke(self, user_prompt, reset_state=False, existing_collection=None):
-        save_graph_png(self.graph)
+    async def _prepare_run(self, user_prompt, reset_state, existing_collection, chat_id, mode="full"):
+        graph = await self._get_graph(mode)
 
         prompt = ChatPromptTemplate.from_messages(
             [
@@ -244,11 +346,15 @@ class Graph:
         message = message.to_messages()
         logging.info(f"Graph invoke: Сообщение: {message}")
 
-        # Если нужно сбросить состояние, создаем новый конфиг
+        # Разовый запуск с чистым состоянием идет в отдельном потоке, который удаляется после ответа
         if reset_state:
-            config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+            thread_id = f"oneoff-{uuid.uuid4()}"
         else:
-            config = self.config
+            thread_id = self._thread_id(chat_id, mode)
+            if thread_id in self._pending_resets:
+                self._pending_resets.discard(thread_id)
+                await self.checkpoints.delete_thread(thread_id)
+        config = {"configurable": {"thread_id": thread_id}}
 
         # Если передана существующая коллекция, инициализируем состояние с ней
         initial_state = {}
@@ -258,17 +364,91 @@ class Graph:
                 "flag": True  # Указываем, что документы уже загружены
             }
 
-        return self.graph.invoke(
-            {"messages": message, **initial_state},
-            config=config
-        )
+        return graph, {"messages": message, **initial_state}, config
 
-if __name__ == "__main__":
+    async def _finish_run(self, config, reset_state):
+        thread_id = config["configurable"]["thread_id"]
+        if reset_state:
+            await self.checkpoints.delete_thread(thread_id)
+        else:
+            await self.checkpoints.after_run(thread_id)
+
+    async def ainvoke(self, user_prompt, reset_state=False, existing_collection=None, chat_id=None, mode="full"):
+        """Запускает граф режима mode.
+
+        full - прежний конвейер с маршрутизацией; ingest - только определение дела и загрузка
+        документов (без RAG и генерации); question - только ответ по existing_collection.
+        """
+        with span("graph.run", mode=mode):
+            graph, inputs, config = await self._prepare_run(user_prompt, reset_state, existing_collection, chat_id, mode)
+            try:
+                return await graph.ainvoke(inputs, config=config)
+            finally:
+                await self._finish_run(config, reset_state)
+
+    async def aingest(self, case_input, on_progress=None):
+        """Загружает материалы дела без RAG и генерации; возвращает итоговое состояние
+        (тип дела, запрос, коллекция). on_progress получает прогресс задания очереди загрузки.
+        """
+        with span("graph.run", mode="ingest"):
+            graph, inputs, config = await self._prepare_run(case_input, True, None, None, "ingest")
+            config["configurable"]["on_progress"] = on_progress
+            try:
+                return await graph.ainvoke(inputs, config=config)
+            finally:
+                await self._finish_run(config, True)
+
+    async def astream_answer(self, user_prompt, reset_state=False, existing_collection=None, chat_id=None,
+                             mode="full"):
+        """Запускает граф и отдает токены ответа по мере генерации.
+
+        Выдает пары ("token", фрагмент) для узла generate и в конце ("answer", полный ответ).
+        Ответ из кэша приходит сразу как ("answer", ...), без токенов.
+        """
+        started = time.perf_counter()
+        graph, inputs, config = await self._prepare_run(user_prompt, reset_state, existing_collection, chat_id, mode)
+        graph_mode, final_state, status = mode, None, "error"
+        try:
+            async for mode, chunk in graph.astream(inputs, config=config, stream_mode=["messages", "values"]):
+                if mode == "messages":
+                    message, metadata = chunk
+                    # Токены других узлов (классификация, переформулировки вопроса) пользователю не нужны
+                    if metadata.get("langgraph_node") == "generate" and isinstance(message.content, str) and message.content:
+                        yield "token", message.content
+                else:
+                    final_state = chunk
+            status = "ok"
+        finally:
+            await self._finish_run(config, reset_state)
+            # Генератор отдает управление между токенами, поэтому span не держится открытым
+            record_span("graph.run", time.perf_counter() - started, status, mode=graph_mode, streamed=True)
+
+        if final_state is not None:
+            yield "answer", final_state["messages"][-1].content
+
+def export_diagrams(prefix: str = 'langgraph_workflow') -> None:
+    """Сохраняет схемы графов всех режимов (Mermaid PNG); не требует хранилища чекпоинтов."""
+    graph = Graph(model=object())
+    for mode in GRAPH_MODES:
+        filename = f"{prefix}.png" if mode == "full" else f"{prefix}_{mode}.png"
+        save_graph_png(graph._build_graph(State, None, mode), filename)
+
+async def _console():
     graph = Graph()
     user_input = input("Ваш текст: ")
     while user_input != "0":
-        logging.info(graph.invoke(user_input)["messages"][-1].content)
+        logging.info((await graph.ainvoke(user_input))["messages"][-1].content)
         logging.info("*"*50)
         user_input = input("Ваш текст: ")
 
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Консольный запуск графа")
+    cli.add_argument("--export-png", metavar="PREFIX", nargs="?", const="langgraph_workflow",
+                     help="Сохранить схемы графов в PNG и выйти")
+    args = cli.parse_args()
+    if args.export_png:
+        export_diagrams(args.export_png)
+    else:
+        asyncio.run(_console())
+
 #А40-312285
\ No newline at end of file
@@ -0,0 +1,103 @@
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Set, Tuple
+import hashlib
+import json
+import logging
+import os
+
+MANIFEST_DIR = os.getenv("INGEST_MANIFEST_DIR", "./chroma_db/manifests")
+
+
+def file_sha256(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class FileRecord:
+    size: int
+    mtime: float
+    sha256: str
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+class IngestManifest:
+    """Манифест коллекции: какие PDF уже проиндексированы и какие чанки из них получены."""
+
+    def __init__(self, collection_name: str, manifest_dir: str = MANIFEST_DIR) -> None:
+        self.collection_name = collection_name
+        self.path = os.path.join(manifest_dir, f"{collection_name}.json")
+        self.files: Dict[str, FileRecord] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            self.files = {name: FileRecord(**record) for name, record in raw.get("files", {}).items()}
+        except Exception as e:
+            # Испорченный манифест не должен ломать загрузку: просто переиндексируем все файлы
+            logging.warning(f'Не удалось прочитать манифест {self.path}: {e}. Манифест будет пересоздан')
+            self.files = {}
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {"collection": self.collection_name,
+                 "files": {name: asdict(record) for name, record in self.files.items()}},
+                f, ensure_ascii=False
+            )
+        os.replace(tmp_path, self.path)
+
+    def plan(self, filepaths: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Возвращает (новые или измененные файлы, имена удаленных файлов).
+
+        Хеш содержимого считается только если изменились размер или mtime.
+        """
+        changed = []
+        present = set()
+        for filepath in filepaths:
+            name = os.path.basename(filepath)
+            present.add(name)
+            stat = os.stat(filepath)
+            record = self.files.get(name)
+            if record and record.size == stat.st_size and record.mtime == stat.st_mtime:
+                continue
+            if record and record.size == stat.st_size and record.sha256 == file_sha256(filepath):
+                # Файл перезаписан тем же содержимым (например, повторно скачан)
+                record.mtime = stat.st_mtime
+                continue
+            changed.append(filepath)
+
+        removed = [name for name in self.files if name not in present]
+        return changed, removed
+
+    def record(self, filepath: str, chunk_ids: List[str]) -> None:
+        stat = os.stat(filepath)
+        self.files[os.path.basename(filepath)] = FileRecord(
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            sha256=file_sha256(filepath),
+            chunk_ids=list(dict.fromkeys(chunk_ids))
+        )
+
+    def forget(self, name: str) -> None:
+        self.files.pop(name, None)
+
+    def chunk_ids_of(self, names: Iterable[str]) -> Set[str]:
+        ids: Set[str] = set()
+        for name in names:
+            record = self.files.get(name)
+            if record:
+                ids.update(record.chunk_ids)
+        return ids
+
+    def referenced_chunk_ids(self) -> Set[str]:
+        return self.chunk_ids_of(self.files.keys())
@@ -0,0 +1,242 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from executors import run_blocking
+from metrics import counter, gauge, histogram
+from tracing import get_correlation_id, set_correlation_id, span
+from vec_database import chroma_database
+
+INGEST_MAX_CONCURRENT = int(os.getenv("INGEST_MAX_CONCURRENT", "2"))
+INGEST_QUEUE_PATH = os.getenv("INGEST_QUEUE_PATH", "./chroma_db/ingest_queue.json")
+
+INGEST_JOBS = counter("ingest_jobs_total", "Задания на загрузку дел по результату")
+INGEST_COALESCED = counter("ingest_jobs_coalesced_total", "Запросы на загрузку, присоединенные к уже идущему заданию")
+INGEST_JOB_SECONDS = histogram("ingest_job_seconds", "Длительность загрузки дела от старта до конца")
+INGEST_QUEUE_WAIT = histogram("ingest_queue_wait_seconds", "Ожидание задания в очереди загрузки")
+
+
+@dataclass
+class IngestJob:
+    collection_name: str
+    case_query: str
+    case_type: str
+    status: str = "queued"  # queued, running, done, failed, cancelled
+    stage: str = "queue"  # queue, search, index
+    position: int = 0  # Место в очереди, 0 - задание уже выполняется
+    done: int = 0
+    total: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    # Апдейт, создавший задание: задача может стартовать из контекста другого задания
+    correlation_id: Optional[str] = field(default_factory=get_correlation_id)
+
+    @property
+    def pdf_dir(self) -> str:
+        return os.path.join(os.path.abspath("pdfs"), self.collection_name)
+
+    def to_record(self) -> Dict:
+        return {"collection_name": self.collection_name, "case_query": self.case_query,
+                "case_type": self.case_type, "created_at": self.created_at}
+
+
+ProgressCallback = Callable[[IngestJob], Awaitable[None]]
+
+
+def download_case(job: IngestJob) -> None:
+    """Скачивает PDF дела в pdfs/<коллекция> (блокирующий Selenium)."""
+    # Selenium загружается при первой загрузке дела, а не при старте бота
+    from parser import download_by_query
+
+    os.makedirs(job.pdf_dir, exist_ok=True)
+    logging.info(f"Загружаю документы для {job.case_type}: {job.case_query} в коллекцию {job.collection_name}")
+    download_by_query(query=job.case_query, output_folder=job.pdf_dir, choose_case=job.case_type)
+
+
+class IngestScheduler:
+    """Очередь загрузки дел.
+
+    Одновременные запросы на одну коллекцию объединяются в одно задание, которое
+    ждут все вызывающие. Выполняется не больше max_concurrent заданий сразу,
+    незавершенные задания сохраняются на диск и продолжаются после перезапуска.
+    """
+
+    def __init__(self, max_concurrent: int = INGEST_MAX_CONCURRENT, path: str = INGEST_QUEUE_PATH) -> None:
+        self.max_concurrent = max(1, max_concurrent)
+        self.path = path
+        self._jobs: Dict[str, IngestJob] = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._listeners: Dict[str, List[ProgressCallback]] = {}
+        self._pending: Deque[str] = deque()
+        self._running: Dict[str, asyncio.Task] = {}
+        # Записи заданий, прерванных отменой задачи (остановка бота): остаются на диске до resume()
+        self._interrupted: Dict[str, Dict] = {}
+
+        gauge("ingest_queue_pending", "Задания, ожидающие в очереди загрузки").set_function(lambda: len(self._pending))
+        gauge("ingest_queue_running", "Задания загрузки, выполняемые сейчас").set_function(lambda: len(self._running))
+
+    def active_job(self, collection_name: str) -> Optional[IngestJob]:
+        return self._jobs.get(collection_name)
+
+    def submit(self, collection_name: str, case_query: str, case_type: str,
+               on_progress: Optional[ProgressCallback] = None) -> "asyncio.Future[IngestJob]":
+        """Ставит загрузку коллекции в очередь или присоединяется к уже идущей."""
+        if on_progress is not None:
+            self._listeners.setdefault(collection_name, []).append(on_progress)
+
+        future = self._futures.get(collection_name)
+        if future is not None:
+            INGEST_COALESCED.inc()
+            logging.info(f"Очередь загрузки: запрос на {collection_name} присоединен к текущему заданию")
+            job = self._jobs[collection_name]
+            if on_progress is not None:
+                asyncio.get_running_loop().create_task(self._notify_one(on_progress, job))
+            return future
+
+        job = IngestJob(collection_name=collection_name, case_query=case_query, case_type=case_type)
+        self._jobs[collection_name] = job
+        self._futures[collection_name] = asyncio.get_running_loop().create_future()
+        self._pending.append(collection_name)
+        self._save()
+        logging.info(f"Очередь загрузки: задание {collection_name} добавлено, в очереди {len(self._pending)}")
+        self._dispatch()
+        return self._futures[collection_name]
+
+    async def run(self, collection_name: str, case_query: str, case_type: str,
+                  on_progress: Optional[ProgressCallback] = None) -> IngestJob:
+        """submit и ожидание результата; ошибка задания пробрасывается каждому ожидающему."""
+        return await asyncio.shield(self.submit(collection_name, case_query, case_type, on_progress))
+
+    async def resume(self) -> None:
+        """Продолжает задания, не завершенные до перезапуска."""
+        for record in self._load():
+            if record["collection_name"] in self._jobs:
+                continue
+            logging.info(f"Очередь загрузки: продолжаю задание {record['collection_name']} после перезапуска")
+            future = self.submit(record["collection_name"], record["case_query"], record["case_type"])
+            # Результат восстановленного задания никто не ждет, ошибку только логируем
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._pending and len(self._running) < self.max_concurrent:
+            collection_name = self._pending.popleft()
+            self._running[collection_name] = loop.create_task(self._execute(self._jobs[collection_name]))
+        for position, collection_name in enumerate(self._pending, start=1):
+            job = self._jobs[collection_name]
+            if job.position != position:
+                job.position = position
+                loop.create_task(self._notify(job))
+
+    async def _execute(self, job: IngestJob) -> None:
+        loop = asyncio.get_running_loop()
+        if job.correlation_id:
+            set_correlation_id(job.correlation_id)
+        started = time.time()
+        INGEST_QUEUE_WAIT.observe(started - job.created_at)
+        job.status, job.position = "running", 0
+
+        def report(stage: str, done: int = 0, total: int = 0) -> None:
+            # Вызывается из рабочих потоков, состояние задания меняем в потоке event loop
+            loop.call_soon_threadsafe(self._update, job, stage, done, total)
+
+        future = self._futures[job.collection_name]
+        try:
+            self._update(job, "search")
+            with span("ingest.search", collection=job.collection_name):
+                await run_blocking("selenium", download_case, job)
+            self._update(job, "index")
+            with span("ingest.index", collection=job.collection_name):
+                await run_blocking(
+                    "ingest", chroma_database, pdf_directory=job.pdf_dir, collection_name=job.collection_name,
+                    progress=lambda done, total: report("index", done, total)
+                )
+            job.status = "done"
+            INGEST_JOBS.inc(result="done")
+            future.set_result(job)
+        except Exception as e:
+            logging.exception(f"Очередь загрузки: задание {job.collection_name} завершилось ошибкой")
+            job.status, job.error = "failed", str(e)
+            INGEST_JOBS.inc(result="failed")
+            future.set_exception(e)
+        except asyncio.CancelledError:
+            # Задачу отменили (обычно при остановке бота): ожидающие получают отмену, а не висят,
+            # запись задания остается в сохраненной очереди, и resume() начнет его заново
+            logging.warning(f"Очередь загрузки: задание {job.collection_name} прервано на этапе {job.stage}")
+            job.status = "cancelled"
+            self._interrupted[job.collection_name] = job.to_record()
+            INGEST_JOBS.inc(result="cancelled")
+            future.cancel()
+            raise
+        finally:
+            INGEST_JOB_SECONDS.observe(time.time() - started)
+            logging.info(
+                f"Очередь загрузки: задание {job.collection_name} {job.status} за {time.time() - started:.1f}s"
+            )
+            cancelled = job.status == "cancelled"
+            if not cancelled:
+                self._interrupted.pop(job.collection_name, None)
+            # Задание убираем до уведомления: submit, пришедший во время await, начнет новое,
+            # а не присоединится к завершенному future
+            self._jobs.pop(job.collection_name, None)
+            self._futures.pop(job.collection_name, None)
+            listeners = self._listeners.pop(job.collection_name, [])
+            self._running.pop(job.collection_name, None)
+            self._save()
+            # При остановке новые задания не запускаем: они дождутся resume() после перезапуска
+            if not cancelled:
+                self._dispatch()
+                for callback in listeners:
+                    await self._notify_one(callback, job)
+
+    def _update(self, job: IngestJob, stage: str, done: int = 0, total: int = 0) -> None:
+        job.stage, job.done, job.total = stage, done, total
+        asyncio.get_running_loop().create_task(self._notify(job))
+
+    async def _notify(self, job: IngestJob) -> None:
+        for callback in list(self._listeners.get(job.collection_name, [])):
+            await self._notify_one(callback, job)
+
+    async def _notify_one(self, callback: ProgressCallback, job: IngestJob) -> None:
+        try:
+            await callback(job)
+        except Exception as e:
+            logging.warning(f"Очередь загрузки: не удалось сообщить о прогрессе {job.collection_name}: {e}")
+
+    def _load(self) -> List[Dict]:
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f).get("jobs", [])
+        except (OSError, ValueError) as e:
+            logging.warning(f"Очередь загрузки: не удалось прочитать {self.path}: {e}")
+            return []
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            records = {name: job.to_record() for name, job in self._jobs.items()}
+            for name, record in self._interrupted.items():
+                records.setdefault(name, record)
+            json.dump({"jobs": list(records.values())}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+_scheduler: Optional[IngestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_ingest_scheduler() -> IngestScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = IngestScheduler()
+        return _scheduler
@@ -0,0 +1,202 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "./chroma_db/lexical")
+# Параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Слова длиннее обрезаются до этой длины: грубый стемминг для русских окончаний
+STEM_LENGTH = 6
+# Термы, встречающиеся больше чем в этой доле чанков, почти не влияют на BM25 и только
+# замедляют поиск: они учитываются, лишь если в запросе нет более редких термов
+COMMON_TERM_RATIO = 0.5
+
+_TOKEN_RE = re.compile(r'[0-9a-zа-яё]+(?:[-/.,][0-9a-zа-яё]+)*')
+_STOPWORDS = {
+    "и", "в", "во", "не", "на", "по", "с", "со", "о", "об", "от", "к", "ко", "а", "но", "за", "из", "у",
+    "для", "что", "как", "это", "так", "же", "ли", "или", "при", "до", "его", "ее", "их", "был", "была",
+    "было", "были", "быть", "есть", "какой", "какое", "какая", "какие", "кто", "где", "когда",
+}
+
+
+def _normalize(token: str) -> str:
+    token = token.replace('ё', 'е')
+    # Латинская «a» в номерах дел (A40-...) приводится к кириллической
+    if token[0] == 'a' and len(token) > 1 and token[1].isdigit():
+        token = 'а' + token[1:]
+    return token
+
+
+def _raw_tokens(text: str) -> List[str]:
+    return [_normalize(match) for match in _TOKEN_RE.findall(text.lower())]
+
+
+def _is_identifier(token: str) -> bool:
+    return any(ch.isdigit() for ch in token)
+
+
+def identifier_tokens(text: str) -> Set[str]:
+    """Идентификаторы текста целиком: номера дел и договоров, ИНН, ОГРН, суммы, даты."""
+    return {token for token in _raw_tokens(text) if _is_identifier(token)}
+
+
+def tokenize(text: str) -> List[str]:
+    """Термы для индекса: идентификаторы (номера дел, ИНН, суммы, даты, статьи) остаются
+    целиком и дополнительно разбиваются на части, слова обрезаются до STEM_LENGTH.
+    """
+    terms = []
+    for token in _raw_tokens(text):
+        if _is_identifier(token):
+            terms.append(token)
+            parts = re.split(r'[-/.,]', token)
+            if len(parts) > 1:
+                terms.extend(part for part in parts if part)
+            continue
+        for word in re.split(r'[-/.,]', token):
+            if len(word) < 2 or word in _STOPWORDS:
+                continue
+            terms.append(word[:STEM_LENGTH])
+    return terms
+
+
+def is_identifier_query(text: str) -> bool:
+    """Запрос состоит в основном из идентификаторов (номер дела, ИНН, ОГРН, дата, сумма)."""
+    identifiers, words = 0, 0
+    for token in _raw_tokens(text):
+        if _is_identifier(token):
+            identifiers += 1
+        elif token not in _STOPWORDS and len(token) > 1:
+            words += 1
+    return identifiers > 0 and identifiers >= words
+
+
+class LexicalIndex:
+    """Инвертированный индекс BM25 для одной коллекции, с теми же id чанков, что и в Chroma.
+
+    На диске хранятся термы каждого чанка, постинги строятся при загрузке.
+    """
+
+    def __init__(self, collection_name: str, index_dir: str = LEXICAL_INDEX_DIR) -> None:
+        self.collection_name = collection_name
+        self.path = os.path.join(index_dir, f"{collection_name}.json")
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+        self.dirty = False
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except Exception as e:
+            logging.warning(f'Не удалось прочитать лексический индекс {self.path}: {e}. Индекс будет пересоздан')
+            return
+        for chunk_id, terms in raw.get("docs", {}).items():
+            self._insert(chunk_id, terms)
+
+    def save(self) -> None:
+        with self._lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"collection": self.collection_name, "docs": self._doc_terms}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def _insert(self, chunk_id: str, terms: Dict[str, int]) -> None:
+        self._doc_terms[chunk_id] = terms
+        self._lengths[chunk_id] = sum(terms.values())
+        self._total_length += self._lengths[chunk_id]
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[chunk_id] = frequency
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]) -> None:
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id in self._doc_terms:
+                    continue
+                self._insert(chunk_id, dict(Counter(tokenize(text))))
+                self.dirty = True
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for chunk_id in ids:
+                terms = self._doc_terms.pop(chunk_id, None)
+                if terms is None:
+                    continue
+                self._total_length -= self._lengths.pop(chunk_id)
+                for term in terms:
+                    posting = self._postings.get(term)
+                    if posting is not None:
+                        posting.pop(chunk_id, None)
+                        if not posting:
+                            del self._postings[term]
+                self.dirty = True
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Лучшие k чанков по BM25: список (id, score) по убыванию score."""
+        terms = set(tokenize(query))
+        with self._lock:
+            total = len(self._doc_terms)
+            if not total or not terms or not self._total_length:
+                return []
+            average_length = self._total_length / total
+            postings = [self._postings[term] for term in terms if term in self._postings]
+            postings = [p for p in postings if len(p) <= total * COMMON_TERM_RATIO] or postings
+            scores: Dict[str, float] = {}
+            for posting in postings:
+                idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, frequency in posting.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+    def rebuild(self, collection, page_size: int = 1000, where: Optional[Dict] = None) -> None:
+        """Пересобирает индекс по документам коллекции Chroma (без эмбеддингов); where - фильтр представления."""
+        started = time.perf_counter()
+        with self._lock:
+            self._doc_terms, self._postings, self._lengths, self._total_length = {}, {}, {}, 0
+            offset = 0
+            while True:
+                page = collection.get(where=where, include=["documents"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                self.add(page["ids"], page["documents"])
+                offset += len(page["ids"])
+            self.dirty = True
+            self.save()
+        logging.info(
+            f'Лексический индекс {self.collection_name} пересобран: {len(self)} чанков '
+            f'за {time.perf_counter() - started:.2f}s'
+        )
+
+
+_indexes: Dict[str, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_lexical_index(collection_name: str) -> LexicalIndex:
+    with _indexes_lock:
+        index = _indexes.get(collection_name)
+        if index is None:
+            index = LexicalIndex(collection_name)
+            _indexes[collection_name] = index
+        return index
@@ -0,0 +1,259 @@
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+
+from lexical_index import identifier_tokens, tokenize
+
+# Сигнатуры и ссылки «копия -> оригинал» пишутся в SQLite по мере загрузки, а не целым файлом
+NEAR_DUP_DB = os.getenv("NEAR_DUP_DB", "./chroma_db/near_dup.sqlite")
+# Порог оценки сходства Жаккара по MinHash, начиная с которого чанк считается копией; 0 - не искать
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.9"))
+# Шинглы - тройки подряд идущих термов lexical_index.tokenize (регистр, «ё» и окончания уже нормализованы)
+SHINGLE_SIZE = 3
+# Длина сигнатуры и разбиение на полосы LSH: при сходстве 0.9 кандидат находится почти наверняка,
+# при 0.5 - примерно в половине случаев, а точное решение принимает сравнение сигнатур
+SIGNATURE_SIZE = 64
+LSH_BANDS = 16
+_ROWS = SIGNATURE_SIZE // LSH_BANDS
+_MAX_HASH = (1 << 64) - 1
+
+
+def _shingles(text: str) -> Set[str]:
+    terms = tokenize(text)
+    if len(terms) <= SHINGLE_SIZE:
+        return {" ".join(terms)} if terms else set()
+    return {" ".join(terms[i:i + SHINGLE_SIZE]) for i in range(len(terms) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text: str) -> Optional[List[int]]:
+    """MinHash с одной хеш-функцией (one permutation hashing) и заполнением пустых корзин.
+
+    Каждый шингл хешируется один раз: младшие биты выбирают корзину, в корзине
+    остается минимум. Пустые корзины берут значение следующей непустой, поэтому
+    короткие тексты сравниваются так же, как длинные. None - в тексте нет термов.
+    """
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+    bins = [_MAX_HASH] * SIGNATURE_SIZE
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        index = value % SIGNATURE_SIZE
+        if value < bins[index]:
+            bins[index] = value
+    filled = [i for i, value in enumerate(bins) if value != _MAX_HASH]
+    for i in range(SIGNATURE_SIZE):
+        if bins[i] == _MAX_HASH:
+            donor = next((j for j in filled if j > i), filled[0])
+            # Сдвиг по расстоянию до корзины-донора, чтобы заполненные корзины не совпадали у разных текстов случайно
+            bins[i] = (bins[donor] + (donor - i) % SIGNATURE_SIZE) & _MAX_HASH
+    return bins
+
+
+def similarity(left: List[int], right: List[int]) -> float:
+    """Оценка сходства Жаккара множеств шинглов по двум сигнатурам."""
+    return sum(1 for a, b in zip(left, right) if a == b) / SIGNATURE_SIZE
+
+
+def _identifiers(text: str) -> str:
+    return " ".join(sorted(identifier_tokens(text)))
+
+
+def _band_keys(signature: List[int]) -> List[int]:
+    """Ключи полос LSH: номер полосы и ее значения, свернутые в одно целое для индекса SQLite."""
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = array('Q', [band] + signature[band * _ROWS:(band + 1) * _ROWS]).tobytes()
+        keys.append(int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), 'little', signed=True))
+    return keys
+
+
+def _pack(signature: List[int]) -> bytes:
+    return array('Q', signature).tobytes()
+
+
+def _unpack(blob: bytes) -> List[int]:
+    signature = array('Q')
+    signature.frombytes(blob)
+    return signature.tolist()
+
+
+class NearDuplicateIndex:
+    """Сигнатуры MinHash чанков одного представления и ссылки «копия -> оригинал».
+
+    Ловит то, что не ловит md5 в generate_id: тот же акт в полном тексте и в
+    резолютивной части, повторные публикации под другими именами файлов,
+    различия в переносах и пробелах. Копия не получает эмбеддинг и не попадает
+    в Chroma; манифест коллекции ссылается вместо нее на оригинал.
+
+    Индекс живет в SQLite: при старте ничего не загружается в память, кандидаты
+    ищутся по полосам LSH запросом, а каждая загрузка дописывает только свои чанки.
+
+    Копией считается только чанк с теми же идентификаторами (номера дел и договоров,
+    ИНН, ОГРН, суммы, даты), что и у оригинала: решения по разным делам часто
+    отличаются лишь ими и по сигнатуре неотличимы.
+    """
+
+    def __init__(self, collection_name: str, path: str = NEAR_DUP_DB,
+                 threshold: float = NEAR_DUP_THRESHOLD) -> None:
+        self.collection_name = collection_name
+        self.path = path
+        self.threshold = threshold
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                collection TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                identifiers TEXT,
+                PRIMARY KEY (collection, chunk_id)
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                collection TEXT NOT NULL,
+                band_key INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (collection, band_key, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_bands_chunk ON bands(collection, chunk_id);
+            CREATE TABLE IF NOT EXISTS aliases (
+                collection TEXT NOT NULL,
+                alias TEXT NOT NULL,
+                original TEXT NOT NULL,
+                PRIMARY KEY (collection, alias)
+            );
+            CREATE INDEX IF NOT EXISTS idx_aliases_original ON aliases(collection, original);
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(signatures)")}
+        if "identifiers" not in columns:
+            # У сигнатур, записанных до проверки идентификаторов, столбец остается NULL:
+            # такие чанки больше не служат оригиналами для новых копий
+            self._conn.execute("ALTER TABLE signatures ADD COLUMN identifiers TEXT")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM signatures WHERE collection = ?", (self.collection_name,)
+            ).fetchone()[0]
+
+    def _select(self, sql: str, column: str, ids: List[str]) -> List[Tuple]:
+        """Строки таблицы по списку id; SQLite ограничивает число параметров, поэтому идем пачками."""
+        rows: List[Tuple] = []
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows.extend(self._conn.execute(
+                f"{sql} WHERE collection = ? AND {column} IN ({placeholders})", [self.collection_name] + part
+            ).fetchall())
+        return rows
+
+    def _insert(self, chunk_id: str, signature: List[int], identifiers: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO signatures (collection, chunk_id, signature, identifiers) "
+                           "VALUES (?, ?, ?, ?)", (self.collection_name, chunk_id, _pack(signature), identifiers))
+        self._conn.executemany("INSERT OR IGNORE INTO bands (collection, band_key, chunk_id) VALUES (?, ?, ?)",
+                               [(self.collection_name, key, chunk_id) for key in _band_keys(signature)])
+
+    def _find(self, signature: List[int], identifiers: str) -> Optional[Tuple[str, float]]:
+        keys = _band_keys(signature)
+        placeholders = ",".join("?" * len(keys))
+        candidates = self._conn.execute(
+            f"SELECT s.chunk_id, s.signature FROM signatures s WHERE s.collection = ? AND s.identifiers = ? "
+            f"AND s.chunk_id IN (SELECT chunk_id FROM bands WHERE collection = ? AND band_key IN ({placeholders}))",
+            [self.collection_name, identifiers, self.collection_name] + keys
+        ).fetchall()
+        best: Optional[Tuple[str, float]] = None
+        for candidate, blob in candidates:
+            score = similarity(signature, _unpack(blob))
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (candidate, score)
+        return best
+
+    def canonical(self, chunk_id: str) -> str:
+        """id чанка, который хранится в Chroma вместо данного (сам id, если он не копия)."""
+        with self._lock:
+            row = self._conn.execute("SELECT original FROM aliases WHERE collection = ? AND alias = ?",
+                                     (self.collection_name, chunk_id)).fetchone()
+        return row[0] if row else chunk_id
+
+    def filter(self, ids: List[str], texts: List[str]) -> Tuple[List[int], Dict[str, str]]:
+        """Разбирает новые чанки: (позиции оригиналов, {id копии: id оригинала}).
+
+        Оригиналы сразу попадают в индекс, поэтому копии внутри одной порции тоже находятся.
+        """
+        keep: List[int] = []
+        skipped: Dict[str, str] = {}
+        with self._lock:
+            aliases = dict(self._select("SELECT alias, original FROM aliases", "alias", list(ids)))
+            known = {row[0] for row in self._select("SELECT chunk_id FROM signatures", "chunk_id", list(ids))}
+            for position, (chunk_id, text) in enumerate(zip(ids, texts)):
+                if chunk_id in aliases:
+                    skipped[chunk_id] = aliases[chunk_id]
+                    continue
+                if chunk_id in known:
+                    keep.append(position)
+                    continue
+                signature = minhash(text)
+                identifiers = _identifiers(text)
+                match = self._find(signature, identifiers) if signature is not None else None
+                if match is not None:
+                    self._conn.execute("INSERT OR REPLACE INTO aliases (collection, alias, original) VALUES (?, ?, ?)",
+                                       (self.collection_name, chunk_id, match[0]))
+                    aliases[chunk_id] = match[0]
+                    skipped[chunk_id] = match[0]
+                else:
+                    keep.append(position)
+                    if signature is not None:
+                        self._insert(chunk_id, signature, identifiers)
+                        known.add(chunk_id)
+            self._conn.commit()
+        return keep, skipped
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]) -> None:
+        """Запоминает сигнатуры уже хранящихся чанков без поиска копий (перенос и пересборка индекса)."""
+        pairs = list(zip(ids, texts))
+        with self._lock:
+            known = {row[0] for row in self._select("SELECT chunk_id FROM signatures", "chunk_id",
+                                                    [chunk_id for chunk_id, _ in pairs])}
+            for chunk_id, text in pairs:
+                if chunk_id in known:
+                    continue
+                signature = minhash(text)
+                if signature is not None:
+                    self._insert(chunk_id, signature, _identifiers(text))
+                    known.add(chunk_id)
+            self._conn.commit()
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """Забывает чанки, удаленные из коллекции, и ссылки на них."""
+        removed = list(dict.fromkeys(ids))
+        with self._lock:
+            for i in range(0, len(removed), 500):
+                part = removed[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                params = [self.collection_name] + part
+                self._conn.execute(f"DELETE FROM signatures WHERE collection = ? AND chunk_id IN ({placeholders})", params)
+                self._conn.execute(f"DELETE FROM bands WHERE collection = ? AND chunk_id IN ({placeholders})", params)
+                self._conn.execute(f"DELETE FROM aliases WHERE collection = ? AND alias IN ({placeholders})", params)
+                self._conn.execute(f"DELETE FROM aliases WHERE collection = ? AND original IN ({placeholders})", params)
+            self._conn.commit()
+
+
+_indexes: Dict[str, NearDuplicateIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_near_duplicate_index(collection_name: str) -> NearDuplicateIndex:
+    with _indexes_lock:
+        index = _indexes.get(collection_name)
+        if index is None:
+            index = NearDuplicateIndex(collection_name)
+            _indexes[collection_name] = index
+        return index
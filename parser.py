@@ -10,9 +10,17 @@ import logging
 from urllib.parse import unquote, urlparse
 from datetime import datetime, timedelta
 
-def download_by_query(query, output_folder="pdfs", choose_case="Номер дела"):
-    download_dir = os.path.abspath(output_folder)
-    os.makedirs(download_dir, exist_ok=True)
+from pdf_downloader import download_pdfs, session_from_driver
+from driver_pool import get_driver_pool
+from search_cache import get_search_cache
+from tracing import record_span, span
+
+# Адрес сайта поиска; бенчмарки подставляют локальную заглушку
+ARBITR_URL = os.getenv("ARBITR_URL", "https://ras.arbitr.ru/")
+
+def build_chrome_options(download_dir=None):
+    """Опции Chromium для работы в Docker; папку загрузок пул переключает для каждой задачи."""
+    download_dir = download_dir or os.path.abspath("pdfs")
 
     chrome_options = Options()
     chrome_options.add_argument("--window-size=1920,1080")  # Устанавливает размер окна браузера
@@ -58,26 +66,82 @@ def download_by_query(query, output_folder="pdfs", choose_case="Номер де
     chrome_options.add_argument("--allow-running-insecure-content")
     chrome_options.add_argument("--remote-debugging-port=0")
 
-    driver = webdriver.Chrome(options=chrome_options)
+    return chrome_options
+
+
+def create_driver():
+    return webdriver.Chrome(options=build_chrome_options())
+
+
+def search_window():
+    """Окно поиска: последние три года, с точностью до дня."""
+    date_to = datetime.now()
+    date_from = date_to - timedelta(days=3*365)
+    return date_from.strftime('%d.%m.%Y'), date_to.strftime('%d.%m.%Y')
+
+
+def download_by_query(query, output_folder="pdfs", choose_case="Номер дела"):
+    download_dir = os.path.abspath(output_folder)
+    os.makedirs(download_dir, exist_ok=True)
+
+    date_from_str, date_to_str = search_window()
+    search_cache = get_search_cache()
+
+    # Свежая выдача в кэше: браузер не нужен, файлы качаем напрямую
+    documents = search_cache.get(query, choose_case, date_from_str, date_to_str)
+    if documents is not None:
+        with span("pdf.download", files=len(documents), cached_search=True) as download_span:
+            results = download_pdfs([(doc["download_url"], doc["file_name"]) for doc in documents], download_dir)
+            failed = {name: error for name, error in results.items() if error}
+            download_span.set(failed=len(failed))
+        if not failed:
+            return
+        # Без cookies и User-Agent браузера сайт может отдать HTML вместо PDF. Выдачу из кэша
+        # больше не используем и повторяем поиск в браузере; уже скачанные файлы пропустятся
+        logging.warning(
+            f"Кэш поиска: не скачано {len(failed)} из {len(results)} PDF без браузерной сессии "
+            f"(например, {next(iter(failed))}: {next(iter(failed.values()))}). Повторяю поиск в браузере"
+        )
+        search_cache.invalidate(query, choose_case, date_from_str, date_to_str)
+
+    with get_driver_pool().driver(download_dir) as driver:
+        started = time.perf_counter()
+        with span("selenium.search") as search_span:
+            documents = _search(driver, query, choose_case, date_from_str, date_to_str)
+            search_span.set(documents=len(documents) if documents is not None else None)
+        if documents is None:
+            return
+        search_cache.put(query, choose_case, date_from_str, date_to_str, documents,
+                         search_seconds=time.perf_counter() - started)
+
+        if documents:
+            # Скачиваем напрямую по HTTP с cookies браузерной сессии, без вкладок и ожидания
+            with span("pdf.download", files=len(documents), cached_search=False):
+                download_pdfs([(doc["download_url"], doc["file_name"]) for doc in documents], download_dir,
+                              session=session_from_driver(driver))
+
 
+def _search(driver, query, choose_case, date_from_str, date_to_str):
+    """Выполняет поиск на ras.arbitr.ru и разбирает выдачу.
+
+    Возвращает список документов (download_url, file_name и метаданные)
+    или None, если поиск не удался и кэшировать нечего.
+    """
     try:
-        driver.get("https://ras.arbitr.ru/")
+        with span("selenium.open_form"):
+            driver.get(ARBITR_URL)
 
-        if choose_case.strip().lower() in ["инн", "организация"]:
-            txt = WebDriverWait(driver, 15).until(
-                EC.visibility_of_element_located((By.CSS_SELECTOR, "textarea[placeholder='название, ИНН или ОГРН']"))
-            )
-        else:
-            txt = WebDriverWait(driver, 15).until(
-                EC.visibility_of_element_located((By.CSS_SELECTOR, "input[placeholder='например, А50-5568/08']"))
-            )
+            if choose_case.strip().lower() in ["инн", "огрн", "организация"]:
+                txt = WebDriverWait(driver, 15).until(
+                    EC.visibility_of_element_located((By.CSS_SELECTOR, "textarea[placeholder='название, ИНН или ОГРН']"))
+                )
+            else:
+                txt = WebDriverWait(driver, 15).until(
+                    EC.visibility_of_element_located((By.CSS_SELECTOR, "input[placeholder='например, А50-5568/08']"))
+                )
         txt.clear()
         txt.send_keys(query)
 
-        date_to = datetime.now()
-        date_from = date_to - timedelta(days=3*365)
-        date_from_str = date_from.strftime('%d.%m.%Y')
-        date_to_str = date_to.strftime('%d.%m.%Y')
         date_inputs = driver.find_elements(By.CSS_SELECTOR, "#sug-dates input[placeholder='дд.мм.гггг']")
         if len(date_inputs) >= 2:
             driver.execute_script("arguments[0].value = arguments[1];", date_inputs[0], date_from_str)
@@ -94,9 +158,10 @@ def download_by_query(query, output_folder="pdfs", choose_case="Номер де
 
         # Ждем появления результатов поиска
         try:
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "ul.b-document-list"))
-            )
+            with span("selenium.wait_results"):
+                WebDriverWait(driver, 30).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, "ul.b-document-list"))
+                )
             logging.info("Найдены результаты поиска")
             
             # Проверяем, есть ли сообщение об отсутствии результатов
@@ -104,7 +169,7 @@ def download_by_query(query, output_folder="pdfs", choose_case="Номер де
                 no_results = driver.find_element(By.CSS_SELECTOR, ".b-no-results")
                 if no_results:
                     logging.info("Найдено сообщение об отсутствии результатов")
-                    return
+                    return []
             except:
                 pass
                 
@@ -113,14 +178,15 @@ def download_by_query(query, output_folder="pdfs", choose_case="Номер де
             # Сохраняем скриншот для отладки
             driver.save_screenshot("search_error.png")
             logging.info("Сохранен скриншот ошибки: search_error.png")
-            return
+            return None
 
         time.sleep(3)
         
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
         time.sleep(1)
 
-        pdf_links = []
+        parse_started = time.perf_counter()
+        documents = []
         doc_items = driver.find_elements(By.CSS_SELECTOR, "ul.b-document-list > li")
         logging.info(f"Найдено элементов списка документов: {len(doc_items)}")
         
@@ -160,11 +226,15 @@ def download_by_query(query, output_folder="pdfs", choose_case="Номер де
                 parsed_url = urlparse(pdf_url)
                 file_name = unquote(os.path.basename(parsed_url.path))
 
+                try:
+                    case_num = item.find_element(By.CSS_SELECTOR, "div.case a.b-a-blue").text.strip()
+                except:
+                    case_num = ""
+
                 if not file_name or '.' not in file_name:
-                    try:
-                        case_num = item.find_element(By.CSS_SELECTOR, "div.case a.b-a-blue").text.strip()
+                    if case_num:
                         file_name = f"{case_num}.pdf"
-                    except:
+                    else:
                         file_name = f"document_{int(time.time())}.pdf"
 
                 elif not file_name.lower().endswith('.pdf'):
@@ -173,63 +243,26 @@ def download_by_query(query, output_folder="pdfs", choose_case="Номер де
                 file_name = re.sub(r'[\\/*?:"<>|]', "_", file_name)
                 file_name = re.sub(r'\s+', '_', file_name)
                 
-                pdf_links.append((download_url, file_name))
+                documents.append({
+                    "download_url": download_url,
+                    "file_name": file_name,
+                    "case_number": case_num,
+                    "title": pdf_element.text.strip(),
+                    "summary": item.text.strip(),
+                })
             except Exception as e:
                 logging.error(f"Ошибка при обработке элемента: {str(e)}")
                 continue
 
-        logging.info(f"Найдено {len(pdf_links)} PDF‑файлов.")
-
-        for url, file_name in pdf_links:
-            file_path = os.path.join(download_dir, file_name)
-            if os.path.exists(file_path):
-                logging.info(f"Файл уже существует, пропуск: {file_name}")
-                continue
-            try:
-                logging.info(f"Скачивание: {file_name}")
-
-                driver.execute_script(f"window.open('{url}');")
-                driver.switch_to.window(driver.window_handles[-1])
-
-                time.sleep(5)
-
-                driver.close()
-                driver.switch_to.window(driver.window_handles[0])
-                
-                logging.info(f"Файл скачан: {file_name}")
-                
-            except Exception as download_error:
-                logging.error(f"Ошибка скачивания {file_name}: {download_error}")
-
-        logging.info("Обработка скачанных файлов...")
-        time.sleep(5)
-
-        downloaded_files = os.listdir(download_dir)
-        logging.info(f"Найдено файлов в папке: {len(downloaded_files)}")
-
-        downloaded_files.sort(key=lambda x: os.path.getmtime(os.path.join(download_dir, x)), reverse=True)
-
-        for i, (url, file_name) in enumerate(pdf_links):
-            if i < len(downloaded_files):
-                original_path = os.path.join(download_dir, downloaded_files[i])
-                new_path = os.path.join(download_dir, file_name)
-
-                counter = 1
-                while os.path.exists(new_path):
-                    name, ext = os.path.splitext(file_name)
-                    new_path = os.path.join(download_dir, f"{name}_{counter}{ext}")
-                    counter += 1
-                
-                os.rename(original_path, new_path)
-                logging.info(f"Переименован: {downloaded_files[i]} -> {os.path.basename(new_path)}")
-            else:
-                logging.warning(f"Нет файла для переименования: {file_name}")
+        logging.info(f"Найдено {len(documents)} PDF‑файлов.")
+        record_span("selenium.parse_results", time.perf_counter() - parse_started,
+                    items=len(doc_items), documents=len(documents))
+        return documents
 
     except Exception as e:
         logging.error(f"Ошибка: {str(e)}")
         driver.save_screenshot("error.png")
-    finally:
-        driver.quit()
+        return None
 
 if __name__ == "__main__":
     pass
@@ -1,13 +1,75 @@
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import deque
+from functools import lru_cache
+import contextvars
+import multiprocessing
+import threading
 import os
+import re
+import time
 from dotenv import load_dotenv
-from typing import List
+from typing import TYPE_CHECKING, Deque, Dict, Iterator, List, Optional, Tuple
+
+from decision_metadata import extract_decision_metadata
+from decision_splitter import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, split_decision
+from tokenizer import count_tokens
+from tracing import record_span
+
+if TYPE_CHECKING:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 load_dotenv()
 
-def load_docs(path_to_pdf_folder : str) -> List[Document]:
+# Сколько страниц большого PDF обрабатывает один воркер за задачу
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "20"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Сколько первых страниц документа читать для извлечения реквизитов судебного акта
+METADATA_PAGES = 2
+# sections - по разделам судебного акта (decision_splitter), pages - окнами по страницам
+PDF_CHUNKER = os.getenv("PDF_CHUNKER", "sections")
+# Файлы длиннее (сборники, сканы томов дела) режутся по страницам параллельно диапазонами
+DECISION_MAX_PAGES = int(os.getenv("DECISION_MAX_PAGES", "60"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def get_splitter() -> "RecursiveCharacterTextSplitter":
+    """Сплиттер создается один раз на процесс и считает токены общей кодировкой tiktoken."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_TOKENS,
+        chunk_overlap=CHUNK_OVERLAP_TOKENS,
+        length_function=count_tokens,
+        # Позиция чанка на странице: по ней сборщик контекста убирает перекрытие соседних чанков
+        add_start_index=True
+    )
+
+
+def normalize_whitespace(text: str) -> str:
+    """Схлопывает пробелы внутри строк и пустые строки, сохраняя границы абзацев."""
+    text = re.sub(r'[^\S\n]+', ' ', text)
+    text = re.sub(r' ?\n ?', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def list_pdfs(path_to_pdf_folder: str) -> List[str]:
+    """PDF-файлы папки в детерминированном порядке."""
+    return [
+        os.path.join(path_to_pdf_folder, file)
+        for file in sorted(os.listdir(path_to_pdf_folder))
+        if file.endswith(".pdf")
+    ]
+
+
+def load_docs_serial(path_to_pdf_folder : str) -> List[Document]:
+    """Последовательная загрузка: все страницы в один список, затем один проход сплиттера."""
+    from langchain_community.document_loaders import PyMuPDFLoader
+
     docs = []
 
     for file in os.listdir(path_to_pdf_folder):
@@ -18,11 +80,146 @@ def load_docs(path_to_pdf_folder : str) -> List[Document]:
             pdf_documents = pdf_loader.load()
             docs.extend(pdf_documents)
 
-    char_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        model_name="gpt-4",
-        chunk_size=512,
-        chunk_overlap=100
-    )
-    small_chunks = char_splitter.split_documents(docs)
+    small_chunks = get_splitter().split_documents(docs)
 
     return small_chunks
+
+
+def _split_page_range(filepath: str, start: int, stop: int,
+                      doc_metadata: Optional[Dict] = None, chunker: str = PDF_CHUNKER) -> List[Document]:
+    """Извлекает текст страниц [start, stop) и режет на чанки. Выполняется в воркере.
+
+    doc_metadata - реквизиты судебного акта, общие для всех чанков файла.
+    Документ целиком в режиме sections режется по разделам, иначе - окнами по страницам.
+    """
+    import fitz
+
+    pages = []
+    with fitz.open(filepath) as pdf:
+        total_pages = len(pdf)
+        # Те же метаданные, что проставляет PyMuPDFLoader
+        pdf_metadata = {
+            k: v for k, v in (pdf.metadata or {}).items() if isinstance(v, (str, int))
+        }
+        for number in range(start, min(stop, total_pages)):
+            page = pdf[number]
+            pages.append(Document(
+                # Пробелы нормализуются один раз здесь, а не при каждой сборке контекста
+                page_content=normalize_whitespace(page.get_text()),
+                metadata=dict(
+                    {
+                        "source": filepath,
+                        "file_path": filepath,
+                        "page": number,
+                        "total_pages": total_pages,
+                        "ws_normalized": True,
+                    },
+                    **pdf_metadata,
+                    **(doc_metadata or {})
+                )
+            ))
+
+    if chunker == "sections" and start == 0 and stop >= total_pages:
+        return split_decision(pages, get_splitter())
+    return get_splitter().split_documents(pages)
+
+
+def _plan_tasks(filepaths: List[str], pages_per_task: int) -> List[Tuple[str, int, int, Dict]]:
+    """Разбивает файлы на задачи по диапазонам страниц.
+
+    Реквизиты судебного акта извлекаются здесь один раз на файл (из первых страниц)
+    и передаются во все его задачи.
+    """
+    import fitz
+
+    tasks = []
+    for filepath in filepaths:
+        doc_metadata: Dict = {}
+        try:
+            with fitz.open(filepath) as pdf:
+                total_pages = len(pdf)
+                header = "\n".join(pdf[number].get_text() for number in range(min(METADATA_PAGES, total_pages)))
+            doc_metadata = extract_decision_metadata(header)
+        except Exception:
+            # Битый файл отдаем воркеру целиком, ошибка всплывет при обработке
+            total_pages = pages_per_task
+        if PDF_CHUNKER == "sections" and total_pages <= DECISION_MAX_PAGES:
+            # Разделы акта переходят через страницы, поэтому документ режется одной задачей
+            tasks.append((filepath, 0, total_pages, doc_metadata))
+            continue
+        for start in range(0, max(total_pages, 1), pages_per_task):
+            tasks.append((filepath, start, start + pages_per_task, doc_metadata))
+    return tasks
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Общий пул процессов; spawn, чтобы не форкать процесс бота с живыми потоками."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def iter_docs(filepaths: List[str], max_pending: Optional[int] = None) -> Iterator[Document]:
+    """Параллельно извлекает и режет PDF, отдавая чанки потоком в исходном порядке.
+
+    В работе одновременно не больше max_pending задач, поэтому в памяти держится
+    ограниченное число страниц, а не весь корпус.
+    """
+    # Генератор отдает управление вызывающему, поэтому участки записываются по факту, а не span
+    started = time.perf_counter()
+    planned = _plan_tasks(filepaths, PAGES_PER_TASK)
+    record_span("pdf.plan", time.perf_counter() - started, files=len(filepaths), tasks=len(planned))
+
+    if PDF_WORKERS <= 1:
+        for task in planned:
+            started = time.perf_counter()
+            chunks = _split_page_range(*task)
+            record_span("pdf.parse", time.perf_counter() - started,
+                        file=os.path.basename(task[0]), first_page=task[1], chunks=len(chunks))
+            yield from chunks
+        return
+
+    pool = _get_pool()
+    max_pending = max_pending or PDF_WORKERS * 2
+    tasks = iter(planned)
+    pending: Deque[Future] = deque()
+
+    def submit_next() -> None:
+        task = next(tasks, None)
+        if task is None:
+            return
+        submitted = time.perf_counter()
+        # Колбэк выполняется в служебном потоке пула: span пишем в контексте вызывающего (correlation id)
+        context = contextvars.copy_context()
+        future = pool.submit(_split_page_range, *task)
+
+        def finished(done: Future) -> None:
+            # От постановки в пул до готовности результата, включая ожидание свободного воркера
+            if not done.cancelled():
+                context.run(record_span, "pdf.parse", time.perf_counter() - submitted,
+                            "ok" if done.exception() is None else "error",
+                            file=os.path.basename(task[0]), first_page=task[1])
+
+        future.add_done_callback(finished)
+        pending.append(future)
+
+    try:
+        for _ in range(max_pending):
+            submit_next()
+        while pending:
+            future = pending.popleft()
+            chunks = future.result()
+            submit_next()
+            yield from chunks
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def load_docs(path_to_pdf_folder : str) -> List[Document]:
+    return list(iter_docs(list_pdfs(path_to_pdf_folder)))
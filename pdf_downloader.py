@@ -0,0 +1,163 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+import tempfile
+
+PDF_DOWNLOAD_WORKERS = int(os.getenv("PDF_DOWNLOAD_WORKERS", "4"))
+PDF_MAX_BYTES = int(float(os.getenv("PDF_MAX_MB", "50")) * 1024 * 1024)
+PDF_DOWNLOAD_TIMEOUT = float(os.getenv("PDF_DOWNLOAD_TIMEOUT", "60"))
+
+ALLOWED_CONTENT_TYPES = {
+    "application/pdf",
+    "application/x-pdf",
+    "application/octet-stream",
+    "binary/octet-stream",
+}
+
+
+class PdfDownloadError(Exception):
+    """Ответ сервера не похож на PDF или превышает допустимый размер."""
+
+
+def build_session(pool_size: int = PDF_DOWNLOAD_WORKERS) -> requests.Session:
+    """HTTP-сессия с пулом соединений и повторами на 429/5xx."""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"]
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def session_from_driver(driver, pool_size: int = PDF_DOWNLOAD_WORKERS) -> requests.Session:
+    """Переносит cookies, User-Agent и Referer из сессии Selenium в HTTP-сессию."""
+    session = build_session(pool_size)
+    session.headers["User-Agent"] = driver.execute_script("return navigator.userAgent;")
+    session.headers["Referer"] = driver.current_url
+    session.headers["Accept"] = "application/pdf,application/octet-stream;q=0.9,*/*;q=0.8"
+    for cookie in driver.get_cookies():
+        session.cookies.set(
+            cookie["name"],
+            cookie["value"],
+            domain=cookie.get("domain"),
+            path=cookie.get("path", "/")
+        )
+    return session
+
+
+def download_pdf(session: requests.Session, url: str, file_path: str,
+                 max_bytes: int = PDF_MAX_BYTES, timeout: float = PDF_DOWNLOAD_TIMEOUT) -> int:
+    """Скачивает один PDF потоково во временный файл и атомарно переименовывает его.
+
+    Возвращает размер файла в байтах.
+    """
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type and content_type not in ALLOWED_CONTENT_TYPES:
+            raise PdfDownloadError(f"неожиданный Content-Type: {content_type}")
+
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise PdfDownloadError(f"файл слишком большой: {content_length} байт")
+
+        directory = os.path.dirname(file_path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".download_", suffix=".part")
+        try:
+            written = 0
+            head = b""
+            with os.fdopen(fd, 'wb') as f:
+                for block in response.iter_content(chunk_size=64 * 1024):
+                    if not block:
+                        continue
+                    written += len(block)
+                    if written > max_bytes:
+                        raise PdfDownloadError(f"файл слишком большой: больше {max_bytes} байт")
+                    if len(head) < 1024:
+                        head += block[:1024 - len(head)]
+                    f.write(block)
+
+            # Сайт при проблемах с сессией отдает HTML-страницу с кодом 200
+            if b"%PDF-" not in head:
+                raise PdfDownloadError("ответ не является PDF-документом")
+
+            os.replace(tmp_path, file_path)
+            return written
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+def _unique_targets(pdf_links: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Разводит совпадающие имена файлов в пределах одной выдачи: name.pdf, name_1.pdf, ..."""
+    seen_urls = set()
+    used_names = set()
+    targets = []
+    for url, file_name in pdf_links:
+        if url in seen_urls:
+            continue
+        seen_urls.add(url)
+
+        name, ext = os.path.splitext(file_name)
+        candidate = file_name
+        counter = 1
+        while candidate in used_names:
+            candidate = f"{name}_{counter}{ext}"
+            counter += 1
+        used_names.add(candidate)
+        targets.append((url, candidate))
+    return targets
+
+
+def download_pdfs(pdf_links: List[Tuple[str, str]], download_dir: str,
+                  session: Optional[requests.Session] = None,
+                  max_workers: int = PDF_DOWNLOAD_WORKERS) -> Dict[str, Optional[str]]:
+    """Параллельно скачивает список (url, имя файла) в download_dir.
+
+    Уже существующие файлы пропускаются. Возвращает {имя файла: None или текст ошибки}.
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    session = session or build_session(max_workers)
+
+    jobs = []
+    for url, file_name in _unique_targets(pdf_links):
+        file_path = os.path.join(download_dir, file_name)
+        if os.path.exists(file_path):
+            logging.info(f"Файл уже существует, пропуск: {file_name}")
+            continue
+        jobs.append((url, file_name, file_path))
+
+    results: Dict[str, Optional[str]] = {}
+    if not jobs:
+        return results
+
+    logging.info(f"Скачиваю {len(jobs)} PDF в {max_workers} потоков")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(download_pdf, session, url, file_path): file_name
+            for url, file_name, file_path in jobs
+        }
+        for future in as_completed(futures):
+            file_name = futures[future]
+            try:
+                size = future.result()
+                results[file_name] = None
+                logging.info(f"Файл скачан: {file_name} ({size} байт)")
+            except Exception as e:
+                results[file_name] = str(e)
+                logging.error(f"Ошибка скачивания {file_name}: {e}")
+
+    failed = sum(1 for error in results.values() if error)
+    logging.info(f"Скачано {len(results) - failed} из {len(results)} PDF")
+    return results
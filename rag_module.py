@@ -1,8 +1,10 @@
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from vec_database import chroma_database, get_existing_collection
-from model import SudebChatModel
+from vec_database import count_documents
+from retrieval import get_engine
+from executors import run_blocking
+from context_builder import build_context, count_tokens
+from langchain_core.documents import Document
+from typing import List
 import logging
-import re
 
 import os
 from dotenv import load_dotenv
@@ -11,57 +13,71 @@ load_dotenv()
 
 logging.basicConfig()
 
-def rag(user_prompt: str, collection_name: str | None = None) -> str:
-    """RAG-поиск в указанной коллекции Chroma."""
-    
+def _format_context(rel_docs: List[Document]) -> str:
+    context = build_context(rel_docs)
+    if context:
+        logging.info(f"RAG: Контекст из {len(rel_docs)} фрагментов, {count_tokens(context)} токенов")
+    return context
+
+def _check_collection(collection_name: str | None) -> None:
     if not collection_name:
         raise ValueError("collection_name обязателен для RAG-поиска")
-    
     logging.info(f"RAG: Ищу в коллекции: {collection_name}")
-    
-    try:
-        # Открываем существующую коллекцию
-        vectorstorage = get_existing_collection(collection_name)
-        
-        # Проверяем, есть ли документы в коллекции
-        try:
-            # Пробуем получить все документы из коллекции
-            all_docs = vectorstorage.get()
-            doc_count = len(all_docs.get('ids', []))
-            logging.info(f"RAG: В коллекции {collection_name} найдено {doc_count} документов")
-            
-            if doc_count == 0:
-                return f"Коллекция {collection_name} пуста. Документы не были загружены или были удалены."
-                
-        except Exception as e:
-            logging.error(f"RAG: Ошибка при проверке коллекции {collection_name}: {e}")
-            return f"Ошибка доступа к коллекции {collection_name}: {str(e)}"
 
-        retriever = MultiQueryRetriever.from_llm(
-            retriever=vectorstorage.as_retriever(search_kwargs={"k": 5}),
-            llm=SudebChatModel(temperature=0)
-        )
+def _empty_collection(user_prompt: str, collection_name: str, doc_count: int) -> str | None:
+    """Сообщение для пустой коллекции или None, если можно искать."""
+    logging.info(f"RAG: В коллекции {collection_name} найдено {doc_count} документов")
+    if doc_count == 0:
+        return f"Коллекция {collection_name} пуста. Документы не были загружены или были удалены."
+    logging.info(f"RAG: Выполняю поиск для запроса: {user_prompt}")
+    return None
 
-        logging.getLogger("langchain.retrievers.multi_query").setLevel(logging.INFO)
+def _access_error(collection_name: str, e: Exception) -> str:
+    logging.error(f"RAG: Ошибка при проверке коллекции {collection_name}: {e}")
+    return f"Ошибка доступа к коллекции {collection_name}: {str(e)}"
 
-        logging.info(f"RAG: Выполняю поиск для запроса: {user_prompt}")
-        rel_docs = retriever.invoke(user_prompt)
-        
-        logging.info(f"RAG: Найдено {len(rel_docs)} релевантных документов")
+def _answer(user_prompt: str, collection_name: str, rel_docs: List[Document]) -> str:
+    logging.info(f"RAG: Найдено {len(rel_docs)} релевантных документов")
+    context = _format_context(rel_docs)
+    if not context:
+        return f"По запросу '{user_prompt}' в коллекции {collection_name} ничего не найдено."
+    return context
 
-        context = ""
+def _search_error(collection_name: str, e: Exception) -> str:
+    logging.error(f"RAG: Ошибка при поиске в коллекции {collection_name}: {e}")
+    return f"Ошибка поиска в коллекции {collection_name}: {str(e)}"
+
+def rag(user_prompt: str, collection_name: str | None = None) -> str:
+    """RAG-поиск в указанной коллекции Chroma."""
+    _check_collection(collection_name)
+    try:
+        # Проверяем, есть ли документы в коллекции
+        try:
+            doc_count = count_documents(collection_name)
+        except Exception as e:
+            return _access_error(collection_name, e)
+        empty = _empty_collection(user_prompt, collection_name, doc_count)
+        if empty is not None:
+            return empty
 
-        for i, doc in enumerate(rel_docs):
-            context += f"Документ {i+1}:\n{doc.page_content}\n\n"
+        rel_docs = get_engine().retrieve(collection_name, user_prompt)
+        return _answer(user_prompt, collection_name, rel_docs)
+    except Exception as e:
+        return _search_error(collection_name, e)
 
-        context = context.rstrip()
-        context = re.sub(r'\s+', ' ', context).strip()
-        
-        if not context:
-            return f"По запросу '{user_prompt}' в коллекции {collection_name} ничего не найдено."
+async def arag(user_prompt: str, collection_name: str | None = None) -> str:
+    """Асинхронный RAG-поиск: LLM и эмбеддинги без блокировки event loop, Chroma в пуле io."""
+    _check_collection(collection_name)
+    try:
+        try:
+            doc_count = await run_blocking("io", count_documents, collection_name)
+        except Exception as e:
+            return _access_error(collection_name, e)
+        empty = _empty_collection(user_prompt, collection_name, doc_count)
+        if empty is not None:
+            return empty
 
-        return context
-        
+        rel_docs = await get_engine().aretrieve(collection_name, user_prompt)
+        return _answer(user_prompt, collection_name, rel_docs)
     except Exception as e:
-        logging.error(f"RAG: Ошибка при поиске в коллекции {collection_name}: {e}")
-        return f"Ошибка поиска в коллекции {collection_name}: {str(e)}"
+        return _search_error(collection_name, e)
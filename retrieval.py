@@ -0,0 +1,258 @@
+from langchain_core.documents import Document
+from langchain_core.prompts import ChatPromptTemplate
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+import re
+import threading
+import time
+
+from chroma_registry import ChromaRegistry, get_registry
+from chunk_store import CHUNK_STORE_COLLECTION, get_chunk_store, view_filter
+from executors import run_blocking
+from lexical_index import LexicalIndex, get_lexical_index, is_identifier_query
+from decision_metadata import infer_filters
+from tracing import record_llm_usage, span
+
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "5"))
+RETRIEVAL_MAX_DOCS = int(os.getenv("RETRIEVAL_MAX_DOCS", "10"))
+VARIANTS_CACHE_SIZE = int(os.getenv("RETRIEVAL_VARIANTS_CACHE_SIZE", "1024"))
+# Константа сглаживания Reciprocal Rank Fusion
+RRF_K = 60
+
+VARIANTS_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", "Ты помогаешь искать фрагменты судебных документов в векторной базе. "
+                   "Сформулируй 3 разные версии вопроса пользователя, чтобы найти релевантные фрагменты "
+                   "с разных сторон. Пиши каждую версию с новой строки, без нумерации и пояснений."),
+        ("user", "{question}")
+    ]
+)
+
+
+def parse_variants(text: str) -> List[str]:
+    variants = []
+    for line in text.splitlines():
+        line = re.sub(r'^\s*(?:\d+[.)]|[-•*])\s*', '', line).strip()
+        if line:
+            variants.append(line)
+    return variants
+
+
+class MultiQueryEngine:
+    """Мульти-запросный поиск за один раунд: все переформулировки вопроса эмбеддятся
+    одним батчем и ищутся одним запросом к коллекции. К векторным спискам добавляются
+    списки BM25 по тем же запросам, все сливается через RRF.
+
+    Запросы, состоящие в основном из идентификаторов (номер дела, ИНН, дата), ищутся
+    только в лексическом индексе, без LLM и эмбеддингов.
+
+    Если вопрос указывает на инстанцию или год, поиск ограничивается метаданными
+    судебных актов; когда под фильтр ничего не попало, ищем по всей коллекции.
+    """
+
+    def __init__(self, registry: Optional[ChromaRegistry] = None, k: int = RETRIEVAL_K,
+                 max_docs: int = RETRIEVAL_MAX_DOCS, variants_cache_size: int = VARIANTS_CACHE_SIZE) -> None:
+        self.registry = registry or get_registry()
+        self.k = k
+        self.max_docs = max_docs
+        self.variants_cache_size = variants_cache_size
+        self._variants: "OrderedDict[Tuple[str, str], List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._llm = None
+        self._verified_indexes = set()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from model import SudebChatModel
+            self._llm = SudebChatModel(temperature=0)
+        return self._llm
+
+    def _cached_variants(self, collection_name: str, question: str) -> Tuple[Tuple[str, str], Optional[List[str]]]:
+        key = (collection_name, question.strip())
+        with self._lock:
+            if key in self._variants:
+                self._variants.move_to_end(key)
+                return key, self._variants[key]
+        return key, None
+
+    def _remember_variants(self, key: Tuple[str, str], response) -> List[str]:
+        variants = parse_variants(response.content)
+        logging.info(f"RAG: Переформулировки вопроса: {variants}")
+        with self._lock:
+            self._variants[key] = variants
+            while len(self._variants) > self.variants_cache_size:
+                self._variants.popitem(last=False)
+        return variants
+
+    @staticmethod
+    def _variants_failed(error: Exception) -> List[str]:
+        # Без переформулировок поиск все равно работает по исходному вопросу
+        logging.warning(f"RAG: Не удалось получить переформулировки вопроса: {error}")
+        return []
+
+    def generate_variants(self, collection_name: str, question: str) -> List[str]:
+        """Переформулировки вопроса от LLM, закэшированные по (коллекция, вопрос)."""
+        key, cached = self._cached_variants(collection_name, question)
+        if cached is not None:
+            return cached
+        try:
+            with span("llm.variants") as llm_span:
+                response = (VARIANTS_PROMPT | self.llm).invoke({"question": question})
+                record_llm_usage("variants", response, llm_span)
+        except Exception as e:
+            return self._variants_failed(e)
+        return self._remember_variants(key, response)
+
+    async def agenerate_variants(self, collection_name: str, question: str) -> List[str]:
+        key, cached = self._cached_variants(collection_name, question)
+        if cached is not None:
+            return cached
+        try:
+            with span("llm.variants") as llm_span:
+                response = await (VARIANTS_PROMPT | self.llm).ainvoke({"question": question})
+                record_llm_usage("variants", response, llm_span)
+        except Exception as e:
+            return self._variants_failed(e)
+        return self._remember_variants(key, response)
+
+    def _query(self, collection_name: str, query_embeddings: List[List[float]],
+               where: Optional[Dict] = None) -> Dict:
+        collection = self.registry.get(CHUNK_STORE_COLLECTION)._collection
+        with span("chroma.query", queries=len(query_embeddings), filtered=where is not None):
+            return collection.query(
+                query_embeddings=query_embeddings,
+                n_results=self.k,
+                where=view_filter(collection_name, where),
+                include=["documents", "metadatas", "distances"]
+            )
+
+    def _lexical_index(self, collection_name: str) -> LexicalIndex:
+        """Лексический индекс представления; пересобирается, если разошелся с хранилищем
+        (например, представление загружено до появления индекса)."""
+        index = get_lexical_index(collection_name)
+        if collection_name not in self._verified_indexes:
+            if len(index) != get_chunk_store().count(collection_name):
+                collection = self.registry.get(CHUNK_STORE_COLLECTION)._collection
+                index.rebuild(collection, where=view_filter(collection_name))
+            self._verified_indexes.add(collection_name)
+        return index
+
+    def warm(self, collection_name: str) -> None:
+        """Открывает хранилище и загружает лексический индекс представления до первого вопроса."""
+        self._lexical_index(collection_name)
+
+    def _fetch(self, collection_name: str, ids: List[str], where: Optional[Dict] = None) -> Dict[str, Document]:
+        """Чанки по id; с where возвращаются только подходящие под фильтр."""
+        if not ids:
+            return {}
+        collection = self.registry.get(CHUNK_STORE_COLLECTION)._collection
+        with span("chroma.get", ids=len(ids)):
+            result = collection.get(ids=ids, where=view_filter(collection_name, where),
+                                    include=["documents", "metadatas"])
+        return {
+            id_: Document(page_content=text, metadata=metadata or {}, id=id_)
+            for id_, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+
+    def _identifier_lookup(self, collection_name: str, question: str,
+                           where: Optional[Dict] = None) -> Optional[List[Document]]:
+        if not is_identifier_query(question):
+            return None
+        started = time.perf_counter()
+        hits = self._lexical_index(collection_name).search(question, self.max_docs)
+        if not hits:
+            return None
+        logging.info(
+            f"RAG: запрос-идентификатор, {len(hits)} фрагментов из лексического индекса за "
+            f"{(time.perf_counter() - started) * 1000:.2f}ms"
+        )
+        docs = self._fetch(collection_name, [id_ for id_, _ in hits], where)
+        return [docs[id_] for id_, _ in hits if id_ in docs] or None
+
+    def _hybrid(self, collection_name: str, queries: List[str], query_embeddings: List[List[float]],
+                where: Optional[Dict] = None) -> List[Document]:
+        index = self._lexical_index(collection_name)
+        lexical = [[id_ for id_, _ in index.search(query, self.k)] for query in queries]
+        if where is not None:
+            docs = self._fuse(collection_name, self._query(collection_name, query_embeddings, where), lexical, where)
+            if docs:
+                logging.info(f"RAG: фильтр по метаданным {where}: {len(docs)} фрагментов")
+                return docs
+            logging.info(f"RAG: под фильтр {where} ничего не попало, ищу по всей коллекции")
+        return self._fuse(collection_name, self._query(collection_name, query_embeddings), lexical)
+
+    @staticmethod
+    def _queries(question: str, variants: List[str]) -> List[str]:
+        return list(dict.fromkeys([question] + variants))
+
+    @staticmethod
+    def _log_retrieval(queries: List[str], docs: List[Document], started: float) -> List[Document]:
+        logging.info(
+            f"RAG: {len(queries)} запросов, {len(docs)} уникальных фрагментов за "
+            f"{time.perf_counter() - started:.2f}s"
+        )
+        return docs
+
+    def retrieve(self, collection_name: str, question: str, where: Optional[Dict] = None) -> List[Document]:
+        """where - фильтр Chroma по метаданным; по умолчанию выводится из вопроса (infer_filters)."""
+        where = where if where is not None else infer_filters(question)
+        docs = self._identifier_lookup(collection_name, question, where)
+        if docs is not None:
+            return docs
+
+        queries = self._queries(question, self.generate_variants(collection_name, question))
+        started = time.perf_counter()
+        query_embeddings = self.registry.embedder.embed_documents(queries)
+        docs = self._hybrid(collection_name, queries, query_embeddings, where)
+        return self._log_retrieval(queries, docs, started)
+
+    async def aretrieve(self, collection_name: str, question: str, where: Optional[Dict] = None) -> List[Document]:
+        where = where if where is not None else infer_filters(question)
+        docs = await run_blocking("io", self._identifier_lookup, collection_name, question, where)
+        if docs is not None:
+            return docs
+
+        queries = self._queries(question, await self.agenerate_variants(collection_name, question))
+        started = time.perf_counter()
+        query_embeddings = await self.registry.embedder.aembed_documents(queries)
+        docs = await run_blocking("io", self._hybrid, collection_name, queries, query_embeddings, where)
+        return self._log_retrieval(queries, docs, started)
+
+    def _fuse(self, collection_name: str, result: Dict, lexical: List[List[str]],
+              where: Optional[Dict] = None) -> List[Document]:
+        """Reciprocal Rank Fusion по векторным и лексическим спискам результатов каждого запроса.
+
+        Лексические кандидаты не фильтруются индексом, поэтому с where они проверяются при догрузке.
+        """
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Document] = {}
+        for ids, texts, metadatas in zip(result["ids"], result["documents"], result["metadatas"]):
+            for rank, (id_, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                scores[id_] = scores.get(id_, 0.0) + 1.0 / (RRF_K + rank + 1)
+                if id_ not in docs:
+                    docs[id_] = Document(page_content=text, metadata=metadata or {}, id=id_)
+        for ids in lexical:
+            for rank, id_ in enumerate(ids):
+                scores[id_] = scores.get(id_, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        # С фильтром часть лексических кандидатов отсеется, поэтому берем их с запасом
+        limit = self.max_docs * 2 if where is not None else self.max_docs
+        ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+        # Тексты чанков, найденных только лексически, добираем из Chroma одним запросом
+        docs.update(self._fetch(collection_name, [id_ for id_ in ranked if id_ not in docs], where))
+        return [docs[id_] for id_ in ranked if id_ in docs][:self.max_docs]
+
+
+_engine: Optional[MultiQueryEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> MultiQueryEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = MultiQueryEngine()
+        return _engine
@@ -0,0 +1,121 @@
+from typing import Dict, List, Optional
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from metrics import counter
+
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "./chroma_db/search_cache.sqlite")
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "6")) * 3600
+
+SEARCH_CACHE_REQUESTS = counter("search_cache_requests_total", "Обращения к кэшу выдачи ras.arbitr.ru по результату")
+SEARCH_CACHE_SAVED = counter("search_cache_saved_seconds_total", "Сэкономленное на поиске через браузер время")
+
+
+def normalize_query(query: str) -> str:
+    """Приводит запрос к каноническому виду: регистр, пробелы, латинская «A» в номере дела."""
+    normalized = re.sub(r'\s+', ' ', query.strip()).upper()
+    return re.sub(r'^A(?=\d)', 'А', normalized)
+
+
+class SearchCache:
+    """Персистентный TTL-кэш разобранной выдачи поиска по ключу (запрос, тип, окно дат)."""
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl_seconds: float = SEARCH_CACHE_TTL) -> None:
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS search_results (
+                query TEXT NOT NULL,
+                case_type TEXT NOT NULL,
+                date_from TEXT NOT NULL,
+                date_to TEXT NOT NULL,
+                documents TEXT NOT NULL,
+                search_seconds REAL NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (query, case_type, date_from, date_to)
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(query: str, case_type: str, date_from: str, date_to: str):
+        return normalize_query(query), case_type.strip().lower(), date_from, date_to
+
+    def get(self, query: str, case_type: str, date_from: str, date_to: str) -> Optional[List[Dict]]:
+        """Возвращает выдачу, если она моложе TTL, иначе None."""
+        key = self._key(query, case_type, date_from, date_to)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT documents, search_seconds, created_at FROM search_results "
+                "WHERE query = ? AND case_type = ? AND date_from = ? AND date_to = ?",
+                key
+            ).fetchone()
+
+        if row is None or time.time() - row[2] > self.ttl_seconds:
+            SEARCH_CACHE_REQUESTS.inc(result="miss")
+            self._log_ratio(f"промах для '{key[0]}' ({key[1]})")
+            return None
+
+        documents, search_seconds, created_at = row
+        SEARCH_CACHE_REQUESTS.inc(result="hit")
+        SEARCH_CACHE_SAVED.inc(search_seconds)
+        self._log_ratio(
+            f"попадание для '{key[0]}' ({key[1]}), возраст {(time.time() - created_at) / 60:.0f} мин, "
+            f"сэкономлено {search_seconds:.1f}s"
+        )
+        return json.loads(documents)
+
+    def put(self, query: str, case_type: str, date_from: str, date_to: str,
+            documents: List[Dict], search_seconds: float) -> None:
+        key = self._key(query, case_type, date_from, date_to)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results "
+                "(query, case_type, date_from, date_to, documents, search_seconds, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, json.dumps(documents, ensure_ascii=False), search_seconds, time.time())
+            )
+            # Заодно чистим протухшие записи, чтобы файл не рос бесконечно
+            self._conn.execute(
+                "DELETE FROM search_results WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+
+    def invalidate(self, query: str, case_type: str, date_from: str, date_to: str) -> None:
+        """Удаляет выдачу, по которой не удалось скачать документы, чтобы поиск выполнился заново."""
+        key = self._key(query, case_type, date_from, date_to)
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM search_results WHERE query = ? AND case_type = ? AND date_from = ? AND date_to = ?", key
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _log_ratio(message: str) -> None:
+        hits = SEARCH_CACHE_REQUESTS.value(result="hit")
+        total = hits + SEARCH_CACHE_REQUESTS.value(result="miss")
+        logging.info(
+            f"Кэш поиска: {message}. Доля попаданий {hits / total:.0%}, "
+            f"всего сэкономлено {SEARCH_CACHE_SAVED.value():.0f}s"
+        )
+
+
+_cache: Optional[SearchCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
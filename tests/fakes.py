@@ -0,0 +1,134 @@
+"""Детерминированные заглушки GigaChat для тестов и офлайн-бенчмарков.
+
+FakeChatModel подставляется вместо SudebChatModel (Graph(model=...) и LLM движка
+поиска), FakeEmbeddings - вместо GigaChatEmbeddings за кэшем эмбеддингов реестра.
+Задержки настраиваются, ответы зависят только от входа, сеть и учетные данные не нужны.
+"""
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from typing import Any, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from lexical_index import tokenize
+
+
+class FakeChatModel(BaseChatModel):
+    """Чат-модель с фиксированной задержкой: переформулировки вопроса для MultiQuery
+    и короткий ответ, собранный из начала контекста.
+    """
+
+    latency: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gigachat"
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        system = " ".join(str(message.content) for message in messages if message.type == "system")
+        user = str(messages[-1].content)
+        if "версии вопроса" in system:
+            content = "\n".join([user, f"Что установил суд: {user}", f"Какое решение принято: {user}"])
+        else:
+            context = user.split("\n\nВопрос:\n")[0].removeprefix("Контекст:\n")
+            digest = hashlib.md5(context.encode("utf-8")).hexdigest()[:8]
+            content = f"Ответ по контексту {digest}: " + " ".join(context.split()[:60])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+
+class FakeRateLimitError(Exception):
+    """Ответ 429 с тем же полем status_code, что у исключений HTTP-клиентов."""
+
+    status_code = 429
+
+
+class FakeEmbeddings(Embeddings):
+    """Эмбеддинги хешированием токенов: тексты с общими словами близки по косинусу.
+
+    Задержка вызова - latency плюс per_text_latency на каждый текст батча.
+    max_concurrent, если задан, имитирует квоту API: вызов сверх нее сразу получает 429.
+    """
+
+    def __init__(self, dimensions: int = 256, latency: float = 0.05, per_text_latency: float = 0.001,
+                 max_concurrent: Optional[int] = None) -> None:
+        self.dimensions = dimensions
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.max_concurrent = max_concurrent
+        self.calls = 0
+        self.texts = 0
+        self.rejected = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for token in tokenize(text):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _delay(self, texts: List[str]) -> float:
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+        return self.latency + self.per_text_latency * len(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            if self.max_concurrent is not None and self._in_flight >= self.max_concurrent:
+                self.rejected += 1
+                raise FakeRateLimitError("429 Too Many Requests")
+            self._in_flight += 1
+        try:
+            time.sleep(self._delay(texts))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay(texts))
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def install_fakes(chat: FakeChatModel, embeddings: FakeEmbeddings, model_id: Optional[str] = None) -> None:
+    """Подменяет GigaChat в общих объектах процесса: эмбеддер реестра Chroma и LLM движка поиска.
+
+    Граф получает модель явно: Graph(model=chat). Новый model_id - пустой для
+    этого эмбеддера кэш эмбеддингов (холодная загрузка).
+    """
+    from chroma_registry import get_registry
+    from embedding_cache import CachedEmbeddings, get_embedding_cache
+    from retrieval import get_engine
+
+    registry = get_registry()
+    with registry._lock:
+        registry._embedder = CachedEmbeddings(
+            underlying=embeddings, model_id=model_id or f"fake:{embeddings.dimensions}", cache=get_embedding_cache()
+        )
+    get_engine()._llm = chat
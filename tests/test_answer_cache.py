@@ -0,0 +1,53 @@
+from answer_cache import SemanticAnswerCache
+
+COLLECTION = "case_A40-312285_test"
+
+
+def new_cache():
+    # Все вопросы получают один и тот же эмбеддинг: худший случай для семантического сравнения
+    return SemanticAnswerCache(embed=lambda question: [1.0, 0.0], threshold=0.95)
+
+
+def test_short_questions_match_only_exactly():
+    cache = new_cache()
+    cache.store(COLLECTION, "Кто истец?", "ООО «Ромашка»")
+
+    assert cache.lookup(COLLECTION, "Кто ответчик?") is None
+    assert cache.lookup(COLLECTION, "кто истец") == "ООО «Ромашка»"
+
+
+def test_similar_questions_with_other_identifiers_do_not_match():
+    cache = new_cache()
+    cache.store(COLLECTION, "Какая сумма взыскана по договору № 15/21 от 12.03.2021?", "1 250 000 руб.")
+
+    assert cache.lookup(COLLECTION, "Какая сумма взыскана по договору № 16/21 от 12.03.2021?") is None
+    assert cache.lookup(COLLECTION, "Какую сумму взыскали по договору № 15/21 от 12.03.2021?") == "1 250 000 руб."
+
+
+def test_long_questions_match_semantically():
+    cache = new_cache()
+    cache.store(COLLECTION, "Какое решение вынес суд первой инстанции?", "Иск удовлетворен")
+
+    assert cache.lookup(COLLECTION, "Что решил суд первой инстанции по иску?") == "Иск удовлетворен"
+
+
+def test_answer_started_before_invalidate_is_not_stored():
+    cache = new_cache()
+    generation = cache.generation(COLLECTION)
+
+    cache.invalidate(COLLECTION)
+    cache.store(COLLECTION, "Кто истец?", "ООО «Ромашка»", generation)
+
+    assert cache.lookup(COLLECTION, "Кто истец?") is None
+
+    cache.store(COLLECTION, "Кто истец?", "ООО «Лютик»", cache.generation(COLLECTION))
+    assert cache.lookup(COLLECTION, "Кто истец?") == "ООО «Лютик»"
+
+
+def test_invalidate_drops_answers():
+    cache = new_cache()
+    cache.store(COLLECTION, "Кто истец?", "ООО «Ромашка»")
+
+    cache.invalidate(COLLECTION)
+
+    assert cache.lookup(COLLECTION, "Кто истец?") is None
@@ -0,0 +1,68 @@
+import pytest
+
+from benchmarks.bench_case_classifier import LABELED_INPUTS
+from case_classifier import CaseType, LLM_FALLBACK_CONFIDENCE, classify, is_valid_inn, is_valid_ogrn, parse_case_type
+
+
+@pytest.mark.parametrize("text, expected_type, expected_normalized", LABELED_INPUTS)
+def test_labeled_inputs(text, expected_type, expected_normalized):
+    result = classify(text)
+
+    assert result.case_type == expected_type
+    assert result.normalized == expected_normalized
+
+
+@pytest.mark.parametrize("text", ["7707083894", "500100732250", "ИНН 7736050004"])
+def test_invalid_inn_checksum_is_not_inn(text):
+    result = classify(text)
+
+    assert result.case_type != CaseType.INN
+    assert result.confidence < LLM_FALLBACK_CONFIDENCE
+
+
+@pytest.mark.parametrize("text", ["1027700132196", "304500116000158", "ОГРН: 1027700132190"])
+def test_invalid_ogrn_checksum_is_not_ogrn(text):
+    result = classify(text)
+
+    assert result.case_type != CaseType.OGRN
+    assert result.confidence < LLM_FALLBACK_CONFIDENCE
+
+
+def test_checksum_validators():
+    assert is_valid_inn("7707083893")
+    assert is_valid_inn("500100732259")
+    assert not is_valid_inn("7707083894")
+    assert not is_valid_inn("77070838")
+    assert is_valid_ogrn("1027700132195")
+    assert is_valid_ogrn("304500116000157")
+    assert not is_valid_ogrn("1027700132196")
+    assert not is_valid_ogrn("10277001321ab")
+
+
+@pytest.mark.parametrize("text", [
+    "A40-312285/2023",   # латинская заглавная
+    "a40-312285/2023",   # латинская строчная
+    "А40-312285/2023",   # кириллическая
+    "а40–312285/2023",   # кириллическая строчная и короткое тире
+    "A40 — 312285 / 2023",
+])
+def test_case_number_lookalikes_are_normalized(text):
+    result = classify(text)
+
+    assert result.case_type == CaseType.CASE_NUMBER
+    assert result.normalized == "А40-312285/2023"
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("ИНН", CaseType.INN),
+    (" огрн. ", CaseType.OGRN),
+    ("Это номер дела", CaseType.CASE_NUMBER),
+    ("Организация.", CaseType.ORGANIZATION),
+])
+def test_parse_case_type(answer, expected):
+    assert parse_case_type(answer) == expected
+
+
+@pytest.mark.parametrize("answer", ["", "Не знаю", "Адрес", "ИНН или ОГРН", "12345"])
+def test_parse_case_type_unknown(answer):
+    assert parse_case_type(answer) is None
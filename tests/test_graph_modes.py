@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+import graph as graph_module
+from fakes import FakeChatModel
+from graph import Graph
+
+COLLECTION = "case_A40-312285_test"
+
+
+class FakeScheduler:
+    def __init__(self) -> None:
+        self.calls = []
+
+    async def run(self, collection_name, case_query, case_type, on_progress=None):
+        self.calls.append((collection_name, case_query, case_type))
+        if on_progress is not None:
+            await on_progress("index")
+        return None
+
+
+class FakeAnswerCache:
+    def __init__(self, answers=None) -> None:
+        self.answers = dict(answers or {})
+        self.stored = []
+
+    def generation(self, collection_name):
+        return 0
+
+    def lookup(self, collection_name, question):
+        return self.answers.get((collection_name, question))
+
+    def store(self, collection_name, question, answer, generation=None):
+        self.stored.append((collection_name, question, answer))
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    rag_calls = []
+
+    async def fake_arag(user_prompt, collection_name=None):
+        rag_calls.append((user_prompt, collection_name))
+        return "Документ 1:\nРешение суда по делу А40-312285"
+
+    scheduler = FakeScheduler()
+    cache = FakeAnswerCache()
+    monkeypatch.setattr(graph_module, "arag", fake_arag)
+    monkeypatch.setattr(graph_module, "get_ingest_scheduler", lambda: scheduler)
+    monkeypatch.setattr(graph_module, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(graph_module, "get_collection_for_case", lambda case_input: COLLECTION)
+    return {"rag": rag_calls, "scheduler": scheduler, "cache": cache}
+
+
+def run_nodes(graph, user_prompt, mode, existing_collection=None):
+    """Узлы, выполненные графом режима mode, по порядку (stream_mode="updates")."""
+
+    async def run():
+        compiled, inputs, config = await graph._prepare_run(user_prompt, True, existing_collection, None, mode)
+        nodes = []
+        try:
+            async for update in compiled.astream(inputs, config=config, stream_mode="updates"):
+                nodes.extend(update)
+        finally:
+            await graph._finish_run(config, True)
+        return nodes
+
+    return asyncio.run(run())
+
+
+def new_graph():
+    return Graph(model=FakeChatModel(latency=0))
+
+
+def test_ingest_mode_runs_only_check_case_and_search(fakes):
+    nodes = run_nodes(new_graph(), "А40-312285/2023", "ingest")
+
+    assert nodes == ["check_case", "search"]
+    assert fakes["scheduler"].calls == [(COLLECTION, "А40-312285/2023", "Номер дела")]
+    assert fakes["rag"] == []
+
+
+def test_aingest_passes_progress_to_scheduler(fakes):
+    progress = []
+
+    async def on_progress(job):
+        progress.append(job)
+
+    result = asyncio.run(new_graph().aingest("А40-312285/2023", on_progress=on_progress))
+
+    assert result["collection_name"] == COLLECTION
+    assert progress == ["index"]
+    assert fakes["rag"] == []
+
+
+def test_question_mode_runs_rag_and_generate(fakes):
+    nodes = run_nodes(new_graph(), "Кто истец?", "question", existing_collection=COLLECTION)
+
+    assert nodes == ["route_by_cache", "rag", "generate"]
+    assert fakes["scheduler"].calls == []
+    assert fakes["rag"] == [("Кто истец?", COLLECTION)]
+    assert [(collection, question) for collection, question, _ in fakes["cache"].stored] == [(COLLECTION, "Кто истец?")]
+
+
+def test_question_mode_stops_on_cached_answer(fakes):
+    fakes["cache"].answers[(COLLECTION, "Кто истец?")] = "ООО «Ромашка»"
+
+    nodes = run_nodes(new_graph(), "Кто истец?", "question", existing_collection=COLLECTION)
+
+    assert nodes == ["route_by_cache"]
+    assert fakes["rag"] == []
+
+
+def test_question_mode_requires_collection(fakes):
+    with pytest.raises(ValueError):
+        run_nodes(new_graph(), "Кто истец?", "question")
+
+
+def test_full_mode_loads_new_case_then_answers(fakes):
+    nodes = run_nodes(new_graph(), "А40-312285/2023", "full")
+
+    assert nodes == ["route_by_flag", "check_case", "search", "rag", "generate"]
+    assert len(fakes["scheduler"].calls) == 1
+    assert len(fakes["rag"]) == 1
+
+
+def test_full_mode_uses_existing_collection(fakes):
+    nodes = run_nodes(new_graph(), "Кто истец?", "full", existing_collection=COLLECTION)
+
+    assert nodes == ["route_by_flag", "rag", "generate"]
+    assert fakes["scheduler"].calls == []
+
+
+def test_full_mode_stops_on_cached_answer(fakes):
+    fakes["cache"].answers[(COLLECTION, "Кто истец?")] = "ООО «Ромашка»"
+
+    nodes = run_nodes(new_graph(), "Кто истец?", "full", existing_collection=COLLECTION)
+
+    assert nodes == ["route_by_flag"]
+    assert fakes["rag"] == []
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("chromadb")
+
+import ingest_queue
+from ingest_queue import IngestScheduler
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ingest_queue, "download_case", lambda job: calls.append(job.collection_name))
+    monkeypatch.setattr(ingest_queue, "chroma_database", lambda pdf_directory, collection_name, progress: None)
+    return calls
+
+
+def test_submit_during_final_notification_starts_new_job(tmp_path, downloads):
+    async def run():
+        scheduler = IngestScheduler(max_concurrent=1, path=str(tmp_path / "queue.json"))
+        resubmitted = []
+
+        async def on_progress(job):
+            if job.status == "done" and not resubmitted:
+                resubmitted.append(scheduler.submit(job.collection_name, job.case_query, job.case_type))
+
+        first = await scheduler.run("case_a", "А40-1/2023", "Номер дела", on_progress=on_progress)
+        second = await resubmitted[0]
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first is not second
+    assert second.status == "done"
+    assert downloads == ["case_a", "case_a"]
+
+
+def test_concurrent_submits_share_one_job(tmp_path, downloads):
+    async def run():
+        scheduler = IngestScheduler(max_concurrent=1, path=str(tmp_path / "queue.json"))
+        return await asyncio.gather(*(scheduler.run("case_a", "А40-1/2023", "Номер дела") for _ in range(3)))
+
+    jobs = asyncio.run(run())
+
+    assert len({id(job) for job in jobs}) == 1
+    assert downloads == ["case_a"]
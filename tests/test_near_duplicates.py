@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+from near_duplicates import NearDuplicateIndex
+
+TEMPLATE = (
+    "Арбитражный суд города Москвы в составе судьи Иванова И. И., рассмотрев в открытом судебном "
+    "заседании дело № {case} по иску общества с ограниченной ответственностью «Ромашка» "
+    "(ИНН {inn}) к обществу с ограниченной ответственностью «Лютик» о взыскании задолженности "
+    "по договору поставки № {contract} от {date} в размере {amount} руб., установил: между "
+    "сторонами заключен договор поставки, истец поставил товар, ответчик оплату не произвел, "
+    "претензия истца оставлена без ответа, в связи с чем истец обратился в арбитражный суд "
+    "с настоящим иском. Суд, исследовав материалы дела, считает требования подлежащими удовлетворению."
+)
+BASE = {"case": "А40-312285/2023", "inn": "7707083893", "contract": "15/21",
+        "date": "12.03.2021", "amount": "1 250 000,00"}
+
+
+def decision(**changes):
+    return TEMPLATE.format(**{**BASE, **changes})
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = NearDuplicateIndex("chunks", path=str(tmp_path / "near_dup.sqlite"), threshold=0.9)
+    index.filter(["original"], [decision()])
+    return index
+
+
+def test_whitespace_variant_is_aliased(index):
+    keep, skipped = index.filter(["copy"], [decision().replace(" ", "  ").replace("установил:", "установил:\n")])
+
+    assert keep == []
+    assert skipped == {"copy": "original"}
+    assert index.canonical("copy") == "original"
+
+
+@pytest.mark.parametrize("changes", [
+    {"case": "А40-312286/2023"},
+    {"inn": "7736050003"},
+    {"contract": "16/21"},
+    {"date": "13.03.2021"},
+    {"amount": "1 350 000,00"},
+    {"amount": "1 350 000,00", "contract": "16/21"},
+])
+def test_other_identifiers_are_not_aliased(index, changes):
+    keep, skipped = index.filter(["other"], [decision(**changes)])
+
+    assert keep == [0]
+    assert skipped == {}
+    assert index.canonical("other") == "other"
+    assert len(index) == 2
+
+
+def test_latin_case_number_matches_cyrillic(index):
+    keep, skipped = index.filter(["latin"], [decision(case="A40-312285/2023")])
+
+    assert skipped == {"latin": "original"}
+
+
+def test_duplicates_within_one_batch(tmp_path):
+    index = NearDuplicateIndex("chunks", path=str(tmp_path / "near_dup.sqlite"), threshold=0.9)
+
+    keep, skipped = index.filter(["a", "b", "c"], [decision(), decision() + " ", decision(amount="99 000,00")])
+
+    assert keep == [0, 2]
+    assert skipped == {"b": "a"}
+
+
+def test_legacy_signatures_are_not_used_as_originals(tmp_path):
+    path = str(tmp_path / "near_dup.sqlite")
+    NearDuplicateIndex("chunks", path=path).filter(["original"], [decision()])
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE old AS SELECT collection, chunk_id, signature FROM signatures;
+        DROP TABLE signatures;
+        ALTER TABLE old RENAME TO signatures;
+        """
+    )
+    conn.close()
+
+    index = NearDuplicateIndex("chunks", path=path)
+    keep, skipped = index.filter(["copy"], [decision()])
+
+    assert keep == [0]
+    assert skipped == {}
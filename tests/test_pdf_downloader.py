@@ -0,0 +1,109 @@
+import functools
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+import pdf_downloader
+from pdf_downloader import download_pdfs
+
+PDF_BODY = b"%PDF-1.4\n" + b"0" * 2000 + b"\n%%EOF\n"
+HTML_BODY = "<html><body>Сессия устарела, обновите страницу</body></html>".encode("utf-8")
+MAX_BYTES = 4096
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # путь -> (Content-Type, тело, отдавать ли Content-Length)
+    routes = {
+        "/ok.pdf": ("application/pdf", PDF_BODY, True),
+        "/octet.pdf": ("application/octet-stream", PDF_BODY, True),
+        "/page.html": ("text/html; charset=utf-8", HTML_BODY, True),
+        "/html-as-pdf": ("application/pdf", HTML_BODY, True),
+        "/big.pdf": ("application/pdf", b"%PDF-1.4\n" + b"0" * (MAX_BYTES * 2), True),
+        "/big-chunked.pdf": ("application/pdf", b"%PDF-1.4\n" + b"0" * (MAX_BYTES * 2), False),
+    }
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path not in self.routes:
+            self.send_error(404)
+            return
+        content_type, body, with_length = self.routes[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if with_length:
+            self.send_header("Content-Length", str(len(body)))
+        else:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def small_max_bytes(monkeypatch):
+    # Предел размера по умолчанию - десятки мегабайт; в тестах хватает нескольких килобайт
+    monkeypatch.setattr(pdf_downloader, "download_pdf",
+                        functools.partial(pdf_downloader.download_pdf, max_bytes=MAX_BYTES))
+
+
+def _leftovers(directory):
+    return [name for name in os.listdir(directory) if name.startswith(".download_")]
+
+
+def test_downloads_pdf_and_renames_atomically(server, tmp_path):
+    results = download_pdfs([(f"{server}/ok.pdf", "a.pdf"), (f"{server}/octet.pdf", "b.pdf")], str(tmp_path))
+
+    assert results == {"a.pdf": None, "b.pdf": None}
+    assert (tmp_path / "a.pdf").read_bytes() == PDF_BODY
+    assert (tmp_path / "b.pdf").read_bytes() == PDF_BODY
+    assert _leftovers(tmp_path) == []
+
+
+@pytest.mark.parametrize("path, error", [
+    ("/page.html", "Content-Type"),
+    ("/html-as-pdf", "не является PDF"),
+    ("/big.pdf", "слишком большой"),
+    ("/big-chunked.pdf", "слишком большой"),
+])
+def test_rejects_non_pdf_and_oversize_responses(server, tmp_path, path, error):
+    results = download_pdfs([(f"{server}{path}", "a.pdf")], str(tmp_path))
+
+    assert error in results["a.pdf"]
+    assert not (tmp_path / "a.pdf").exists()
+    assert _leftovers(tmp_path) == []
+
+
+def test_failed_download_keeps_other_files(server, tmp_path):
+    results = download_pdfs([(f"{server}/ok.pdf", "a.pdf"), (f"{server}/page.html", "b.pdf")], str(tmp_path))
+
+    assert results["a.pdf"] is None
+    assert results["b.pdf"]
+    assert sorted(os.listdir(tmp_path)) == ["a.pdf"]
+
+
+def test_skips_existing_files(server, tmp_path):
+    (tmp_path / "a.pdf").write_bytes(b"%PDF-old")
+
+    results = download_pdfs([(f"{server}/ok.pdf", "a.pdf"), (f"{server}/octet.pdf", "b.pdf")], str(tmp_path))
+
+    assert results == {"b.pdf": None}
+    assert (tmp_path / "a.pdf").read_bytes() == b"%PDF-old"
+    assert _Handler.requests == ["/octet.pdf"]
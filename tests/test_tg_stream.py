@@ -0,0 +1,73 @@
+import asyncio
+import html
+import re
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from tg_stream import TelegramStreamWriter
+
+
+class FakeMessage:
+    def __init__(self, sent) -> None:
+        self.sent = sent
+        self.text = ""
+        sent.append(self)
+
+    async def edit_text(self, text, parse_mode=None):
+        self.text = text
+
+    async def reply_text(self, text):
+        message = FakeMessage(self.sent)
+        message.text = text
+        return message
+
+
+def render(text):
+    return re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', html.escape(text), flags=re.S)
+
+
+def stream(text, limit=100):
+    sent = []
+    writer = TelegramStreamWriter(FakeMessage(sent), render, interval=0, limit=limit)
+    asyncio.run(writer.finish(text))
+    return [message.text for message in sent]
+
+
+def test_long_unmarked_message_is_split_within_limit():
+    text = "А40-312285/2023" * 40
+
+    texts = stream(text)
+
+    assert len(texts) > 1
+    assert all(0 < len(part) <= 100 for part in texts)
+    assert "".join(texts) == text
+
+
+def test_split_prefers_word_boundary():
+    text = " ".join(["решение"] * 60)
+
+    texts = stream(text)
+
+    assert all(len(part) <= 100 for part in texts)
+    assert all(part.endswith(" ") for part in texts[:-1])
+    assert "".join(texts) == text
+
+
+def test_split_keeps_bold_pair_together():
+    text = "а" * 70 + " **Вердикт суда** " + "б" * 70
+
+    texts = stream(text)
+
+    assert all(len(part) <= 100 for part in texts)
+    assert any("<b>Вердикт суда</b>" in part for part in texts)
+
+
+def test_unclosed_bold_at_start_still_splits():
+    text = "**" + "в" * 300
+
+    texts = stream(text)
+
+    assert all(0 < len(part) <= 100 for part in texts)
+    assert "".join(html.unescape(part) for part in texts) == text
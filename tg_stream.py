@@ -0,0 +1,177 @@
+from telegram import Message
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+from typing import Callable, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+from metrics import histogram
+
+TELEGRAM_MESSAGE_LIMIT = 4000
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+# Не редактируем сообщение ради пары символов
+STREAM_MIN_DELTA = int(os.getenv("STREAM_MIN_DELTA", "20"))
+
+TIME_TO_FIRST_TOKEN = histogram(
+    "answer_time_to_first_token_seconds", "Время от вопроса до первого видимого фрагмента ответа"
+)
+
+
+class TelegramStreamWriter:
+    """Постепенно показывает ответ, редактируя одно сообщение не чаще раза в interval секунд.
+
+    Текст каждого сообщения рендерится целиком через render, поэтому HTML остается валидным
+    на любом промежуточном шаге. При превышении лимита Telegram ответ продолжается
+    в новом сообщении.
+    """
+
+    def __init__(self, message: Message, render: Callable[[str], str], started_at: Optional[float] = None,
+                 interval: float = STREAM_EDIT_INTERVAL, limit: int = TELEGRAM_MESSAGE_LIMIT) -> None:
+        self.render = render
+        self.interval = interval
+        self.limit = limit
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.first_token_seconds: Optional[float] = None
+        self._messages: List[Message] = [message]
+        self._done_text = ""  # Текст, уже закрепленный в предыдущих сообщениях
+        self._text = ""
+        self._shown = ""  # Что сейчас видно в последнем сообщении
+        self._last_edit = 0.0
+
+    async def push(self, token: str) -> None:
+        self._text += token
+        current = self._text[len(self._done_text):]
+        if time.monotonic() - self._last_edit < self.interval:
+            return
+        if len(current) - len(self._shown) < STREAM_MIN_DELTA and self._shown:
+            return
+        await self._flush(current)
+
+    async def finish(self, text: str) -> None:
+        """Показывает финальный ответ целиком (он может отличаться от потока, например обрезкой пробелов)."""
+        if not text.startswith(self._done_text):
+            # Закрепленные сообщения уже не изменить: досылаем остаток потокового текста
+            text = self._text
+        self._text = text
+        await self._flush(text[len(self._done_text):], final=True)
+
+    def _split_point(self, text: str) -> int:
+        """Наибольшая длина префикса, который после рендера влезает в лимит.
+
+        Предпочитает границу абзаца или слова и не разрывает пару ** **.
+        """
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if len(self.render(text[:middle])) <= self.limit:
+                low = middle
+            else:
+                high = middle - 1
+
+        cut = low
+        for separator in ("\n\n", "\n", " "):
+            position = text.rfind(separator, 0, low)
+            if position > low // 2:
+                cut = position + len(separator)
+                break
+        while cut > 0 and text[:cut].count("**") % 2:
+            cut = text.rfind("**", 0, cut)
+        # Пару ** не сохранить (rfind дал 0 или -1): режем по лимиту, но хотя бы на один символ
+        return cut if cut > 0 else max(low, 1)
+
+    async def _flush(self, current: str, final: bool = False) -> None:
+        while len(self.render(current)) > self.limit:
+            cut = self._split_point(current)
+            head, current = current[:cut], current[cut:]
+            await self._edit(head)
+            self._done_text += head
+            self._messages.append(await self._messages[-1].reply_text("…"))
+            self._shown = ""
+
+        if current and current != self._shown:
+            await self._edit(current)
+        elif final and not current and not self._shown:
+            await self._edit("…")
+
+    async def _edit(self, text: str) -> None:
+        message = self._messages[-1]
+        for _ in range(3):
+            try:
+                await message.edit_text(self.render(text), parse_mode=ParseMode.HTML)
+                break
+            except RetryAfter as e:
+                logging.warning(f"Telegram просит подождать {e.retry_after}s перед редактированием")
+                await asyncio.sleep(float(getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()))
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    break
+                raise
+
+        self._shown = text
+        self._last_edit = time.monotonic()
+        if self.first_token_seconds is None and text.strip():
+            self.first_token_seconds = time.perf_counter() - self.started_at
+            TIME_TO_FIRST_TOKEN.observe(self.first_token_seconds)
+            logging.info(f"Бот: первый фрагмент ответа показан через {self.first_token_seconds:.2f}s")
+
+
+class TelegramStatusMessage:
+    """Статус долгой операции в одном сообщении: правки не чаще раза в interval секунд и по порядку.
+
+    Из статусов, пришедших между правками, показывается только последний - по
+    истечении интервала или в finish. Ошибки Telegram только логируются: статус
+    не должен прерывать саму операцию.
+    """
+
+    def __init__(self, message: Message, interval: float = STREAM_EDIT_INTERVAL) -> None:
+        self.message = message
+        self.interval = interval
+        self._latest: Optional[str] = None
+        self._shown: Optional[str] = None
+        self._last_edit = 0.0
+        self._delayed: Optional[asyncio.Task] = None
+        # Правки идут по одной: более ранний статус не может перезаписать более поздний
+        self._lock = asyncio.Lock()
+
+    async def update(self, text: str) -> None:
+        self._latest = text
+        wait = self.interval - (time.monotonic() - self._last_edit)
+        if wait <= 0:
+            await self._flush()
+        elif self._delayed is None or self._delayed.done():
+            self._delayed = asyncio.get_running_loop().create_task(self._flush_later(wait))
+
+    async def finish(self) -> None:
+        """Показывает последний статус, даже если он пришел во время паузы между правками."""
+        if self._delayed is not None:
+            self._delayed.cancel()
+        await self._flush(final=True)
+
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self._flush()
+
+    async def _flush(self, final: bool = False) -> None:
+        async with self._lock:
+            for _ in range(3):
+                text = self._latest
+                if text is None or text == self._shown:
+                    return
+                self._last_edit = time.monotonic()
+                try:
+                    await self.message.edit_text(text)
+                    self._shown = text
+                    return
+                except RetryAfter as e:
+                    logging.warning(f"Telegram просит подождать {e.retry_after}s перед обновлением статуса")
+                    if not final:
+                        return
+                    await asyncio.sleep(float(getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()))
+                except BadRequest as e:
+                    if "not modified" in str(e).lower():
+                        self._shown = text
+                        return
+                    logging.warning(f"Не удалось обновить статус: {e}")
+                    return
@@ -0,0 +1,12 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    """Кодировка tiktoken gpt-4 для нарезки чанков и бюджета контекста; создается один раз на процесс."""
+    import tiktoken
+    return tiktoken.encoding_for_model("gpt-4")
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoder().encode(text, disallowed_special=()))
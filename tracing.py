@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import time
+import uuid
+
+from metrics import counter, histogram
+
+# Писать ли завершенные span в лог (логгер trace, одна строка key=value на span)
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"
+
+SPAN_SECONDS = histogram("span_seconds", "Длительность участков обработки запроса по имени span")
+SPAN_ERRORS = counter("span_errors_total", "Участки обработки, завершившиеся исключением")
+LLM_TOKENS = counter("llm_tokens_total", "Токены GigaChat по вызову и виду (prompt/completion)")
+
+_correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("correlation_id", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+logger = logging.getLogger("trace")
+
+
+@dataclass
+class Span:
+    name: str
+    correlation_id: str
+    span_id: str
+    parent_id: Optional[str]
+    attributes: Dict[str, object] = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def get_correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+def set_correlation_id(correlation_id: str) -> None:
+    """Привязывает id к текущему контексту: задаче asyncio или потоку.
+
+    Задачи и run_blocking копируют контекст, поэтому id доходит до всех вложенных span.
+    """
+    _correlation_id.set(correlation_id)
+
+
+def _start(name: str, attributes: Dict[str, object]) -> Span:
+    parent = _current_span.get()
+    return Span(
+        name=name,
+        correlation_id=_correlation_id.get() or new_correlation_id(),
+        span_id=uuid.uuid4().hex[:8],
+        parent_id=parent.span_id if parent else None,
+        attributes=attributes,
+    )
+
+
+def _finish(current: Span, seconds: float, status: str) -> None:
+    SPAN_SECONDS.observe(seconds, span=current.name)
+    if status != "ok":
+        SPAN_ERRORS.inc(span=current.name)
+    if TRACE_LOG:
+        attributes = "".join(f" {key}={value}" for key, value in current.attributes.items())
+        logger.info(
+            f"trace cid={current.correlation_id} span={current.name} id={current.span_id} "
+            f"parent={current.parent_id or '-'} duration_ms={seconds * 1000:.1f} status={status}{attributes}"
+        )
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Участок обработки запроса: длительность в гистограмму span_seconds и строка в лог trace.
+
+    Span без correlation id в контексте (консоль, фоновые задачи) начинает свою трассу.
+    Атрибуты, известные только в конце (число токенов, найденных документов), задаются через set.
+    """
+    current = _start(name, attributes)
+    span_token = _current_span.set(current)
+    correlation_token = _correlation_id.set(current.correlation_id)
+    status = "ok"
+    try:
+        yield current
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _correlation_id.reset(correlation_token)
+        _current_span.reset(span_token)
+        _finish(current, time.perf_counter() - current.started, status)
+
+
+def record_span(name: str, seconds: float, status: str = "ok", **attributes) -> None:
+    """Завершенный участок, замеренный вызывающим: для генераторов и задач в пуле процессов,
+    где span нельзя держать открытым в контексте.
+    """
+    _finish(_start(name, attributes), seconds, status)
+
+
+def traced(name: str):
+    """Декоратор: вызов функции (обычной или async) целиком - один span."""
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_usage(call: str, message, current: Optional[Span] = None) -> None:
+    """Токены ответа модели: usage_metadata LangChain или token_usage из метаданных GigaChat."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens")
+    completion_tokens = usage.get("output_tokens")
+    if prompt_tokens is None:
+        token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+        prompt_tokens = token_usage.get("prompt_tokens")
+        completion_tokens = token_usage.get("completion_tokens")
+    if prompt_tokens is None and completion_tokens is None:
+        return
+
+    LLM_TOKENS.inc(prompt_tokens or 0, call=call, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens or 0, call=call, kind="completion")
+    if current is not None:
+        current.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
@@ -1,18 +1,33 @@
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
-from typing import List
-from pdf_chunker import load_docs
-from embedder import embedder
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+from pdf_chunker import PDF_CHUNKER, iter_docs, list_pdfs
+from chroma_registry import get_registry
+from answer_cache import get_answer_cache
+from case_classifier import CaseType, classify
+from ingest_manifest import IngestManifest, file_sha256
+from lexical_index import get_lexical_index
+from tracing import span
+from embedding_pipeline import CHROMA_WRITE_BATCH, EmbeddingPipeline, get_limiter
+from chunk_store import CHUNK_STORE_COLLECTION, get_chunk_store, view_key
+from near_duplicates import NEAR_DUP_THRESHOLD, get_near_duplicate_index
+from metrics import counter
 import os
 from dotenv import load_dotenv
 import logging
 import hashlib
-import time
 import re
 
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Сколько чанков из потока pdf_chunker накапливать перед загрузкой в коллекцию
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+
+NEAR_DUPLICATE_CHUNKS = counter("near_duplicate_chunks_total", "Чанки-почти-дубликаты, для которых не считались эмбеддинги")
+
 
 def generate_id(text: str) -> str:
     """Генерируем ID для документа на основе его содержимого."""
@@ -44,18 +59,53 @@ def normalize_collection_name(name: str) -> str:
     return normalized
 
 
-def load_to_collection(docs: List[Document], collection_name: str) -> Chroma:
-    """Загружает документы в конкретную коллекцию Chroma."""
-    logging.info(f'Запуск функции load_to_collection для коллекции: {collection_name}')
-    embedder_func = embedder()
-    
-    # Создаем или открываем коллекцию
-    vec_db = Chroma(
-        collection_name=collection_name,
-        persist_directory="./chroma_db",
-        embedding_function=embedder_func
-    )
-    
+def _mark_members(vec_db: "Chroma", view: str, ids: List[str], member: bool = True) -> None:
+    """Ставит (или снимает) флаг представления в метаданных чанков, уже лежащих в хранилище."""
+    # None удаляет ключ из метаданных чанка, остальные ключи Chroma при update сохраняет
+    metadata = {view_key(view): True if member else None}
+    for i in range(0, len(ids), CHROMA_WRITE_BATCH):
+        part = ids[i:i + CHROMA_WRITE_BATCH]
+        with span("chroma.update", ids=len(part)):
+            vec_db._collection.update(ids=part, metadatas=[metadata] * len(part))
+
+
+def _index_members(vec_db: "Chroma", view: str, ids: List[str], texts_by_id: Dict[str, str],
+                   save_index: bool) -> None:
+    """Добавляет новые чанки представления в его лексический индекс и сбрасывает кэш ответов."""
+    if not ids:
+        return
+    missing = [id_ for id_ in ids if id_ not in texts_by_id]
+    if missing:
+        # Тексты чанков, уже лежащих в хранилище, берем оттуда, без повторного разбора PDF
+        with span("chroma.get", ids=len(missing)):
+            result = vec_db._collection.get(ids=missing, include=["documents"])
+        texts_by_id = dict(texts_by_id, **dict(zip(result["ids"], result["documents"])))
+    lexical_index = get_lexical_index(view)
+    lexical_index.add(ids, [texts_by_id.get(id_, "") for id_ in ids])
+    if save_index:
+        lexical_index.save()
+    # Новые документы могут изменить ответы на уже заданные вопросы
+    get_answer_cache().invalidate(view)
+
+
+def load_to_collection(docs: List[Document], collection_name: str, save_index: bool = True) -> "Chroma":
+    """Загружает документы в общее хранилище чанков и включает их в представление collection_name.
+
+    Чанк, который уже есть в хранилище (загружен для другого дела, ИНН или
+    организации) или почти повторяет хранящийся, не эмбеддится повторно -
+    представление только получает на него ссылку. Возвращает общую коллекцию.
+
+    save_index=False откладывает запись индексов на диск (при загрузке порциями
+    их сохраняет вызывающий в конце).
+    """
+    logging.info(f'Запуск функции load_to_collection для представления: {collection_name}')
+    registry = get_registry()
+    embedder_func = registry.embedder
+    store = get_chunk_store()
+
+    # Все представления живут в одной коллекции Chroma
+    vec_db = registry.get(CHUNK_STORE_COLLECTION)
+
     if docs:
         ids = [generate_id(doc.page_content) for doc in docs]
         id_to_doc = {}
@@ -63,83 +113,253 @@ def load_to_collection(docs: List[Document], collection_name: str) -> Chroma:
             if id_ not in id_to_doc:
                 id_to_doc[id_] = doc
         unique_ids = list(id_to_doc.keys())
+        texts_by_id = {id_: doc.page_content for id_, doc in id_to_doc.items()}
+
+        # Под замком хранилища чанки, на которые сошлется представление, не удалит параллельная уборка
+        with store.lock:
+            # Проверяем существующие документы в хранилище
+            try:
+                with span("chroma.get", ids=len(unique_ids)):
+                    res = vec_db.get(ids=unique_ids)
+                existing_ids = set(res.get('ids', []) or [])
+            except Exception:
+                existing_ids = set()
+
+            new_docs = []
+            new_ids = []
+            for id_, doc in id_to_doc.items():
+                if id_ in existing_ids:
+                    continue
+                new_docs.append(doc)
+                new_ids.append(id_)
+
+            # Почти-дубликаты (тот же акт в другом файле, резолютивная часть отдельно) не эмбеддим.
+            # Оригинал ищется только среди чанков этого же представления: чужое дело не должно
+            # попасть в ответы по текущему даже при ложном срабатывании
+            near_duplicates = get_near_duplicate_index(collection_name)
+            skipped: Dict[str, str] = {}
+            if new_docs and NEAR_DUP_THRESHOLD > 0:
+                keep, skipped = near_duplicates.filter(new_ids, [doc.page_content for doc in new_docs])
+                if skipped:
+                    new_docs = [new_docs[i] for i in keep]
+                    new_ids = [new_ids[i] for i in keep]
+                    NEAR_DUPLICATE_CHUNKS.inc(len(skipped))
+                    logging.info(f'Представление {collection_name}: пропущено {len(skipped)} эмбеддингов '
+                                 f'почти-дубликатов (порог сходства {NEAR_DUP_THRESHOLD})')
+                    # Текст оригинала для лексического индекса _index_members возьмет из хранилища:
+                    # текст копии отличается от него и исказил бы BM25
+
+            # Уже хранящиеся чанки (свои или оригиналы копий) только получают ссылку из представления
+            new_set = set(new_ids)
+            stored_ids = [id_ for id_ in unique_ids if id_ in existing_ids]
+            stored_ids = list(dict.fromkeys(stored_ids + [id_ for id_ in skipped.values() if id_ not in new_set]))
+            added = store.add_members(collection_name, stored_ids + new_ids)
+            added_set = set(added)
+            shared = [id_ for id_ in stored_ids if id_ in added_set]
+            if shared:
+                _mark_members(vec_db, collection_name, shared)
+                # Чанки из хранилища с тем же текстом тоже могут стать оригиналами для копий этого представления
+                own = [id_ for id_ in shared if id_ in texts_by_id]
+                near_duplicates.add(own, [texts_by_id[id_] for id_ in own])
+                logging.info(f'Представление {collection_name}: {len(shared)} чанков уже были в хранилище, '
+                             f'эмбеддинги не считались')
 
-        # Проверяем существующие документы в коллекции
-        try:
-            res = vec_db.get(ids=unique_ids)
-            existing_ids = set(res.get('ids', []) or [])
-        except Exception:
-            existing_ids = set()
-
-        new_docs = []
-        new_ids = []
-        for id_, doc in id_to_doc.items():
-            if id_ in existing_ids:
-                continue
-            new_docs.append(doc)
-            new_ids.append(id_)
-            
         if new_docs:
-            logging.info(f'Добавляю {len(new_docs)} новых документов в коллекцию {collection_name}...')
-            batch_size = 50
-            for i in range(0, len(new_docs), batch_size):
-                chunk_docs = new_docs[i:i+batch_size]
-                chunk_ids = new_ids[i:i+batch_size]
-                retries = 3
-                for attempt in range(1, retries + 1):
-                    try:
-                        vec_db.add_documents(chunk_docs, ids=chunk_ids)
-                        break
-                    except Exception as e:
-                        if attempt == retries:
-                            logging.error(f'Не удалось добавить документы в коллекцию {collection_name} после {retries} попыток: {e}')
-                            raise
-                        sleep_s = 1.5 * attempt
-                        logging.warning(f'Ошибка добавления батча документов в {collection_name} (попытка {attempt}/{retries}): {e}. Повтор через {sleep_s:.1f}s')
-                        time.sleep(sleep_s)
+            logging.info(f'Добавляю {len(new_docs)} новых документов в хранилище для {collection_name}...')
+            flagged = [
+                Document(page_content=doc.page_content, metadata=dict(doc.metadata, **{view_key(collection_name): True}))
+                for doc in new_docs
+            ]
+            report = EmbeddingPipeline(embedder_func, limiter=get_limiter()).add(vec_db, new_ids, flagged)
+            logging.info(f'Представление {collection_name}: {report.chunks} чанков в {report.batches} батчах за '
+                         f'{report.seconds:.1f}s ({report.chunks_per_second:.1f} чанков/с), повторов {report.retries}, '
+                         f'из них из-за перегрузки API {report.throttled}; предел батчей в полете {report.final_in_flight:.1f}')
+            stats = embedder_func.stats()
+            logging.info(f'Кэш эмбеддингов: попаданий {stats["hits"]}, промахов {stats["misses"]} '
+                         f'(доля попаданий {stats["hit_ratio"]:.0%})')
+        if added:
+            _index_members(vec_db, collection_name, added, texts_by_id, save_index)
         else:
-            logging.info(f'Нет новых документов для добавления в коллекцию {collection_name}.')
-    
+            logging.info(f'Нет новых документов для добавления в представление {collection_name}.')
+
     return vec_db
 
 
-def get_collection_for_case(case_input: str) -> str:
-    """Определяет имя коллекции на основе ввода пользователя."""
-    # Нормализуем ввод
+def legacy_collection_name(case_input: str) -> str:
+    """Имя коллекции по правилам до классификатора ввода (case_classifier).
+
+    Под такими именами лежат дела, загруженные раньше: номер дела брался как
+    есть (латинская «A» давала другое имя, чем кириллическая), ОГРН попадал в ORG_.
+    """
     case_input = case_input.strip().upper()
-    
-    # Определяем тип ввода
-    if re.match(r'^\d{10}$', case_input):  # ИНН (10 цифр)
-        return normalize_collection_name(f"INN_{case_input}")
-    elif re.match(r'^\d{12}$', case_input):  # ИНН (12 цифр)
+    if re.match(r'^\d{10}$', case_input) or re.match(r'^\d{12}$', case_input):
         return normalize_collection_name(f"INN_{case_input}")
-    elif re.match(r'^[АA]\d+-\d+', case_input):  # Номер дела (А40-123456)
+    elif re.match(r'^[АA]\d+-\d+', case_input):
         return normalize_collection_name(case_input)
     else:
-        # Организация или другой тип - используем как есть
         return normalize_collection_name(f"ORG_{case_input}")
 
 
-def chroma_database(pdf_directory: str, collection_name: str) -> Chroma:
-    """Создает или открывает коллекцию Chroma для конкретного дела."""
-    logging.info(f'Запуск chroma_database для директории: {pdf_directory}, коллекция: {collection_name}')
+def _collection_name(case_input: str) -> str:
+    classification = classify(case_input)
+    
+    # Определяем тип ввода
+    if classification.case_type == CaseType.INN:  # ИНН (10 или 12 цифр)
+        return normalize_collection_name(f"INN_{classification.normalized}")
+    elif classification.case_type == CaseType.OGRN:  # ОГРН / ОГРНИП
+        return normalize_collection_name(f"OGRN_{classification.normalized}")
+    elif classification.case_type == CaseType.CASE_NUMBER:  # Номер дела (А40-123456)
+        return normalize_collection_name(classification.normalized)
+    else:
+        # Организация или другой тип - используем как есть
+        return normalize_collection_name(f"ORG_{case_input.strip().upper()}")
+
+
+def get_collection_for_case(case_input: str) -> str:
+    """Определяет имя коллекции на основе ввода пользователя.
+
+    Если под новым именем ничего не загружено, а под прежним (legacy_collection_name)
+    есть чанки, возвращается прежнее имя, чтобы ранее загруженное дело не потерялось.
+    """
+    collection_name = _collection_name(case_input)
+    legacy_name = legacy_collection_name(case_input)
+    if legacy_name != collection_name:
+        store = get_chunk_store()
+        if store.count(collection_name) == 0 and store.count(legacy_name) > 0:
+            logging.info(f'Для ввода {case_input!r} используется прежняя коллекция {legacy_name} '
+                         f'вместо {collection_name}')
+            return legacy_name
+    return collection_name
+
+
+def chroma_database(pdf_directory: str, collection_name: str,
+                    progress: Optional[Callable[[int, int], None]] = None) -> "Chroma":
+    """Загружает PDF дела в общее хранилище чанков и обновляет представление collection_name.
+
+    PDF, который уже разбирался для другого представления (тот же sha256 и режим
+    нарезки), не разбирается повторно: представление ссылается на его чанки.
+    progress, если передан, вызывается с числом обработанных и всех новых файлов.
+    """
+    logging.info(f'Запуск chroma_database для директории: {pdf_directory}, представление: {collection_name}')
     
     # Создаем директорию если не существует
     os.makedirs("./chroma_db", exist_ok=True)
+    store = get_chunk_store()
     
-    documents = load_docs(pdf_directory)
-    logging.info(f'Закончил работу с обработкой чанков... Приступаю к загрузке в коллекцию {collection_name}...')
-    
-    vectorstorage = load_to_collection(docs=documents, collection_name=collection_name)
+    manifest = IngestManifest(collection_name)
+    changed, removed = manifest.plan(list_pdfs(pdf_directory))
+    logging.info(f'Манифест {collection_name}: новых или измененных файлов {len(changed)}, удаленных {len(removed)}')
+
+    # Чанки, которые ссылались на измененные и удаленные файлы до переиндексации
+    previous_ids = manifest.chunk_ids_of([os.path.basename(path) for path in changed] + removed)
+
+    file_keys = {path: f"{file_sha256(path)}:{PDF_CHUNKER}" for path in changed}
+    ids_by_source: Dict[str, List[str]] = {}
+    to_parse = []
+    attached: List[str] = []
+    vec_db = get_registry().get(CHUNK_STORE_COLLECTION)
+    # Поиск разобранных файлов и ссылка на их чанки - под одним замком: иначе параллельная
+    # уборка другого представления может удалить чанки между ними
+    with store.lock:
+        for path in changed:
+            known_ids = store.file_chunks(file_keys[path])
+            if known_ids is not None:
+                unique_ids = list(dict.fromkeys(known_ids))
+                with span("chroma.get", ids=len(unique_ids)):
+                    stored = vec_db._collection.get(ids=unique_ids, include=[])["ids"]
+                if len(stored) < len(unique_ids):
+                    logging.warning(f'Представление {collection_name}: части чанков {os.path.basename(path)} '
+                                    f'нет в хранилище, файл будет разобран заново')
+                    known_ids = None
+            if known_ids is None:
+                to_parse.append(path)
+                ids_by_source[path] = []
+            else:
+                ids_by_source[path] = known_ids
+        reused = [path for path in changed if path not in to_parse]
+        if reused:
+            logging.info(f'Представление {collection_name}: {len(reused)} PDF уже разобраны для других дел, '
+                         f'беру их чанки из хранилища')
+            attached = store.add_members(collection_name, [id_ for path in reused for id_ in ids_by_source[path]])
+            if attached:
+                _mark_members(vec_db, collection_name, attached)
+    _index_members(vec_db, collection_name, attached, {}, save_index=False)
+
+    # Чанки приходят потоком из пула процессов и загружаются порциями,
+    # поэтому весь корпус не держится в памяти целиком
+    vectorstorage = None
+    batch: List[Document] = []
+    current_source, files_done = None, len(reused)
+    for doc in iter_docs(to_parse):
+        if doc.metadata["source"] != current_source:
+            # iter_docs отдает чанки в порядке файлов: смена источника значит, что предыдущий файл разобран
+            if current_source is not None:
+                files_done += 1
+            current_source = doc.metadata["source"]
+            if progress is not None:
+                progress(files_done, len(changed))
+        ids_by_source.setdefault(doc.metadata["source"], []).append(generate_id(doc.page_content))
+        batch.append(doc)
+        if len(batch) >= INGEST_BATCH_SIZE:
+            vectorstorage = load_to_collection(docs=batch, collection_name=collection_name, save_index=False)
+            batch = []
+    if batch or vectorstorage is None:
+        vectorstorage = load_to_collection(docs=batch, collection_name=collection_name, save_index=False)
+
+    if progress is not None:
+        progress(len(changed), len(changed))
+
+    # Копия ссылается на чанк-оригинал: он остается в хранилище, пока жив хотя бы один из файлов
+    near_duplicates = get_near_duplicate_index(collection_name)
+    duplicate_files = []
+    for path, chunk_ids in ids_by_source.items():
+        canonical_ids = [near_duplicates.canonical(chunk_id) for chunk_id in chunk_ids]
+        if path in to_parse:
+            if chunk_ids and all(canonical != chunk_id for canonical, chunk_id in zip(canonical_ids, chunk_ids)):
+                duplicate_files.append(os.path.basename(path))
+            # Файл с копиями другие представления разбирают сами: оригиналы копий - чанки этого представления
+            if path in file_keys and canonical_ids == chunk_ids:
+                store.record_file(file_keys[path], canonical_ids)
+        manifest.record(path, canonical_ids)
+    if duplicate_files:
+        logging.info(f'Представление {collection_name}: {len(duplicate_files)} документов целиком повторяют '
+                     f'уже загруженные: {", ".join(duplicate_files)}')
+    for name in removed:
+        manifest.forget(name)
+
+    # Из представления убираем чанки, на которые больше не ссылается ни один его файл;
+    # из хранилища удаляем только те, на которые не ссылается ни одно представление
+    stale_ids = list(previous_ids - manifest.referenced_chunk_ids())
+    if stale_ids:
+        with store.lock:
+            orphaned = store.remove_members(collection_name, stale_ids)
+            orphaned_set = set(orphaned)
+            _mark_members(vectorstorage, collection_name, [id_ for id_ in stale_ids if id_ not in orphaned_set],
+                          member=False)
+            near_duplicates.remove(stale_ids)
+            if orphaned:
+                vectorstorage.delete(ids=orphaned)
+                store.forget_chunks(orphaned)
+        logging.info(f'Представление {collection_name}: убрано {len(stale_ids)} устаревших чанков, '
+                     f'из хранилища удалено {len(orphaned)}')
+        get_lexical_index(collection_name).remove(stale_ids)
+        get_answer_cache().invalidate(collection_name)
+
+    get_lexical_index(collection_name).save()
+    manifest.save()
+    logging.info(f'Закончил загрузку чанков в представление {collection_name}')
     return vectorstorage
 
 
-def get_existing_collection(collection_name: str) -> Chroma:
-    """Открывает существующую коллекцию без загрузки новых документов."""
-    embedder_func = embedder()
-    return Chroma(
-        collection_name=collection_name,
-        persist_directory="./chroma_db",
-        embedding_function=embedder_func
-    )
+def get_existing_collection(collection_name: str) -> "Chroma":
+    """Открывает общую коллекцию чанков без загрузки новых документов.
+
+    Чанки представления collection_name выбираются фильтром chunk_store.view_filter.
+    """
+    return get_registry().get(CHUNK_STORE_COLLECTION)
+
+
+def count_documents(collection_name: str) -> int:
+    """Число чанков в представлении по таблице принадлежности, без выгрузки id и текстов."""
+    return get_chunk_store().count(collection_name)
 
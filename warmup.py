@@ -0,0 +1,60 @@
+from typing import Dict, List, Optional
+import logging
+import os
+import time
+
+from ingest_manifest import MANIFEST_DIR
+
+WARMUP = os.getenv("WARMUP", "0") == "1"
+# Коллекции, которые всегда прогреваются, через запятую
+WARMUP_COLLECTIONS = [name.strip() for name in os.getenv("WARMUP_COLLECTIONS", "").split(",") if name.strip()]
+# Сколько последних загруженных коллекций прогревать дополнительно
+WARMUP_TOP_COLLECTIONS = int(os.getenv("WARMUP_TOP_COLLECTIONS", "5"))
+
+
+def recent_collections(limit: int = WARMUP_TOP_COLLECTIONS) -> List[str]:
+    """Коллекции с самыми свежими манифестами загрузки."""
+    if limit <= 0 or not os.path.isdir(MANIFEST_DIR):
+        return []
+    manifests = [
+        os.path.join(MANIFEST_DIR, name) for name in os.listdir(MANIFEST_DIR) if name.endswith(".json")
+    ]
+    manifests.sort(key=os.path.getmtime, reverse=True)
+    return [os.path.splitext(os.path.basename(path))[0] for path in manifests[:limit]]
+
+
+def warm_up(collections: Optional[List[str]] = None) -> Dict[str, float]:
+    """Заранее загружает то, что иначе загрузилось бы на первом запросе: кодировку
+    tiktoken, клиент Chroma, эмбеддер и лексические индексы горячих коллекций.
+
+    Возвращает длительность каждого шага в секундах.
+    """
+    timings: Dict[str, float] = {}
+
+    def step(name: str, function) -> None:
+        started = time.perf_counter()
+        try:
+            function()
+        except Exception as e:
+            logging.warning(f"Прогрев: шаг {name} не удался: {e}")
+        timings[name] = time.perf_counter() - started
+
+    from tokenizer import get_encoder
+    from chroma_registry import get_registry
+    from retrieval import get_engine
+
+    registry = get_registry()
+    step("tokenizer", get_encoder)
+    step("chroma_client", lambda: registry.client)
+    step("embedder", lambda: registry.embedder)
+
+    if collections is None:
+        collections = list(dict.fromkeys(WARMUP_COLLECTIONS + recent_collections()))
+    engine = get_engine()
+    for collection_name in collections:
+        step(f"collection:{collection_name}", lambda name=collection_name: engine.warm(name))
+
+    logging.info(
+        "Прогрев завершен: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    )
+    return timings